@@ -4,45 +4,268 @@ AI-powered assistant. Users upload a spreadsheet, ask questions in plain
 English, and receive answers generated by Cohere’s Command-R model.
 """
 from dotenv import load_dotenv
+
 load_dotenv()  # reads .env and sets os.environ
 
-import os
-import uuid
-import json
 import logging
+import os
 import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from zipfile import BadZipFile
 
-import pandas as pd
 import markdown2
-import cohere
+import pandas as pd
 from flask import (
-    Flask, flash, redirect, render_template,
-    request, session, url_for
+    Flask,
+    Response,
+    before_render_template,
+    flash,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+    url_for,
 )
-from openpyxl import load_workbook
 from werkzeug.exceptions import RequestEntityTooLarge
 
+from answers import ANSWER_CACHE
+from cache import BoundedCache
+from formula_index import (
+    FormulaIndex,
+    SheetGrid,
+    describe_cell,
+    find_cell_reference,
+    format_value,
+    qualified,
+    split_cell,
+)
+from grid import GridQuery, row_order, sheet_window
+from ingest import LazyWorkbook, load_sheet, parse_workbook
+from jobs import (
+    IO_POOL,
+    JobStore,
+    ingest_and_profile,
+    restore_workbook,
+    run_in_process,
+)
+from llm import LLM_MAX_CONCURRENCY, get_llm
+from profiling import process_dataframe
+from prompts import assemble_prompt
+from queries import LOCAL_ANSWERS
+from recalc import RecalcEngine, WhatIf, parse_what_if, run_what_if
+from store import (
+    CACHE_TTL_SECONDS,
+    FORMULA_STORE,
+    PROFILE_STORE,
+    VIEW_STORE,
+    WORKBOOK_STORE,
+    content_hash,
+    create_upload_store,
+)
+from streaming import (
+    LARGE_UPLOAD_MAX_BYTES,
+    MemoryLimitExceeded,
+    SpooledUpload,
+    close_large_workbook,
+    open_large_workbook,
+    resident_bytes,
+    spool_upload,
+)
+from telemetry import (
+    PROMPT_TOKENS,
+    REGISTRY,
+    carry_context,
+    finish_request,
+    install_log_records,
+    record_span,
+    render_metrics,
+    span,
+    start_request,
+)
+
 # ─────────────────────────────── Flask setup ─────────────────────────────── #
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_API_KEY", "dev-secret")
 
-# Accept only Excel files up to 5 MB
-app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024
+# Excel files up to 5 MB are parsed in memory; larger .xlsx uploads (up to
+# LARGE_UPLOAD_MAX_MB, 0 = off) are spooled to disk and streamed – streaming.py.
+# Every request is held to the in-memory cap; only uploads headed for the
+# streaming path get the larger one (see `upload`).
+INLINE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+STREAM_UPLOAD_MAX_BYTES = max(INLINE_UPLOAD_MAX_BYTES, LARGE_UPLOAD_MAX_BYTES)
+app.config["MAX_CONTENT_LENGTH"] = INLINE_UPLOAD_MAX_BYTES
 ALLOWED_EXTENSIONS = {".xls", ".xlsx"}
 
-# Rotating cache (keyed by UUID stored in the session)
-UPLOAD_CACHE: dict[str, dict] = {}
+# Rotating cache (keyed by UUID stored in the session). Entries only point at
+# the shared, content-addressed workbook via its file hash – see store.py.
+UPLOAD_CACHE = BoundedCache(
+    max_entries=int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", 10_000)),
+    ttl=CACHE_TTL_SECONDS,
+)
+
+# Where sessions + parsed workbooks live: this process ("memory", default) or
+# a directory shared by every gunicorn worker ("disk") – set UPLOAD_STORE.
+UPLOAD_STORE = create_upload_store(UPLOAD_CACHE)
+
+# Only the first sheet is parsed during /upload; the next few tabs are loaded
+# and profiled in the background so /switch-sheet is usually instant, and the
+# whole-workbook formula index is built right after them.
+SHEET_PREFETCH = int(os.getenv("SHEET_PREFETCH", 3))
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheet-prefetch")
+
+# Stream answers token-by-token over SSE (set STREAM_ANSWERS=0 for the
+# classic render-when-complete flow). Profiling runs on its own pool so it
+# overlaps with the first bytes of the response.
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") == "1"
+PROFILE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="profile")
+_PROFILES_IN_FLIGHT: dict[tuple[str, str], Future] = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+# Background uploads: /upload answers 202 + a job id straight away and the
+# parse → profile → LLM pipeline runs off the request thread (see jobs.py).
+# Enable for everyone with ASYNC_UPLOADS=1, or per request with async=1.
+ASYNC_UPLOADS = os.getenv("ASYNC_UPLOADS", "0") == "1"
+JOBS = JobStore()
+
+# Aggregate / filter / group-by questions the sheet can answer exactly
+# ("total revenue in 2023") are computed with pandas instead of asking the
+# LLM – see queries.py. Set LOCAL_ANSWERS=0 to send everything to the model.
+USE_LOCAL_ANSWERS = os.getenv("LOCAL_ANSWERS", "1") == "1"
+
+# Batch Q&A (POST /ask/batch): a checklist of questions against one upload.
+# Each sheet is profiled once and the questions run side by side on
+# BATCH_POOL – sized to the LLM client's slots, so queued questions wait for
+# a free thread rather than timing out on the client's queue.
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", LLM_MAX_CONCURRENCY))
+BATCH_POOL = ThreadPoolExecutor(
+    max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch"
+)
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+    format="%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s"
 )
 
+# ──────────────────────────────── Telemetry ──────────────────────────────── #
+#
+# Each request gets an ID (the caller's X-Request-ID, or a new one) that is
+# stamped on every log line – including those of pool jobs it starts – and
+# echoed in the response. Stage timings, cache sizes and LLM latency are
+# exported at /metrics in the Prometheus text format (see telemetry.py).
+
+install_log_records()
+
+CACHES = {
+    "uploads": UPLOAD_CACHE,
+    "workbooks": WORKBOOK_STORE,
+    "profiles": PROFILE_STORE,
+    "formulas": FORMULA_STORE,
+    "views": VIEW_STORE,
+    "answers": ANSWER_CACHE.answers,
+}
+
+
+def _cache_stat(field: str):
+    return lambda: [
+        ({"cache": name}, cache.stats()[field]) for name, cache in CACHES.items()
+    ]
+
+
+REGISTRY.callback(
+    "docubridge_upload_cache_entries", "Sessions held in UPLOAD_CACHE",
+    lambda: UPLOAD_CACHE.stats()["entries"],
+)
+REGISTRY.callback(
+    "docubridge_upload_cache_bytes", "Approximate bytes held in UPLOAD_CACHE",
+    lambda: UPLOAD_CACHE.stats()["bytes"],
+)
+REGISTRY.callback(
+    "docubridge_cache_entries", "Entries per bounded cache", _cache_stat("entries")
+)
+REGISTRY.callback(
+    "docubridge_cache_bytes", "Approximate bytes per bounded cache",
+    _cache_stat("bytes"),
+)
+REGISTRY.callback(
+    "docubridge_cache_hits_total", "Cache hits", _cache_stat("hits"), "counter"
+)
+REGISTRY.callback(
+    "docubridge_cache_misses_total", "Cache misses", _cache_stat("misses"), "counter"
+)
+REGISTRY.callback(
+    "docubridge_cache_evictions_total", "Entries evicted to stay within budget",
+    _cache_stat("evictions"), "counter",
+)
+REGISTRY.callback(
+    "docubridge_answers_coalesced_total",
+    "Questions that waited on an identical in-flight LLM call",
+    lambda: ANSWER_CACHE.stats()["coalesced"], "counter",
+)
+REGISTRY.callback(
+    "docubridge_local_answers_total",
+    "Questions answered with pandas vs. passed to the LLM",
+    lambda: [({"outcome": k}, v) for k, v in LOCAL_ANSWERS.stats().items()],
+    "counter",
+)
+REGISTRY.callback(
+    "docubridge_profiles_in_flight", "Sheet profiles being computed",
+    lambda: len(_PROFILES_IN_FLIGHT),
+)
+REGISTRY.callback(
+    "docubridge_process_resident_bytes", "Resident memory of this worker",
+    resident_bytes,
+)
+
+
+@app.before_request
+def begin_trace() -> None:
+    g.trace = start_request(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+def end_trace(response: Response) -> Response:
+    """Tag the response with its request ID; log + record it once fully sent."""
+    trace = g.pop("trace", None)
+    if trace is None:
+        return response
+    response.headers["X-Request-ID"] = trace.request_id
+    endpoint = request.endpoint or "unmatched"
+    args = (request.method, endpoint, request.path, response.status_code)
+    quiet = request.endpoint == "metrics"
+    if response.is_streamed:  # SSE – the stages run while the body is sent
+        response.call_on_close(lambda: finish_request(trace, *args, quiet=quiet))
+    else:
+        finish_request(trace, *args, quiet=quiet)
+    return response
+
+
+@before_render_template.connect_via(app)
+def _template_started(_sender, **_) -> None:
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _template_finished(_sender, **_) -> None:
+    started = g.pop("render_started", None)
+    if started is not None:
+        record_span("render", time.perf_counter() - started)
+
 # ──────────────────────────────── Helpers ────────────────────────────────── #
 
-ERROR_TOKENS = {"#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?", "#NUM!"}
+
+def render_markdown(text: str) -> str:
+    """Answer markdown → HTML (timed as the "markdown" stage)."""
+    with span("markdown"):
+        return markdown2.markdown(text)
 
 
 def allowed_file(filename: str) -> bool:
@@ -50,100 +273,415 @@ def allowed_file(filename: str) -> bool:
     return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def process_dataframe(df: pd.DataFrame) -> dict:
+def prefetch_sheets(file_hash: str, wb: LazyWorkbook, names: list[str]) -> None:
+    """Background job: load + profile upcoming tabs before they are opened."""
+    for name in names:
+        try:
+            sheet_profile(file_hash, name, load_sheet(wb, name), wb.type_report(name))
+        except ValueError as exc:
+            logging.warning("Prefetch of sheet %s failed – %s", name, exc)
+    UPLOAD_STORE.put_workbook(file_hash, wb)  # re-account size / share to disk
+
+
+def formula_index(file_hash: str, wb: LazyWorkbook) -> FormulaIndex | None:
+    """Whole-workbook formula graph, built once per file hash (None for .xls)."""
+    if not wb.has_formulas:
+        return None
+    return FORMULA_STORE.get_or_create(
+        file_hash, lambda: FormulaIndex.from_workbook(wb)
+    )
+
+
+def recalc_engine(file_hash: str, wb: LazyWorkbook) -> RecalcEngine:
     """
-    Lightweight profiling – returns HTML preview, stats, trends, ratios,
-    data-quality notes, and a JSON snippet used to prime the LLM.
+    Base what-if engine, built once per file hash and cached next to the
+    formula index. Scenarios run on `fork()`s of it and never change it.
     """
-    error_cells, missing_cells = [], []
-
-    # Locate Excel error tokens and NaNs
-    for r, row in df.iterrows():
-        for col, val in row.items():
-            cell = f"{col}{r + 2}"  # +2 → account for header row
-            if isinstance(val, str) and val in ERROR_TOKENS:
-                error_cells.append(cell)
-            elif pd.isna(val):
-                missing_cells.append(cell)
-
-    table_html = (
-        df.replace(list(ERROR_TOKENS), "ERROR")
-        .head(10)
-        .to_html(classes="table table-striped", index=False, border=0)
+    return FORMULA_STORE.get_or_create(
+        (file_hash, "recalc"), lambda: RecalcEngine(formula_index(file_hash, wb), wb)
     )
 
-    # Numeric summaries
-    numeric_cols = df.select_dtypes("number").columns
-    if numeric_cols.empty:
-        stats_text = "No numeric columns found."
-    else:
-        stats_text = "; ".join(
-            f"{c}: sum={df[c].sum(skipna=True):,.2f}, "
-            f"mean={df[c].mean(skipna=True):,.2f}"
-            for c in numeric_cols
+
+def parse_scenario(question: str, wb: LazyWorkbook) -> WhatIf | None:
+    """The question's what-if scenario – only workbooks with formulas run one."""
+    return parse_what_if(question) if wb.has_formulas else None
+
+
+def build_formula_index(file_hash: str, wb: LazyWorkbook) -> None:
+    """Background job: index every formula in the workbook after upload."""
+    try:
+        index = formula_index(file_hash, wb)
+    except ValueError as exc:
+        logging.warning("Formula index build failed – %s", exc)
+        return
+    if index is not None:
+        logging.info("Indexed %d formulas", len(index))
+
+
+def warm_workbook(file_hash: str, wb: LazyWorkbook) -> None:
+    """Queue the post-upload background work: sheet prefetch, formula index."""
+    upcoming = [n for n in wb.sheet_names[1:SHEET_PREFETCH + 1] if not wb.is_loaded(n)]
+    if upcoming:
+        PREFETCH_POOL.submit(carry_context(prefetch_sheets), file_hash, wb, upcoming)
+    if wb.has_formulas and file_hash not in FORMULA_STORE:
+        PREFETCH_POOL.submit(carry_context(build_formula_index), file_hash, wb)
+
+
+def sheet_profile(
+    file_hash: str, sheet: str, df: pd.DataFrame, types: dict | None = None
+) -> dict:
+    """Profile a sheet once per (file hash, sheet) and reuse it afterwards."""
+    return PROFILE_STORE.get_or_create(
+        (file_hash, sheet), lambda: process_dataframe(df, types)
+    )
+
+
+def grid_window(
+    file_hash: str, wb: LazyWorkbook, sheet: str, query: GridQuery | None = None
+) -> dict:
+    """
+    One window of a loaded sheet for the page's table (the first one by
+    default); sort / filter orders are cached.
+    """
+    query = GridQuery() if query is None else query
+    df = wb.sheet(sheet)
+    order = None
+    if not query.is_plain:
+        order = VIEW_STORE.get_or_create(
+            (file_hash, sheet, query.view), lambda: row_order(df, query)
         )
+    window = sheet_window(df, wb.type_report(sheet), query, order)
+    window["sheet"] = sheet
+    return window
 
-    # Profit-margin ratio (if columns exist)
-    revenue_col = next((c for c in df.columns if "revenue" in c.lower()), None)
-    profit_col = next((c for c in df.columns if re.search(r"profit|income", c, re.I)), None)
-    if revenue_col and profit_col and df[revenue_col].sum() > 0:
-        margin = (df[profit_col].sum() / df[revenue_col].sum()) * 100
-        ratio_text = f"Overall Profit Margin: {margin:.2f}%"
-    else:
-        ratio_text = "No key financial ratios calculated."
-
-    # Simple trend detection (MoM change of numeric cols)
-    datetime_cols = df.select_dtypes("datetime64[ns]").columns
-    trends = []
-    if datetime_cols.any():
-        dc = datetime_cols[0]
-        ts = (
-            df[[dc] + list(numeric_cols)]
-            .dropna(subset=[dc])
-            .sort_values(dc)
-            .set_index(dc)
-            .resample("M")
-            .sum()
+
+def profile_async(
+    file_hash: str, sheet: str, df: pd.DataFrame, types: dict | None = None
+) -> Future:
+    """
+    Start (or join) profiling of a sheet on PROFILE_POOL. Concurrent callers
+    for the same (file hash, sheet) share one in-flight computation.
+    """
+    key = (file_hash, sheet)
+    meta = PROFILE_STORE.get(key)
+    if meta is not None:
+        done: Future = Future()
+        done.set_result(meta)
+        return done
+    with _IN_FLIGHT_LOCK:
+        future = _PROFILES_IN_FLIGHT.get(key)
+        if future is None:
+            future = PROFILE_POOL.submit(
+                carry_context(sheet_profile), file_hash, sheet, df, types
+            )
+            _PROFILES_IN_FLIGHT[key] = future
+            future.add_done_callback(lambda _: _PROFILES_IN_FLIGHT.pop(key, None))
+        return future
+
+
+# Bump whenever build_prompt / choose_prompt wording changes – cached answers
+# are keyed on it, so old answers are not served for new templates.
+PROMPT_VERSION = 5
+
+FORMULA_REQUEST_RE = re.compile(
+    r"(how do i calculate|what is the formula|excel formula)", re.I
+)
+
+
+def build_prompt(
+    meta: dict, df: pd.DataFrame, question: str, types: dict | None = None
+) -> str:
+    """
+    Assemble the final prompt for Cohere’s Command-R model – the context most
+    relevant to the question, within PROMPT_TOKEN_BUDGET (see prompts.py).
+    """
+    prompt, usage = assemble_prompt(meta, df, question, types)
+    PROMPT_TOKENS.observe(usage["tokens"])
+    logging.info(
+        "Prompt – %d of %d tokens; columns %d/%d, stats %d/%d, trends %d/%d, rows %d",
+        usage["tokens"], usage["budget"], *usage["columns"], *usage["stats"],
+        *usage["trends"], usage["rows"][0],
+    )
+    return prompt
+
+def choose_prompt(
+    question: str, file_hash: str, wb: LazyWorkbook, sheet: str, get_meta,
+    scenario: WhatIf | None,
+) -> str:
+    """
+    Pick the prompt for a follow-up question:
+    • formula requests (“excel formula …”) → ask for a formula;
+    • what-if scenarios (“what if revenue grows 10%”, `scenario` from
+      `parse_scenario`) → recalculate locally and hand the exact results over;
+    • a cell reference (“cell D15”, “Sheet2!D15”, “formula in D15”) in a
+      workbook with formulas → explain it, with the resolved values of the
+      cells it reads and the cells that depend on it;
+    • anything else → full profile-based prompt (`get_meta()` is only
+      called in this case, so formula questions never wait on profiling).
+    """
+    if FORMULA_REQUEST_RE.search(question):
+        return (
+            "Provide an Excel formula and a brief explanation for the request:\n"
+            f"{question}"
+        )
+    results = None
+    if scenario is not None:
+        base = recalc_engine(file_hash, wb)
+        results = run_what_if(base.fork(), scenario, sheet)
+        FORMULA_STORE.put((file_hash, "recalc"), base)  # re-account built sheets
+    if results:
+        return (
+            "A what-if scenario was recalculated exactly with the workbook's own "
+            "formulas. Use these figures as given – do not recompute them:\n"
+            f"{results}\n"
+            f'Explain the impact and answer the user\'s question: "{question}".'
+        )
+    target = None
+    if wb.has_formulas:
+        target = find_cell_reference(question, wb.sheet_names, sheet)
+    if target is not None:
+        index = formula_index(file_hash, wb)
+        ref_sheet, cell = target
+        if index.formula(ref_sheet, cell):
+            return (
+                "Explain this Excel formula in simple terms, using the current "
+                "values of the cells it reads:\n"
+                f"{describe_cell(index, wb, ref_sheet, cell)}\n"
+                f'User\'s question: "{question}".'
+            )
+        row, col = split_cell(cell)
+        value = format_value(SheetGrid.for_sheet(wb, ref_sheet).value(row, col))
+        return (
+            f"Cell {qualified(ref_sheet, cell)} does not contain a formula; "
+            f"its value is {value}. "
+            f'Answer the user\'s question: "{question}".'
+        )
+    df = wb.sheet(sheet)
+    return build_prompt(get_meta(), df, question, wb.type_report(sheet))
+
+
+def local_answer(
+    question: str, wb: LazyWorkbook, sheet: str, scenario: WhatIf | None
+) -> str | None:
+    """
+    Exact answer computed from the sheet itself, or None → ask the LLM.
+    Formula, what-if (`scenario`, see `parse_scenario`) and cell questions
+    keep their own prompts.
+    """
+    if not USE_LOCAL_ANSWERS or FORMULA_REQUEST_RE.search(question):
+        return None
+    if wb.type_report(sheet).get("sampled"):
+        return None  # large-file mode keeps only a sample of the rows
+    if scenario is not None:
+        return None
+    if wb.has_formulas and find_cell_reference(question, wb.sheet_names, sheet):
+        return None
+    return LOCAL_ANSWERS.answer(question, wb.sheet(sheet), wb.header_row(sheet))
+
+
+def answer_question(
+    question: str, file_hash: str, wb: LazyWorkbook, sheet: str, profile: Future
+) -> dict:
+    """
+    One batch entry (runs on BATCH_POOL): local answer, else the follow-up
+    prompt through the answer cache. Failures are reported, not raised.
+    """
+    started = time.perf_counter()
+    entry = {"question": question, "sheet": sheet}
+    try:
+        scenario = parse_scenario(question, wb)
+        answer = local_answer(question, wb, sheet, scenario)
+        source = "local"
+        if answer is None:
+            key = ANSWER_CACHE.key(
+                PROMPT_VERSION, "followup", file_hash, sheet, question
+            )
+            answer, computed = ANSWER_CACHE.get_or_compute(
+                key, lambda: get_llm().chat(choose_prompt(
+                    question, file_hash, wb, sheet, profile.result, scenario
+                ))
+            )
+            source = "llm" if computed else "cache"
+        entry.update(
+            status="ok", source=source, answer=answer,
+            answer_html=render_markdown(answer),
+        )
+    except ValueError as exc:
+        logging.error("Batch question %r failed – %s", question, exc)
+        entry.update(status="error", error="I couldn’t answer that from the sheet.")
+    except Exception as exc:
+        logging.error("Cohere batch answer failed for %r – %s", question, exc)
+        entry.update(status="error", error="The AI service is currently unavailable.")
+    entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+
+def sse(event: str, data: str) -> str:
+    """Format one Server-Sent Event (multi-line data → several data: lines)."""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {event}\n{lines}\n"
+
+
+def stream_answer(prompt_factory, question: str, key: tuple):
+    """
+    SSE generator: emit a status event straight away (so headers and first
+    bytes leave while the profile is still being computed), then relay the
+    model's tokens as progressively rendered markdown, throttled to ~10
+    re-renders per second. Cached answers are sent at once, and identical
+    questions already streaming elsewhere are waited on, not re-asked.
+    """
+    yield sse("status", "Analysing your spreadsheet…")
+    cached = ANSWER_CACHE.get(key)
+    if cached is not None:
+        yield sse("done", render_markdown(cached))
+        return
+
+    future, leader = ANSWER_CACHE.claim(key)
+    try:
+        if not leader:
+            yield sse("done", render_markdown(ANSWER_CACHE.wait(future)))
+            return
+        prompt = prompt_factory()
+        logging.debug("Prompt length: %d chars", len(prompt))
+        parts: list[str] = []
+        last_render = 0.0
+        for chunk in get_llm().stream(prompt):
+            parts.append(chunk)
+            now = time.monotonic()
+            if now - last_render >= 0.1:
+                last_render = now
+                yield sse("answer", render_markdown("".join(parts)))
+        answer = "".join(parts).strip()
+        ANSWER_CACHE.resolve(key, future, answer)
+        yield sse("done", render_markdown(answer))
+    except Exception as exc:
+        logging.error("Cohere stream failed for %r – %s", question, exc)
+        if leader and not future.done():
+            ANSWER_CACHE.resolve(key, future, exc=exc)
+        yield sse("error", "The AI service is currently unavailable.")
+    finally:
+        # Client went away mid-stream – release anyone coalesced onto us
+        if leader and not future.done():
+            ANSWER_CACHE.resolve(key, future, exc=RuntimeError("stream aborted"))
+
+
+def finish_large_workbook(
+    file_hash: str, wb: LazyWorkbook | None, spooled: SpooledUpload
+) -> None:
+    """Background job: stream the remaining tabs, then drop the spooled file."""
+    try:
+        if wb is not None:
+            pending = [n for n in wb.sheet_names if not wb.is_loaded(n)]
+            prefetch_sheets(file_hash, wb, pending)
+    finally:
+        close_large_workbook(wb, spooled)
+
+
+def run_upload_job(
+    job_id: str, upload_id: str, data: bytes | None, filename: str, question: str,
+    spooled: SpooledUpload | None = None,
+) -> None:
+    """
+    Background upload pipeline (runs on jobs.IO_POOL):
+    parse + profile in a worker process → LLM call on this I/O thread →
+    session + rendered result stored for /jobs/<id>. Large uploads arrive as
+    a `spooled` temp file instead of `data` and are streamed on this thread.
+    """
+    file_hash = spooled.file_hash if spooled else content_hash(data)
+    wb = None
+    try:
+        JOBS.update(job_id, "running", stage="parsing")
+        wb = UPLOAD_STORE.get_workbook(file_hash)
+        if wb is None and spooled:
+            wb = open_large_workbook(spooled)
+        elif wb is None:
+            with span("worker_parse"):
+                snapshot = run_in_process(ingest_and_profile, data, filename)
+            wb = restore_workbook(data, filename, snapshot)
+            PROFILE_STORE.put((file_hash, snapshot["sheet"]), snapshot["meta"])
+        default_sheet = wb.sheet_names[0]
+        df = load_sheet(wb, default_sheet)
+        meta = sheet_profile(
+            file_hash, default_sheet, df, wb.type_report(default_sheet)
+        )
+        UPLOAD_STORE.put_workbook(file_hash, wb)
+        if spooled:
+            finish = carry_context(finish_large_workbook)
+            PREFETCH_POOL.submit(finish, file_hash, wb, spooled)
+            spooled = None  # the prefetch job owns the temp file now
+        else:
+            warm_workbook(file_hash, wb)
+
+        JOBS.update(job_id, "running", stage="asking")
+        ai_answer = local_answer(
+            question, wb, default_sheet, parse_scenario(question, wb)
         )
-        for c in numeric_cols:
-            pct = ts[c].pct_change().mean() * 100
-            if pd.notnull(pct):
-                direction = "grew" if pct > 0 else "declined"
-                trends.append(f"{c} {direction} by an average of {pct:.1f}% MoM")
-    trend_text = "; ".join(trends) or "No clear time-series trends detected."
-
-    # Data-quality notes
-    notes = []
-    if error_cells:
-        notes.append(f"Errors in cells e.g. {error_cells[0]}")
-    if missing_cells:
-        notes.append(f"Missing values in cells e.g. {missing_cells[0]}")
-    prefix = "Note: " + " ".join(notes) if notes else ""
-
-    head_text = json.dumps(df.head(3).to_dict(orient="records"), indent=2, default=str)
-
-    return {
-        "table_html": table_html,
-        "stats_text": stats_text,
-        "trend_text": trend_text,
-        "ratio_text": ratio_text,
-        "prefix": prefix,
-        "head_text": head_text,
-    }
-
-
-def build_prompt(meta: dict, num_rows: int, cols: list[str], question: str) -> str:
-    """Assemble the final prompt for Cohere’s Command-R model."""
-    return (
-        f'{meta["prefix"]} '
-        "Analyze the following spreadsheet data. "
-        f"The sheet has {num_rows} rows and columns: {cols}. "
-        f"Key Stats: {meta['stats_text']}. "
-        f"Financial Ratios: {meta['ratio_text']}. "
-        f"Time-series Trends: {meta['trend_text']}. "
-        f"Data Preview (first 3 rows): {meta['head_text']}. "
-        f'Given this context, answer the user\'s question: "{question}".'
+        if ai_answer is None:
+            prompt = build_prompt(meta, df, question, wb.type_report(default_sheet))
+            key = ANSWER_CACHE.key(
+                PROMPT_VERSION, "initial", file_hash, default_sheet, question
+            )
+            ai_answer, _ = ANSWER_CACHE.get_or_compute(
+                key, lambda: get_llm().chat(prompt)
+            )
+    except MemoryLimitExceeded as exc:
+        logging.error("Job %s: memory ceiling hit – %s", job_id, exc)
+        JOBS.update(
+            job_id, "failed",
+            error="That workbook is too large to analyse here. "
+            "Try splitting it into smaller files.",
+        )
+        return
+    except (ValueError, BadZipFile) as exc:
+        logging.error("Job %s: unreadable Excel file – %s", job_id, exc)
+        JOBS.update(
+            job_id, "failed",
+            error="I couldn’t read that file. Please check the format.",
+        )
+        return
+    except Exception as exc:
+        logging.error("Job %s failed – %s", job_id, exc)
+        JOBS.update(
+            job_id, "failed",
+            error="The AI service is currently unavailable. Try again later.",
+        )
+        return
+    finally:
+        if spooled:
+            close_large_workbook(wb, spooled)
+
+    UPLOAD_STORE.put_session(
+        upload_id, {"file_hash": file_hash, "active_sheet": default_sheet}
     )
+    JOBS.update(job_id, "done", result={
+        "upload_id": upload_id,
+        "filename": filename,
+        "question": question,
+        "answer_html": render_markdown(ai_answer),
+        "sheet_names": wb.sheet_names,
+        "sheet_dims": wb.dimensions,
+        "active_sheet": default_sheet,
+    })
+
+
+def wants_json() -> bool:
+    """True for API clients (Accept: application/json) rather than the browser form."""
+    best = request.accept_mimetypes.best_match(["text/html", "application/json"])
+    return best == "application/json"
+
+
+def load_session() -> tuple[dict, LazyWorkbook] | None:
+    """
+    Return (session entry, workbook) for the current user, or None if
+    either was evicted from the bounded caches.
+    """
+    cache = UPLOAD_STORE.get_session(session.get("upload_id", ""))
+    if not cache:
+        return None
+    wb = UPLOAD_STORE.get_workbook(cache["file_hash"])
+    if wb is None:
+        return None
+    return cache, wb
 
 # ─────────────────────────── Error handlers ──────────────────────────────── #
 
@@ -151,9 +689,10 @@ def build_prompt(meta: dict, num_rows: int, cols: list[str], question: str) -> s
 @app.errorhandler(413)
 @app.errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(_: Exception):
-    """Gracefully handle files larger than 5 MB."""
+    """Gracefully handle files above the upload limit."""
     logging.warning("Upload failed – file too large.")
-    flash("File is too large (maximum 5 MB).")
+    limit = request.max_content_length // 2**20
+    flash(f"File is too large (maximum {limit} MB).")
     return redirect(url_for("index"))
 
 # ─────────────────────────────── Routes ──────────────────────────────────── #
@@ -173,8 +712,16 @@ def upload():
     1. Validate & load Excel into DataFrame (first sheet).
     2. Profile data and craft LLM prompt.
     3. Query Cohere and render response.
-    4. Stash DataFrame/workbook in session for follow-up questions.
+    4. Stash the file hash in session – parse + profile are shared per file.
     """
+    # Beyond the in-memory cap, or of unknown length (chunked): spool to disk
+    # and stream it as a background job – the larger limit applies only here
+    length = request.content_length
+    large = LARGE_UPLOAD_MAX_BYTES > 0 and (
+        length is None or length > INLINE_UPLOAD_MAX_BYTES
+    )
+    if large:
+        request.max_content_length = STREAM_UPLOAD_MAX_BYTES
     file = request.files.get("excelFile")
     question = request.form.get("userQuestion", "").strip()
 
@@ -187,54 +734,97 @@ def upload():
 
     logging.info("File uploaded: %s | Question: %s", file.filename, question)
 
+    data = None
+    if large and not file.filename.lower().endswith(".xlsx"):
+        # Only .xlsx streams; a chunked .xls is fine while it fits in memory
+        data = file.read(INLINE_UPLOAD_MAX_BYTES + 1) if length is None else None
+        if data is None or len(data) > INLINE_UPLOAD_MAX_BYTES:
+            flash("Files over 5 MB must be .xlsx.")
+            return redirect(url_for("index"))
+        large = False
+
+    spooled = spool_upload(file.stream) if large else None
+    if not large and data is None:
+        data = file.read()
+    if large or ASYNC_UPLOADS or request.form.get("async") == "1":
+        job_id = JOBS.create()
+        upload_id = str(uuid.uuid4())
+        session["upload_id"] = upload_id
+        IO_POOL.submit(
+            carry_context(run_upload_job),
+            job_id, upload_id, data, file.filename, question, spooled,
+        )
+        status_url = url_for("job_status", job_id=job_id)
+        if wants_json():
+            return jsonify(job_id=job_id, status="queued", status_url=status_url), 202
+        return render_template(
+            "assistant.html",
+            job_id=job_id,
+            status_url=status_url,
+            result={"question": question, "answer": ""},
+            filename=file.filename,
+        ), 202
+
+    file_hash = content_hash(data)
     try:
-        # read every sheet into a dict: sheet name → DataFrame
-        sheets: dict[str, pd.DataFrame] = pd.read_excel(file, sheet_name=None, dtype=object)
-        # pick the first sheet as the default
-        default_sheet = list(sheets.keys())[0]
-        df = sheets[default_sheet]
+        # Identical uploads (same bytes) share a single parse
+        wb = UPLOAD_STORE.get_workbook(file_hash)
+        if wb is None:
+            wb = parse_workbook(data, file.filename)
+        # pick the first sheet as the default – the only one parsed eagerly
+        default_sheet = wb.sheet_names[0]
+        df = load_sheet(wb, default_sheet)
     except (ValueError, BadZipFile) as exc:
         logging.error("Unreadable Excel file – %s", exc)
         flash("I couldn’t read that file. Please check the format.")
         return redirect(url_for("index"))
 
-    # Load workbook too (for later formula explanations)
-    wb = None
-    if file.filename.endswith(".xlsx"):
-        try:
-            file.stream.seek(0)
-            wb = load_workbook(file.stream, data_only=False)
-        except Exception:
-            wb = None  # Non-critical – continue without workbook
-
-    meta = process_dataframe(df)
-    prompt = build_prompt(meta, len(df), df.columns.tolist(), question)
-    logging.debug("Prompt length: %d chars", len(prompt))
+    UPLOAD_STORE.put_workbook(file_hash, wb)
+    warm_workbook(file_hash, wb)
 
-    try:
-        co = cohere.Client(os.getenv("COHERE_API_KEY"))
-        ai_answer = co.chat(model="command-r", message=prompt).text.strip()
-    except Exception as exc:
-        logging.error("Cohere API failed – %s", exc)
-        flash("The AI service is currently unavailable. Try again later.")
-        return redirect(url_for("index"))
+    ai_answer = local_answer(question, wb, default_sheet, parse_scenario(question, wb))
+    stream = STREAM_ANSWERS and ai_answer is None
+    if stream:
+        # Kick off profiling now; the page's EventSource picks up the answer
+        profile_async(file_hash, default_sheet, df, wb.type_report(default_sheet))
+        result = {"question": question, "answer": ""}
+    else:
+        meta = sheet_profile(
+            file_hash, default_sheet, df, wb.type_report(default_sheet)
+        )
+        if ai_answer is None:
+            prompt = build_prompt(meta, df, question, wb.type_report(default_sheet))
+            key = ANSWER_CACHE.key(
+                PROMPT_VERSION, "initial", file_hash, default_sheet, question
+            )
+            try:
+                ai_answer, _ = ANSWER_CACHE.get_or_compute(
+                    key, lambda: get_llm().chat(prompt)
+                )
+            except Exception as exc:
+                logging.error("Cohere API failed – %s", exc)
+                flash("The AI service is currently unavailable. Try again later.")
+                return redirect(url_for("index"))
+        result = {"question": question, "answer": render_markdown(ai_answer)}
 
     # Cache dataframe for follow-ups
     upload_id = str(uuid.uuid4())
-    UPLOAD_CACHE[upload_id] = {
-        "sheets": sheets,
+    UPLOAD_STORE.put_session(upload_id, {
+        "file_hash": file_hash,
         "active_sheet": default_sheet,
-        "wb": wb,
-    }
+    })
     session["upload_id"] = upload_id
 
     return render_template(
         "assistant.html",
-        sheet_names=list(sheets.keys()),
+        sheet_names=wb.sheet_names,
+        sheet_dims=wb.dimensions,
         active_sheet=default_sheet,
-        result={"question": question, "answer": markdown2.markdown(ai_answer)},
-        table_html=meta["table_html"],
+        result=result,
+        grid=grid_window(file_hash, wb, default_sheet),
         filename=file.filename,
+        stream=STREAM_ANSWERS,
+        stream_question=question if stream else None,
     )
 
 
@@ -244,81 +834,298 @@ def ask():
     Follow-up questions reuse the cached DataFrame.
 
     Special cases:
+    • Totals / averages / highs and lows the sheet can answer exactly
+      (“total revenue in 2023”) → computed locally, no LLM call.
     • If the user asks for a formula (“excel formula …”) → generate one.
-    • If they mention a cell & “formula” (e.g. “Explain formula in cell D15”)
-      and we have the workbook → explain that specific formula.
+    • If they mention a cell (e.g. “Explain formula in cell D15” or
+      “Explain Sheet2!D15”) → explain that formula using the formula index.
     """
-    cache = UPLOAD_CACHE.get(session.get("upload_id", ""))
-    if not cache:
+    loaded = load_session()
+    if not loaded:
         flash("Session expired – please upload a new file.")
         return redirect(url_for("index"))
 
-    df = cache["sheets"][cache["active_sheet"]]
-    wb = cache["wb"]
-    cols = df.columns.tolist()
+    cache, wb = loaded
+    df = wb.sheet(cache["active_sheet"])
     question = request.form.get("userQuestion", "").strip()
     logging.info("Follow-up question: %s", question)
 
-    meta = process_dataframe(df)
+    # Profile (and preview) is computed once per sheet and reused – and only
+    # when a prompt is built, so cached answers skip it
+    types = wb.type_report(cache["active_sheet"])
 
-    # Branch: formula generation / explanation
-    if re.search(r"(how do i calculate|what is the formula|excel formula)", question, re.I):
-        prompt = (
-            "Provide an Excel formula and a brief explanation for the request:\n"
-            f"{question}"
+    def meta() -> dict:
+        return sheet_profile(cache["file_hash"], cache["active_sheet"], df, types)
+
+    # Branch: exact local answer / formula generation / explanation /
+    # profile-based prompt
+    scenario = parse_scenario(question, wb)
+    ai_answer = local_answer(question, wb, cache["active_sheet"], scenario)
+    if ai_answer is None:
+        key = ANSWER_CACHE.key(
+            PROMPT_VERSION, "followup", cache["file_hash"], cache["active_sheet"],
+            question,
         )
-    else:
-        cell_match = re.search(r"cell\s*([A-Za-z]+\d+)", question, re.I)
-        if wb and "formula" in question.lower() and cell_match:
-            ref = cell_match.group(1).upper()
-            try:
-                raw_formula = wb.active[ref].value or ""
-                prompt = (
-                    f"Explain this Excel formula in simple terms: {raw_formula}"
-                    if raw_formula else f"Cell {ref} is empty."
-                )
-            except Exception:
-                prompt = f"Could not access cell {ref}."
+        try:
+            ai_answer, _ = ANSWER_CACHE.get_or_compute(
+                key, lambda: get_llm().chat(choose_prompt(
+                    question, cache["file_hash"], wb, cache["active_sheet"], meta,
+                    scenario,
+                ))
+            )
+        except Exception as exc:
+            logging.error("Cohere follow-up failed – %s", exc)
+            return "The AI service is currently unavailable.", 503
+
+    return render_template(
+        "assistant.html",
+        sheet_names=wb.sheet_names,
+        sheet_dims=wb.dimensions,
+        active_sheet=cache["active_sheet"],
+        result={"question": question, "answer": render_markdown(ai_answer)},
+        grid=grid_window(cache["file_hash"], wb, cache["active_sheet"]),
+        filename=None,
+        stream=STREAM_ANSWERS,
+    )
+
+
+@app.route("/ask/stream")
+def ask_stream():
+    """
+    SSE endpoint used by the assistant page: streams the answer to `q` for
+    the session's active sheet. Events: status → answer* → done | error.
+    """
+    loaded = load_session()
+    question = request.args.get("q", "").strip()
+    if not loaded:
+        return Response(
+            sse("error", "Session expired – please upload a new file."),
+            mimetype="text/event-stream",
+        )
+
+    cache, wb = loaded
+    sheet = cache["active_sheet"]
+    df = wb.sheet(sheet)
+    logging.info("Streaming question: %s", question)
+    scenario = parse_scenario(question, wb)
+    answer = local_answer(question, wb, sheet, scenario)
+    if answer is not None:
+        return Response(
+            sse("done", render_markdown(answer)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    profile = profile_async(cache["file_hash"], sheet, df, wb.type_report(sheet))
+    key = ANSWER_CACHE.key(
+        PROMPT_VERSION, "followup", cache["file_hash"], sheet, question
+    )
+
+    return Response(
+        stream_with_context(stream_answer(
+            lambda: choose_prompt(
+                question, cache["file_hash"], wb, sheet, profile.result, scenario
+            ),
+            question, key,
+        )),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/ask/batch", methods=["POST"])
+def ask_batch():
+    """
+    JSON batch Q&A for the session's upload:
+    {"questions": ["…", {"question": "…", "sheet": "…"}, …], "sheet": "…"}
+    (`sheet` defaults to the active one). Answers come back in order, each
+    with status ok | error, its source (local / cache / llm) and timing.
+    """
+    loaded = load_session()
+    if not loaded:
+        return jsonify(error="Session expired – please upload a new file."), 404
+
+    cache, wb = loaded
+    body = request.get_json(silent=True)
+    questions = body.get("questions") if isinstance(body, dict) else None
+    if not isinstance(questions, list) or not questions:
+        message = 'Send a JSON object with a non-empty "questions" list.'
+        return jsonify(error=message), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify(error=f"At most {BATCH_MAX_QUESTIONS} questions per batch."), 400
+    default_sheet = body.get("sheet") or cache["active_sheet"]
+    items = []
+    for item in questions:
+        if isinstance(item, dict):
+            question, sheet = item.get("question"), item.get("sheet")
         else:
-            prompt = build_prompt(meta, len(df), cols, question)
+            question, sheet = item, None
+        if not isinstance(question, str) or not question.strip():
+            return jsonify(error="Every question must be a non-empty string."), 400
+        items.append((question.strip(), sheet or default_sheet))
+    logging.info("Batch of %d questions", len(items))
 
+    # Load + start profiling each sheet once; the questions share the result
+    started = time.perf_counter()
+    profiles: dict[str, Future | str] = {}
+    for sheet in dict.fromkeys(sheet for _, sheet in items):
+        if sheet not in wb:
+            profiles[sheet] = "Unknown sheet."
+            continue
+        was_loaded = wb.is_loaded(sheet)
+        try:
+            df = load_sheet(wb, sheet)
+        except ValueError as exc:
+            logging.error("Unreadable sheet – %s", exc)
+            profiles[sheet] = "I couldn’t read that sheet."
+            continue
+        if not was_loaded:
+            UPLOAD_STORE.put_workbook(cache["file_hash"], wb)
+        profiles[sheet] = profile_async(
+            cache["file_hash"], sheet, df, wb.type_report(sheet)
+        )
+
+    futures = [
+        BATCH_POOL.submit(
+            carry_context(answer_question), question, cache["file_hash"], wb, sheet,
+            profiles[sheet],
+        ) if isinstance(profiles[sheet], Future) else None
+        for question, sheet in items
+    ]
+    answers = [
+        future.result() if future is not None
+        else {
+            "question": question, "sheet": sheet, "status": "error",
+            "error": profiles[sheet], "ms": 0.0,
+        }
+        for (question, sheet), future in zip(items, futures, strict=True)
+    ]
+    return jsonify(
+        answers=answers,
+        answered=sum(a["status"] == "ok" for a in answers),
+        failed=sum(a["status"] == "error" for a in answers),
+        ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+@app.route("/sheet/grid")
+def sheet_grid():
+    """
+    JSON window of a sheet for the page's virtualized table:
+    ?sheet=&start=&count=&col_start=&col_count=&sort=&desc=&filter=&filter_col=
+    (positions are 0-based; `sort` / `filter_col` also take a column name;
+    `sheet` defaults to the active one).
+    """
+    loaded = load_session()
+    if not loaded:
+        return jsonify(error="Session expired – please upload a new file."), 404
+
+    cache, wb = loaded
+    sheet = request.args.get("sheet") or cache["active_sheet"]
+    if sheet not in wb:
+        return jsonify(error="Unknown sheet."), 404
+
+    was_loaded = wb.is_loaded(sheet)
     try:
-        co = cohere.Client(os.getenv("COHERE_API_KEY"))
-        ai_answer = co.chat(model="command-r", message=prompt).text.strip()
-    except Exception as exc:
-        logging.error("Cohere follow-up failed – %s", exc)
-        return "The AI service is currently unavailable.", 503
+        df = load_sheet(wb, sheet)
+    except ValueError as exc:
+        logging.error("Unreadable sheet – %s", exc)
+        return jsonify(error="I couldn’t read that sheet."), 422
+    if not was_loaded:
+        UPLOAD_STORE.put_workbook(cache["file_hash"], wb)
+    try:
+        query = GridQuery.from_args(request.args, df.columns)
+    except ValueError as exc:
+        return jsonify(error=f"Bad grid request – {exc}"), 400
+    return jsonify(grid_window(cache["file_hash"], wb, sheet, query))
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id: str):
+    """JSON status of a background upload: queued → running (stage) → done | failed."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job."), 404
+    body = {k: job[k] for k in ("id", "status", "stage", "error")}
+    if job["status"] == "done":
+        body["result_url"] = url_for("job_result", job_id=job_id)
+        body["answer_html"] = job["result"]["answer_html"]
+    return jsonify(body)
+
 
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id: str):
+    """Render the assistant page for a finished background upload."""
+    job = JOBS.get(job_id)
+    if job is None or job["status"] == "failed":
+        flash(job["error"] if job else "Unknown job.")
+        return redirect(url_for("index"))
+    if job["status"] != "done":
+        return redirect(url_for("job_status", job_id=job_id))
+
+    result = job["result"]
+    session["upload_id"] = result["upload_id"]
+    loaded = load_session()
     return render_template(
         "assistant.html",
-        result={"question": question, "answer": markdown2.markdown(ai_answer)},
-        table_html=meta["table_html"],
-        filename=None,
+        sheet_names=result["sheet_names"],
+        sheet_dims=result["sheet_dims"],
+        active_sheet=result["active_sheet"],
+        result={"question": result["question"], "answer": result["answer_html"]},
+        grid=(
+            grid_window(loaded[0]["file_hash"], loaded[1], result["active_sheet"])
+            if loaded else None
+        ),
+        filename=result["filename"],
+        stream=STREAM_ANSWERS,
     )
 
+
 @app.route("/switch-sheet", methods=["POST"])
 def switch_sheet():
-    upload_id = session.get("upload_id", "")
-    cache = UPLOAD_CACHE.get(upload_id)
-    if not cache:
+    loaded = load_session()
+    if not loaded:
         flash("Session expired — please upload again.")
         return redirect(url_for("index"))
 
+    cache, wb = loaded
     chosen = request.form["sheetName"]
+    if chosen not in wb:
+        flash("Unknown sheet.")
+        return redirect(url_for("index"))
+
+    # materialise the tab on first use (unless prefetched already)
+    was_loaded = wb.is_loaded(chosen)
+    try:
+        df = load_sheet(wb, chosen)
+    except ValueError as exc:
+        logging.error("Unreadable sheet – %s", exc)
+        flash("I couldn’t read that sheet.")
+        return redirect(url_for("index"))
+    if not was_loaded:
+        UPLOAD_STORE.put_workbook(cache["file_hash"], wb)
+
     cache["active_sheet"] = chosen
+    UPLOAD_STORE.put_session(session["upload_id"], cache)
 
-    # re-profile the newly‐selected sheet
-    df = cache["sheets"][chosen]
-    meta = process_dataframe(df)
+    # profile the newly‐selected sheet in the background (cached per file
+    # hash + sheet) – the page only needs the first grid window
+    profile_async(cache["file_hash"], chosen, df, wb.type_report(chosen))
 
     return render_template(
         "assistant.html",
-        sheet_names=list(cache["sheets"].keys()),
+        sheet_names=wb.sheet_names,
+        sheet_dims=wb.dimensions,
         active_sheet=chosen,
         result=None,                     # no AI answer yet
-        table_html=meta["table_html"],
+        grid=grid_window(cache["file_hash"], wb, chosen),
         filename=None,
+        stream=STREAM_ANSWERS,
     )
 
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (text exposition format 0.0.4)."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=False)
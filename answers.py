@@ -0,0 +1,131 @@
+"""
+answers.py – cache of LLM answers with request coalescing. Answers are keyed
+by the prompt template version, the content-addressed sheet (file hash +
+sheet name) and a normalised form of the question, so the standard
+checklist questions are answered once per model file. Concurrent identical
+requests share a single in-flight LLM call.
+"""
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from cache import BoundedCache
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 4096))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 6 * 60 * 60))
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a question."""
+    text = question.lower().replace("’", "'")
+    text = re.sub(r"[\"“”]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?.!")
+
+
+class AnswerCache:
+    """
+    Bounded answer store plus a table of in-flight computations.
+
+    `claim(key)` makes the first caller the leader (it must call `resolve`);
+    later callers get the same Future and simply wait on it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        ttl: float = ANSWER_CACHE_TTL,
+        wait_timeout: float = 180.0,
+    ) -> None:
+        self.answers = BoundedCache(
+            max_bytes=max_bytes, max_entries=max_entries, ttl=ttl
+        )
+        self.wait_timeout = wait_timeout
+        self._in_flight: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+    @staticmethod
+    def key(
+        version: int, mode: str, file_hash: str, sheet: str, question: str
+    ) -> tuple:
+        return version, mode, file_hash, sheet, normalize_question(question)
+
+    def get(self, key: tuple) -> str | None:
+        answer = self.answers.get(key)
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def claim(self, key: tuple) -> tuple[Future, bool]:
+        """Return (future, is_leader) for `key`."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def resolve(
+        self, key: tuple, future: Future, answer: str | None = None,
+        exc: BaseException | None = None,
+    ) -> None:
+        """Leader hands over its result; only successful answers are cached."""
+        if exc is None:
+            self.answers.put(key, answer)
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if exc is None:
+            future.set_result(answer)
+        else:
+            future.set_exception(exc)
+
+    def wait(self, future: Future) -> str:
+        return future.result(timeout=self.wait_timeout)
+
+    def get_or_compute(
+        self, key: tuple, compute: Callable[[], str]
+    ) -> tuple[str, bool]:
+        """
+        Cached answer, else join an identical in-flight call, else compute.
+        Returns (answer, computed) – computed is False when this caller
+        reused a cached or in-flight answer.
+        """
+        answer = self.get(key)
+        if answer is not None:
+            logging.info("Answer cache hit")
+            return answer, False
+        future, leader = self.claim(key)
+        if not leader:
+            logging.info("Coalesced onto in-flight answer")
+            return self.wait(future), False
+        try:
+            answer = compute()
+        except BaseException as exc:
+            self.resolve(key, future, exc=exc)
+            raise
+        self.resolve(key, future, answer)
+        return answer, True
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+        counters.update(entries=len(self.answers), evictions=self.answers.evictions)
+        return counters
+
+
+ANSWER_CACHE = AnswerCache()
@@ -0,0 +1,350 @@
+"""
+run.py – benchmark harness. Times each pipeline stage (parse, sheet load +
+type inference, profiling, prompt assembly, local answers, formula index,
+grid windows, large-file streaming) and the Flask routes end to end on
+synthetic workbooks (see synthetic.py), with the offline fake LLM so no
+network time is included. Peak Python memory is traced per stage, and the
+results are written as JSON so two runs can be compared:
+
+    python -m benchmarks.run                              # → bench-results.json
+    python -m benchmarks.run --scenarios small wide --repeat 3 -o before.json
+    python -m benchmarks.run -o after.json --compare before.json
+
+With --compare the exit status is 1 when any stage's median got slower than
+the baseline by more than --threshold (default 25 %).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, NamedTuple
+
+# Before the app is imported: render answers in full (no SSE) and keep
+# everything in this process; the LLM is swapped for the fake below.
+os.environ.setdefault("STREAM_ANSWERS", "0")
+os.environ.setdefault("ASYNC_UPLOADS", "0")
+os.environ.setdefault("UPLOAD_STORE", "memory")
+
+import jinja2  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import MAIN  # noqa: E402
+from answers import ANSWER_CACHE  # noqa: E402
+from benchmarks.synthetic import WorkbookSpec, generate  # noqa: E402
+from formula_index import FormulaIndex  # noqa: E402
+from grid import GridQuery, row_order, sheet_window  # noqa: E402
+from ingest import XlsxReader, load_sheet, parse_workbook  # noqa: E402
+from llm import FakeChatClient, set_backend  # noqa: E402
+from profiling import process_dataframe  # noqa: E402
+from prompts import assemble_prompt  # noqa: E402
+from queries import LOCAL_ANSWERS  # noqa: E402
+from store import FORMULA_STORE, PROFILE_STORE, VIEW_STORE, WORKBOOK_STORE  # noqa: E402
+from streaming import stream_sheet  # noqa: E402
+
+SCENARIOS = {
+    "small": WorkbookSpec(rows=1_000, columns=12, sheets=3),
+    "medium": WorkbookSpec(rows=20_000, columns=20, sheets=3),
+    "wide": WorkbookSpec(rows=400, columns=60, sheets=3, layout="columns"),
+    "large": WorkbookSpec(rows=100_000, columns=24, sheets=2),
+}
+DEFAULT_SCENARIOS = ("small", "medium", "wide")
+
+LLM_QUESTION = "Summarise the main drivers of profitability in this model."
+LOCAL_QUESTION = "What is the total Revenue?"
+
+
+class Stage(NamedTuple):
+    name: str
+    kind: str  # "stage" (a function) or "route" (a Flask request)
+    setup: Callable[[], Any]  # untimed; its result is passed to `run`
+    run: Callable[[Any], Any]
+
+
+# ────────────────────────────── Environment ──────────────────────────────── #
+
+
+def _use_repo_templates() -> None:
+    """This checkout keeps the pages next to the code (ASSISTANT.html, INDEX.html)."""
+    app = MAIN.app
+    if os.path.isdir(os.path.join(app.root_path, app.template_folder or "templates")):
+        return
+
+    def load(name: str) -> str | None:
+        base, ext = os.path.splitext(name)
+        path = os.path.join(app.root_path, base.upper() + ext)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as fh:
+            return fh.read()
+
+    app.jinja_loader = jinja2.FunctionLoader(load)
+
+
+def _clear_caches() -> None:
+    """Forget every parse, profile, view and answer – the next request is cold."""
+    caches = (
+        WORKBOOK_STORE, PROFILE_STORE, FORMULA_STORE, VIEW_STORE, ANSWER_CACHE.answers
+    )
+    for cache in caches:
+        cache.clear()
+
+
+def _settle() -> None:
+    """Wait for background prefetch / profiling queued by the last request."""
+    MAIN.PREFETCH_POOL.submit(lambda: None).result()
+    while MAIN._PROFILES_IN_FLIGHT:
+        time.sleep(0.001)
+
+
+def _workbook(name: str, spec: WorkbookSpec) -> bytes:
+    """
+    Generated .xlsx bytes, cached on disk per spec (generation is slow and
+    untimed).
+    """
+    digest = hashlib.sha1(repr(spec).encode()).hexdigest()[:12]
+    path = os.path.join(
+        tempfile.gettempdir(), "docubridge-bench", f"{name}-{digest}.xlsx"
+    )
+    if os.path.exists(path):
+        with open(path, "rb") as fh:
+            return fh.read()
+    print(f"Generating {name}: {spec.describe()} …", file=sys.stderr)
+    data = generate(spec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(data)
+    return data
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+# ──────────────────────────────── Stages ─────────────────────────────────── #
+
+
+def _stages(data: bytes) -> list[Stage]:
+    wb = parse_workbook(data, "bench.xlsx")
+    first, second = wb.sheet_names[0], wb.sheet_names[1 % len(wb.sheet_names)]
+    df, types = load_sheet(wb, first), wb.type_report(first)
+    meta = process_dataframe(df, types)
+    for name in wb.sheet_names:  # the formula index walks every sheet
+        load_sheet(wb, name)
+    order = GridQuery(start=len(df) // 2, sort=3, descending=True)
+
+    def fresh_workbook():
+        return parse_workbook(data, "bench.xlsx")
+
+    return [
+        Stage("parse_workbook", "stage", lambda: None,
+              lambda _: parse_workbook(data, "bench.xlsx")),
+        Stage("load_sheet", "stage", fresh_workbook, lambda w: load_sheet(w, first)),
+        Stage("process_dataframe", "stage", lambda: None,
+              lambda _: process_dataframe(df, types)),
+        Stage("assemble_prompt", "stage", lambda: None,
+              lambda _: assemble_prompt(meta, df, LLM_QUESTION, types)),
+        Stage("local_answer", "stage", lambda: None,
+              lambda _: LOCAL_ANSWERS.answer(LOCAL_QUESTION, df)),
+        Stage("formula_index", "stage", lambda: None,
+              lambda _: FormulaIndex.from_workbook(wb)),
+        Stage("grid_sorted_window", "stage", lambda: None,
+              lambda _: sheet_window(df, types, order, row_order(df, order))),
+        Stage("stream_sheet", "stage", lambda: XlsxReader(io.BytesIO(data)),
+              lambda reader: stream_sheet(reader, first)),
+    ] + _routes(data, first, second, len(df))
+
+
+def _routes(data: bytes, first: str, second: str, rows: int) -> list[Stage]:
+    client = MAIN.app.test_client()
+    runs = iter(range(10**9))
+
+    def request(method: str, url: str, **kwargs) -> Any:
+        response = client.open(url, method=method, **kwargs)
+        body = response.get_data()  # drains streamed responses too
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} → {response.status_code}")
+        return body
+
+    def cold() -> None:
+        _settle()
+        _clear_caches()
+
+    def upload(_) -> Any:
+        return request("POST", "/upload", content_type="multipart/form-data", data={
+            "excelFile": (io.BytesIO(data), "bench.xlsx"), "userQuestion": LLM_QUESTION,
+        })
+
+    def switch(_) -> Any:
+        sheet = second if next(runs) % 2 == 0 else first
+        return request("POST", "/switch-sheet", data={"sheetName": sheet})
+
+    grid = {"sheet": first, "start": rows // 2, "count": 100, "sort": 3, "desc": 1}
+    # Background work a request queues (prefetch, profiling) is waited for
+    # in the next run's untimed setup, so it never overlaps a timing
+    return [
+        Stage("POST /upload (cold)", "route", cold, upload),
+        # Unique wording per run, so the answer cache never short-cuts the pipeline
+        Stage("POST /ask (llm)", "route", _settle, lambda _: request(
+            "POST", "/ask",
+            data={"userQuestion": f"{LLM_QUESTION} (run {next(runs)})"})),
+        Stage("POST /ask (local)", "route", _settle, lambda _: request(
+            "POST", "/ask", data={"userQuestion": LOCAL_QUESTION})),
+        Stage("GET /ask/stream (llm)", "route", _settle, lambda _: request(
+            "GET", "/ask/stream",
+            query_string={"q": f"{LLM_QUESTION} (stream {next(runs)})"})),
+        Stage("POST /ask/batch (10 q)", "route", _settle, lambda _: request(
+            "POST", "/ask/batch", json={"questions": [LOCAL_QUESTION] + [
+                f"{LLM_QUESTION} (batch {next(runs)})" for _ in range(9)
+            ]})),
+        Stage("GET /sheet/grid (sorted)", "route", _settle, lambda _: request(
+            "GET", "/sheet/grid", query_string=grid)),
+        Stage("POST /switch-sheet", "route", _settle, switch),
+    ]
+
+
+# ─────────────────────────────── Harness ─────────────────────────────────── #
+
+
+def measure(stage: Stage, repeat: int) -> dict:
+    """One traced warm-up run for peak memory, then `repeat` timed runs."""
+    arg = stage.setup()
+    tracemalloc.start()
+    stage.run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        arg = stage.setup()
+        started = time.perf_counter()
+        stage.run(arg)
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        "name": stage.name,
+        "kind": stage.kind,
+        "runs": repeat,
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(scenarios: list[str], repeat: int) -> dict:
+    _use_repo_templates()
+    MAIN.app.config["TESTING"] = True
+    set_backend(FakeChatClient())
+
+    report = {
+        "version": 1,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": _environment(),
+        "repeat": repeat,
+        "scenarios": {},
+        "results": [],
+    }
+    for name in scenarios:
+        spec = SCENARIOS[name]
+        data = _workbook(name, spec)
+        report["scenarios"][name] = {**spec._asdict(), "bytes": len(data)}
+        for stage in _stages(data):
+            result = {"scenario": name, **measure(stage, repeat)}
+            report["results"].append(result)
+            peak = result["peak_kib"] / 1024
+            print(
+                f"{name:<8} {stage.name:<26} {result['median_ms']:>10.2f} ms"
+                f"  (min {result['min_ms']:.2f})  peak {peak:7.1f} MiB",
+                file=sys.stderr,
+            )
+        _settle()
+        _clear_caches()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    unit = 2**20 if sys.platform == "darwin" else 2**10
+    report["max_rss_mib"] = round(maxrss / unit, 1)
+    return report
+
+
+def compare(
+    report: dict, baseline: dict, threshold: float, floor_ms: float = 1.0
+) -> list[str]:
+    """Stages whose median is more than `threshold` slower than the baseline's."""
+    before = {(r["scenario"], r["name"]): r["median_ms"] for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        old = before.get((r["scenario"], r["name"]))
+        if old is None:
+            continue
+        ratio = r["median_ms"] / old if old else float("inf")
+        line = (
+            f"{r['scenario']:<8} {r['name']:<26} {old:>10.2f} → "
+            f"{r['median_ms']:>10.2f} ms  ×{ratio:.2f}"
+        )
+        if ratio > 1 + threshold and r["median_ms"] - old > floor_ms:
+            regressions.append(line)
+            line += "  REGRESSION"
+        print(line, file=sys.stderr)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the DocuBridge pipeline and routes"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=sorted(SCENARIOS),
+        default=list(DEFAULT_SCENARIOS),
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", default="bench-results.json")
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="earlier results file to compare against"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="allowed slowdown (0.25 = 25 %%)"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.scenarios, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Wrote {args.output} (max RSS {report['max_rss_mib']} MiB)", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = compare(report, json.load(fh), args.threshold)
+        if regressions:
+            count, limit = len(regressions), args.threshold
+            print(f"{count} regression(s) over {limit:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
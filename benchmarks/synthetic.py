@@ -0,0 +1,177 @@
+"""
+synthetic.py – realistic, reproducible financial-model workbooks for the
+benchmarks. Size, formula density, error-token and blank density and the
+period layout are all configurable; the same spec and seed always give the
+same cells.
+
+Layouts:
+  "rows"     tidy ledger – a day per row (Date, Region, Segment, then
+             Revenue, COGS, Gross Profit, … metric columns)
+  "columns"  P&L style – a line item per row, periods across the headers
+             ("Jan-23", "Feb-23", …)
+
+    python -m benchmarks.synthetic --rows 50000 --columns 24 --sheets 3 -o model.xlsx
+"""
+import argparse
+import io
+import sys
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils.cell import get_column_letter
+
+LAYOUTS = ("rows", "columns")
+
+# Metric / line-item names, in the order a model usually lists them
+LINE_ITEMS = (
+    "Revenue", "COGS", "Gross Profit", "Marketing", "Salaries", "Rent",
+    "Operating Expenses", "EBITDA", "Depreciation", "Operating Income", "Interest",
+    "Tax", "Net Profit", "Cash", "Receivables", "Payables", "Inventory", "Capex",
+    "Headcount", "Units Sold",
+)
+REGIONS = ("North", "South", "East", "West")
+SEGMENTS = ("Retail", "Wholesale", "Online")
+ERRORS = ("#DIV/0!", "#N/A", "#VALUE!", "#REF!")
+
+
+class WorkbookSpec(NamedTuple):
+    rows: int = 1_000  # data rows ("rows") or line items ("columns") per sheet
+    columns: int = 12  # metric columns ("rows") or periods ("columns")
+    sheets: int = 3
+    formula_density: float = 0.05  # share of derived cells written as formulas
+    error_density: float = 0.002  # share of value cells holding an Excel error
+    nan_density: float = 0.01  # share of value cells left blank
+    layout: str = "rows"
+    seed: int = 0
+
+    def describe(self) -> str:
+        return (
+            f"{self.sheets}×{self.rows:,}×{self.columns} ({self.layout}), "
+            f"{self.formula_density:.0%} formulas, {self.error_density:.1%} errors, "
+            f"{self.nan_density:.0%} blanks"
+        )
+
+
+def _names(count: int) -> list[str]:
+    return [
+        LINE_ITEMS[i] if i < len(LINE_ITEMS) else f"Metric {i + 1}"
+        for i in range(count)
+    ]
+
+
+def _values(
+    rng: np.random.Generator, shape: tuple[int, int], spec: WorkbookSpec
+) -> np.ndarray:
+    """
+    Trending positive amounts, with errors and blanks sprinkled in (object
+    array).
+    """
+    base = rng.uniform(1_000, 100_000, size=(1, shape[1]))
+    steps = rng.normal(0.004, 0.03, size=shape)
+    drift = 1 + steps.cumsum(axis=0) / np.sqrt(shape[0] or 1)
+    values = np.round(base * np.clip(drift, 0.05, None), 2).astype(object)
+    roll = rng.random(shape)
+    values[roll < spec.nan_density] = None
+    errors = (roll >= spec.nan_density) & (
+        roll < spec.nan_density + spec.error_density
+    )
+    values[errors] = rng.choice(ERRORS, size=int(errors.sum()))
+    return values
+
+
+def _ledger_sheet(ws, rng: np.random.Generator, spec: WorkbookSpec) -> None:
+    metrics = _names(spec.columns)
+    ws.append(["Date", "Region", "Segment", *metrics])
+    values = _values(rng, (spec.rows, spec.columns), spec)
+    dates = pd.date_range("2015-01-01", periods=spec.rows, freq="D").to_pydatetime()
+    regions = rng.choice(REGIONS, size=spec.rows)
+    segments = rng.choice(SEGMENTS, size=spec.rows)
+    formulas = rng.random(spec.rows) < spec.formula_density
+    # Gross Profit = Revenue − COGS when both columns exist
+    derived = 5 if spec.columns >= 3 else None
+    for i in range(spec.rows):
+        row = [dates[i], regions[i], segments[i], *values[i]]
+        if derived is not None and formulas[i]:
+            r = i + 2
+            row[derived] = f"=D{r}-E{r}"
+        ws.append(row)
+
+
+def _pnl_sheet(ws, rng: np.random.Generator, spec: WorkbookSpec) -> None:
+    periods = pd.period_range("2015-01", periods=spec.columns, freq="M")
+    ws.append(["Line item", *(p.strftime("%b-%y") for p in periods)])
+    items = _names(spec.rows)
+    values = _values(rng, (spec.columns, spec.rows), spec).T  # trend along the periods
+    formulas = rng.random(spec.columns) < spec.formula_density
+    for i, item in enumerate(items):
+        row = [item, *values[i]]
+        if item == "Gross Profit":  # = Revenue − COGS (rows 2 and 3)
+            for j in np.flatnonzero(formulas):
+                col = get_column_letter(j + 2)
+                row[j + 1] = f"={col}2-{col}3"
+        ws.append(row)
+
+
+def generate(spec: WorkbookSpec | None = None) -> bytes:
+    """
+    Build the workbook in memory (openpyxl write-only mode) and return .xlsx
+    bytes; the default spec when none is given.
+    """
+    spec = WorkbookSpec() if spec is None else spec
+    if spec.layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}")
+    rng = np.random.default_rng(spec.seed)
+    wb = Workbook(write_only=True)
+    for k in range(spec.sheets):
+        name = f"Model {k + 1}" if spec.layout == "rows" else f"P&L {k + 1}"
+        ws = wb.create_sheet(name)
+        (_ledger_sheet if spec.layout == "rows" else _pnl_sheet)(ws, rng, spec)
+    if spec.sheets:
+        # Summary tab totalling the others – gives the formula index
+        # cross-sheet edges
+        ws = wb.create_sheet("Summary")
+        ws.append(["Sheet", "Total"])
+        for k in range(spec.sheets):
+            if spec.layout == "rows":
+                name, cells = f"Model {k + 1}", f"D2:D{spec.rows + 1}"
+            else:
+                last = get_column_letter(spec.columns + 1)
+                name, cells = f"P&L {k + 1}", f"B2:{last}2"
+            ws.append([name, f"=SUM('{name}'!{cells})"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def main(argv: list[str] | None = None) -> None:
+    defaults = WorkbookSpec()
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic financial-model .xlsx"
+    )
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--rows", type=int, default=defaults.rows)
+    parser.add_argument("--columns", type=int, default=defaults.columns)
+    parser.add_argument("--sheets", type=int, default=defaults.sheets)
+    parser.add_argument(
+        "--formula-density", type=float, default=defaults.formula_density
+    )
+    parser.add_argument("--error-density", type=float, default=defaults.error_density)
+    parser.add_argument("--nan-density", type=float, default=defaults.nan_density)
+    parser.add_argument("--layout", choices=LAYOUTS, default=defaults.layout)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+    spec = WorkbookSpec(
+        args.rows, args.columns, args.sheets, args.formula_density,
+        args.error_density, args.nan_density, args.layout, args.seed,
+    )
+    data = generate(spec)
+    with open(args.output, "wb") as fh:
+        fh.write(data)
+    size = len(data) / 2**20
+    print(f"{args.output}: {spec.describe()} – {size:.1f} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
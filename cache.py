@@ -0,0 +1,190 @@
+"""
+cache.py – bounded in-process cache with LRU + idle-TTL eviction and a byte
+budget. Each entry carries a size estimate so a handful of huge workbooks
+cannot grow the worker's RSS without limit.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+# Rough per-cell footprint of an openpyxl Cell (object + value + style refs)
+WORKBOOK_CELL_BYTES = 500
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Best-effort byte estimate for cached objects: DataFrames use
+    `memory_usage(deep=True)`, openpyxl workbooks are sized by cell count,
+    and dicts / lists / tuples are walked recursively.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if hasattr(value, "worksheets"):  # openpyxl Workbook
+        return sum(
+            ws.max_row * ws.max_column * WORKBOOK_CELL_BYTES for ws in value.worksheets
+        )
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class BoundedCache:
+    """
+    Thread-safe LRU cache with an idle TTL and a total byte budget.
+
+    `ttl` is measured from the last access, so active sessions stay warm.
+    Entries larger than the whole budget are never stored.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int | None = None,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sizeof = sizeof
+        # key → (value, size, last access)
+        self._data: OrderedDict[Hashable, tuple[Any, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    # ── internal helpers (caller holds the lock) ── #
+
+    def _drop(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def _expired(self, accessed: float, now: float) -> bool:
+        return self.ttl is not None and now - accessed > self.ttl
+
+    def _prune(self, now: float) -> None:
+        if self.ttl is not None:
+            stale = [k for k, (_, _, t) in self._data.items() if self._expired(t, now)]
+            for key in stale:
+                self._drop(key)
+                self.expirations += 1
+        while self._data and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._drop(next(iter(self._data)))  # least recently used
+            self.evictions += 1
+
+    def _lookup(self, key: Hashable, now: float) -> tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, size, accessed = entry
+        if self._expired(accessed, now):
+            self._drop(key)
+            self.expirations += 1
+            return False, None
+        self._data[key] = (value, size, now)
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Hashable, value: Any, size: int, now: float) -> None:
+        if key in self._data:
+            self._drop(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.evictions += 1
+        else:
+            self._data[key] = (value, size, now)
+            self._bytes += size
+        self._prune(now)
+
+    # ── public API ── #
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[2], time.monotonic())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.put(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value)
+        with self._lock:
+            self._store(key, value, size, time.monotonic())
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._drop(key)
+            return value
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, building it with `factory` on a miss."""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+        # Build outside the lock – parsing / profiling can take seconds
+        value = factory()
+        size = self._sizeof(value)
+        with self._lock:
+            found, existing = self._lookup(key, time.monotonic())
+            if found:
+                return existing
+            self._store(key, value, size, time.monotonic())
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Counters and current footprint, e.g. for logging or metrics."""
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
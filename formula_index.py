@@ -0,0 +1,471 @@
+"""
+formula_index.py – whole-workbook formula index. Maps every (sheet, cell) to
+its formula and parses the references in it – plain cells, ranges and
+cross-sheet refs such as 'P&L'!B2:B13 – into a precedent / dependent graph,
+so "Explain Sheet2!D15" is a dict lookup plus a few cell reads instead of a
+walk over an openpyxl Workbook.
+
+The index holds formulas and graph edges only; cell values are read from the
+LazyWorkbook's frames when a prompt is built.
+"""
+import datetime
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils.cell import column_index_from_string, get_column_letter
+
+from ingest import LazyWorkbook, column_index
+from telemetry import span
+
+# (sheet name, "D15") – cell keys never carry "$"
+CellKey = tuple[str, str]
+
+# Last row of a worksheet – whole-column references ("A:A") span up to it
+MAX_ROW = 1_048_576
+
+# How much precedent detail goes into an explanation prompt
+MAX_PRECEDENT_CELLS = 30
+MAX_RANGE_SAMPLES = 8
+
+_STRING_LITERAL_RE = re.compile(r'"(?:[^"]|"")*"')
+_SHEET_PREFIX = r"(?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?(?<![\w.$])"
+_REF_RE = re.compile(
+    _SHEET_PREFIX
+    + r"\$?(?P<c1>[A-Z]{1,3})\$?(?P<r1>\d+)"
+    r"(?::\$?(?P<c2>[A-Z]{1,3})\$?(?P<r2>\d+))?"
+    r"(?![\w(])"
+)
+# Whole columns: "A:A", "Sheet2!$B:$D"
+_COLUMN_RANGE_RE = re.compile(
+    _SHEET_PREFIX + r"\$?(?P<c1>[A-Z]{1,3}):\$?(?P<c2>[A-Z]{1,3})(?![\w(])"
+)
+# In questions: "Sheet2!D15", "'P&L'!b5" or "cell D15"
+_QUESTION_REF_RE = re.compile(
+    r"(?:(?P<sheet>'(?:[^']|'')+'|[\w.&-]+)!|\bcell\s+)"
+    r"\$?(?P<col>[A-Za-z]{1,3})\$?(?P<row>\d+)\b",
+    re.I,
+)
+_BARE_REF_RE = re.compile(r"\b\$?([A-Za-z]{1,3})\$?(\d+)\b")
+
+
+def _unquote(sheet: str) -> str:
+    return sheet[1:-1].replace("''", "'") if sheet.startswith("'") else sheet
+
+
+def qualified(sheet: str, cell: str) -> str:
+    """Excel-style "Sheet2!D15" / "'P&L'!B2" address."""
+    if not re.fullmatch(r"[A-Za-z_][\w.]*", sheet):
+        sheet = "'" + sheet.replace("'", "''") + "'"
+    return f"{sheet}!{cell}"
+
+
+class Ref(NamedTuple):
+    """A rectangular reference on one sheet (1-based, inclusive bounds)."""
+
+    sheet: str
+    min_row: int
+    min_col: int
+    max_row: int
+    max_col: int
+
+    @property
+    def size(self) -> int:
+        return (self.max_row - self.min_row + 1) * (self.max_col - self.min_col + 1)
+
+    @property
+    def label(self) -> str:
+        if self.min_row == 1 and self.max_row == MAX_ROW:
+            first = get_column_letter(self.min_col)
+            return qualified(self.sheet, f"{first}:{get_column_letter(self.max_col)}")
+        first = f"{get_column_letter(self.min_col)}{self.min_row}"
+        if self.size == 1:
+            return qualified(self.sheet, first)
+        return qualified(
+            self.sheet, f"{first}:{get_column_letter(self.max_col)}{self.max_row}"
+        )
+
+    def cells(self) -> Iterator[CellKey]:
+        for row in range(self.min_row, self.max_row + 1):
+            for col in range(self.min_col, self.max_col + 1):
+                yield self.sheet, f"{get_column_letter(col)}{row}"
+
+
+@lru_cache(maxsize=1 << 16)
+def split_cell(cell: str) -> tuple[int, int]:
+    """"D15" → (row 15, column 4)."""
+    return int(cell.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")), column_index(cell)
+
+
+def parse_references(
+    formula: str, sheet: str, sheet_names: dict[str, str] | None = None
+) -> list[Ref]:
+    """
+    Cell and range references in `formula`, resolved against `sheet`.
+    `sheet_names` maps lower-case names to their real spelling (Excel sheet
+    names are case-insensitive). Whole-row / whole-column ranges and defined
+    names are not resolved.
+    """
+    return split_formula(formula, sheet, sheet_names)[1]
+
+
+def split_formula(
+    formula: str, sheet: str, sheet_names: dict[str, str] | None = None
+) -> tuple[str, list[Ref]]:
+    """
+    (shape, refs): the formula with its i-th reference replaced by "_REF{i}_"
+    and the parsed references. Formulas filled down or across share one
+    shape, so they can share one parse.
+    """
+    refs: list[Ref] = []
+
+    def slot(m: re.Match) -> str:
+        refs.append(_to_ref(m, sheet, sheet_names))
+        return f"_REF{len(refs) - 1}_"
+
+    # string literals are copied verbatim, references only replaced outside them
+    parts = []
+    last = 0
+    for literal in _STRING_LITERAL_RE.finditer(formula):
+        code = _REF_RE.sub(slot, formula[last:literal.start()])
+        parts.append(_COLUMN_RANGE_RE.sub(slot, code))
+        parts.append(literal.group())
+        last = literal.end()
+    parts.append(_COLUMN_RANGE_RE.sub(slot, _REF_RE.sub(slot, formula[last:])))
+    return "".join(parts), refs
+
+
+def parse_reference(
+    text: str, sheet: str, sheet_names: dict[str, str] | None = None
+) -> Ref | None:
+    """A single reference such as "$B$2", "'P&L'!B2:B13" or "A:A"; None otherwise."""
+    for pattern in (_REF_RE, _COLUMN_RANGE_RE):
+        m = pattern.fullmatch(text)
+        if m:
+            return _to_ref(m, sheet, sheet_names)
+    return None
+
+
+def _to_ref(m: re.Match, sheet: str, sheet_names: dict[str, str] | None) -> Ref:
+    target = _unquote(m["sheet"]) if m["sheet"] else sheet
+    if sheet_names is not None:
+        target = sheet_names.get(target.lower(), target)
+    c1 = column_index_from_string(m["c1"])
+    c2 = column_index_from_string(m["c2"]) if m["c2"] else c1
+    if "r1" not in m.re.groupindex:  # whole columns
+        return Ref(target, 1, min(c1, c2), MAX_ROW, max(c1, c2))
+    r1 = int(m["r1"])
+    r2 = int(m["r2"]) if m["r2"] else r1
+    return Ref(target, min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2))
+
+
+class FormulaIndex:
+    """
+    (sheet, cell) → formula, plus precedent (what a cell reads) and
+    dependent (what reads a cell) edges. Single-cell references are dict
+    entries; ranges are never expanded cell by cell (running totals such as
+    SUM(C$2:C9999) would be quadratic) but kept as row intervals per column.
+    """
+
+    def __init__(self, sheet_names: list[str]) -> None:
+        self.sheet_names = list(sheet_names)
+        self._by_lower = {name.lower(): name for name in self.sheet_names}
+        self._order = {name: i for i, name in enumerate(self.sheet_names)}
+        self.formulas: dict[CellKey, str] = {}
+        self.precedents: dict[CellKey, list[Ref]] = {}
+        self.dependents: defaultdict[CellKey, set[CellKey]] = defaultdict(set)
+        # (sheet, column) → [(min_row, max_row, dependent)] for range references
+        self.range_dependents: defaultdict[
+            tuple[str, int], list[tuple[int, int, CellKey]]
+        ] = defaultdict(list)
+        # the same spans as numpy bounds, built on first lookup of a column
+        self._span_arrays: dict[tuple[str, int], tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    @span("formula_index")
+    def from_workbook(cls, wb: LazyWorkbook) -> "FormulaIndex":
+        """Index every sheet's formulas – a formulas-only pass, sheets stay unloaded."""
+        index = cls(wb.sheet_names)
+        for name in wb.sheet_names:
+            for cell, formula in (wb.scan_formulas(name) or {}).items():
+                index.add(name, cell, formula)
+        return index
+
+    def add(self, sheet: str, cell: str, formula: str) -> None:
+        key = (sheet, cell)
+        refs = parse_references(formula, sheet, self._by_lower)
+        self.formulas[key] = formula
+        self.precedents[key] = refs
+        for ref in refs:
+            if ref.size == 1:
+                self.dependents[next(ref.cells())].add(key)
+                continue
+            for col in range(ref.min_col, ref.max_col + 1):
+                self.range_dependents[ref.sheet, col].append(
+                    (ref.min_row, ref.max_row, key)
+                )
+                self._span_arrays.pop((ref.sheet, col), None)
+
+    def __len__(self) -> int:
+        return len(self.formulas)
+
+    def formula(self, sheet: str, cell: str) -> str | None:
+        return self.formulas.get((sheet, cell))
+
+    def precedents_of(self, sheet: str, cell: str) -> list[Ref]:
+        return self.precedents.get((sheet, cell), [])
+
+    def _span_bounds(self, sheet: str, col: int) -> tuple[np.ndarray, np.ndarray]:
+        bounds = self._span_arrays.get((sheet, col))
+        if bounds is None:
+            spans = self.range_dependents[sheet, col]
+            bounds = self._span_arrays[sheet, col] = (
+                np.fromiter((lo for lo, _, _ in spans), np.int64, len(spans)),
+                np.fromiter((hi for _, hi, _ in spans), np.int64, len(spans)),
+            )
+        return bounds
+
+    def dependents_of(self, sheet: str, cell: str) -> list[CellKey]:
+        found = set(self.dependents.get((sheet, cell), ()))
+        row, col = split_cell(cell)
+        spans = self.range_dependents.get((sheet, col))
+        if spans:
+            lo, hi = self._span_bounds(sheet, col)
+            found.update(spans[i][2] for i in np.flatnonzero((lo <= row) & (hi >= row)))
+        return sorted(
+            found, key=lambda k: (self._order.get(k[0], -1), split_cell(k[1]))
+        )
+
+    def dependents_closure(self, cells: list[CellKey]) -> list[CellKey]:
+        """
+        Every cell that depends on `cells`, directly or indirectly (the cells
+        themselves excluded). Each range span is followed at most once, so a
+        column of running totals costs one pass, not one per input cell.
+        """
+        seen = set(cells)
+        taken: dict[tuple[str, int], np.ndarray] = {}
+        frontier = list(cells)
+        found = []
+        while frontier:  # breadth-first, one level at a time
+            candidates = []
+            rows_by_column: defaultdict[tuple[str, int], list[int]] = defaultdict(list)
+            for sheet, cell in frontier:
+                candidates.extend(self.dependents.get((sheet, cell), ()))
+                row, col = split_cell(cell)
+                rows_by_column[sheet, col].append(row)
+            # range spans: one vectorised "does any changed row fall inside"
+            for column, rows in rows_by_column.items():
+                spans = self.range_dependents.get(column)
+                if not spans:
+                    continue
+                lo, hi = self._span_bounds(*column)
+                done = taken.setdefault(column, np.zeros(len(spans), dtype=bool))
+                rows = np.sort(np.asarray(rows))
+                first = np.searchsorted(rows, lo, "left")
+                inside = np.searchsorted(rows, hi, "right") > first
+                hits = np.flatnonzero(inside & ~done)
+                done[hits] = True
+                candidates.extend(spans[i][2] for i in hits)
+            frontier = []
+            for key in candidates:
+                if key not in seen:
+                    seen.add(key)
+                    found.append(key)
+                    frontier.append(key)
+        return found
+
+    def __sizeof__(self) -> int:
+        """Rough footprint for the bounded caches."""
+        size = sum(
+            len(s) + len(c) + len(f) + 150 for (s, c), f in self.formulas.items()
+        )
+        size += sum(100 * len(refs) for refs in self.precedents.values())
+        size += sum(100 + 80 * len(deps) for deps in self.dependents.values())
+        return size + sum(100 * len(spans) for spans in self.range_dependents.values())
+
+
+# ───────────────────────────── Cell values ───────────────────────────────── #
+
+
+class SheetGrid:
+    """
+    A1-addressed view of a loaded sheet. Frames hold the first stored row as
+    their header, so `origin` (that row, `LazyWorkbook.header_row`) maps
+    Excel rows back onto frame rows. `errors` are the (row, col, token) cells
+    that type inference set aside; they read as their error token again.
+    """
+
+    def __init__(
+        self, df: pd.DataFrame, origin: int = 1, errors: list | None = None
+    ) -> None:
+        self.df = df
+        self.origin = origin
+        self.errors = {(row, col): token for row, col, token in errors or ()}
+        self.header = [
+            None if isinstance(c, str) and c.startswith("Unnamed: ") else c
+            for c in df.columns
+        ]
+
+    @classmethod
+    def for_sheet(cls, wb: LazyWorkbook, sheet: str) -> "SheetGrid":
+        # Same row the frame's header came from – the <dimension> can start
+        # above it (styled blank rows) and would shift every address
+        df = wb.sheet(sheet)
+        return cls(df, wb.header_row(sheet), wb.type_report(sheet).get("errors"))
+
+    def value(self, row: int, col: int):
+        if col < 1 or col > self.df.shape[1]:
+            return None
+        if row == self.origin:
+            return self.header[col - 1]
+        i = row - self.origin - 1
+        if i < 0 or i >= len(self.df):
+            return None
+        value = self.df.iat[i, col - 1]
+        if _is_missing(value):
+            return self.errors.get((i, col - 1))
+        return value.item() if isinstance(value, np.generic) else value
+
+    @property
+    def last_row(self) -> int:
+        return self.origin + len(self.df)
+
+    def block(self, ref: Ref) -> np.ndarray:
+        """
+        Values of `ref` as a 2-D object array (None for empty cells).
+        Whole-column references are cut off at the sheet's last used row.
+        """
+        if ref.max_row == MAX_ROW:
+            ref = ref._replace(max_row=max(ref.min_row, self.last_row))
+        shape = (ref.max_row - ref.min_row + 1, ref.max_col - ref.min_col + 1)
+        out = np.full(shape, None, dtype=object)
+        lo = max(ref.min_row, self.origin + 1)
+        hi = min(ref.max_row, self.origin + len(self.df))
+        c_lo, c_hi = ref.min_col, min(ref.max_col, self.df.shape[1])
+        if lo <= hi and c_lo <= c_hi:
+            rows = slice(lo - self.origin - 1, hi - self.origin)
+            data = self.df.iloc[rows, c_lo - 1:c_hi].to_numpy(dtype=object)
+            out[lo - ref.min_row:hi - ref.min_row + 1, :c_hi - c_lo + 1] = np.where(
+                pd.isna(data), None, data
+            )
+        if ref.min_row <= self.origin <= ref.max_row:
+            for col in range(c_lo, c_hi + 1):
+                out[self.origin - ref.min_row, col - ref.min_col] = self.header[col - 1]
+        for (i, j), token in self.errors.items():
+            row = i + self.origin + 1
+            if ref.min_row <= row <= ref.max_row and c_lo <= j + 1 <= c_hi:
+                out[row - ref.min_row, j + 1 - ref.min_col] = token
+        return out
+
+
+def _is_missing(value) -> bool:
+    if isinstance(value, (float, np.floating)):
+        return math.isnan(value)
+    return value is None or value is pd.NaT
+
+
+def format_value(value) -> str:
+    if _is_missing(value):
+        return "(empty)"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, np.integer)):
+        return f"{value:,}"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.2f}" if abs(value) >= 1 else f"{value:.4g}"
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    return str(value)
+
+
+# ──────────────────────────── Prompt context ─────────────────────────────── #
+
+
+def find_cell_reference(
+    question: str, sheet_names: list[str], default_sheet: str
+) -> CellKey | None:
+    """
+    The cell a question is about: "Sheet2!D15", "'P&L'!B5" or "cell D15"
+    (on the active sheet); with the word "formula", a bare "D15" also counts.
+    """
+    by_lower = {name.lower(): name for name in sheet_names}
+    for m in _QUESTION_REF_RE.finditer(question):
+        sheet = (
+            by_lower.get(_unquote(m["sheet"]).lower()) if m["sheet"] else default_sheet
+        )
+        if sheet is not None:
+            return sheet, f"{m['col'].upper()}{m['row']}"
+    if "formula" in question.lower():
+        m = _BARE_REF_RE.search(question)
+        if m:
+            return default_sheet, f"{m[1].upper()}{m[2]}"
+    return None
+
+
+def describe_cell(index: FormulaIndex, wb: LazyWorkbook, sheet: str, cell: str) -> str:
+    """
+    Plain-text context for explaining one cell: its formula, current value,
+    each precedent with its resolved value (and formula, if it has one) and
+    the cells that depend on it.
+    """
+    grids: dict[str, SheetGrid] = {}
+
+    def grid(name: str) -> SheetGrid | None:
+        if name not in wb:
+            return None
+        if name not in grids:
+            grids[name] = SheetGrid.for_sheet(wb, name)
+        return grids[name]
+
+    row, col = split_cell(cell)
+    own = grid(sheet)
+    lines = [
+        f"Cell: {qualified(sheet, cell)}",
+        f"Formula: {index.formula(sheet, cell)}",
+        f"Current value: {format_value(own.value(row, col) if own else None)}",
+    ]
+
+    precedents = index.precedents_of(sheet, cell)
+    if precedents:
+        lines.append("Precedents (cells this formula reads):")
+    budget = MAX_PRECEDENT_CELLS
+    for ref in precedents:
+        g = grid(ref.sheet)
+        if g is None:
+            lines.append(f"- {ref.label} (sheet not in this workbook)")
+            continue
+        if ref.size == 1:
+            value = format_value(g.value(ref.min_row, ref.min_col))
+            inner = index.formula(*next(ref.cells()))
+            lines.append(
+                f"- {ref.label} = {value}" + (f" (formula {inner})" if inner else "")
+            )
+            budget -= 1
+        else:
+            flat = [v for v in g.block(ref).ravel() if v is not None]
+            numbers = [
+                v for v in flat
+                if isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+            ]
+            shown = ", ".join(format_value(v) for v in flat[:MAX_RANGE_SAMPLES])
+            more = ", …" if len(flat) > MAX_RANGE_SAMPLES else ""
+            summary = f"{ref.size} cells, {len(flat)} filled"
+            if numbers:
+                summary += f", total {format_value(float(np.sum(numbers)))}"
+            lines.append(f"- {ref.label} ({summary}): {shown}{more}")
+            budget -= min(ref.size, MAX_RANGE_SAMPLES)
+        if budget <= 0:
+            lines.append("- … (further precedents omitted)")
+            break
+
+    dependents = index.dependents_of(sheet, cell)
+    if dependents:
+        names = ", ".join(qualified(s, c) for s, c in dependents[:MAX_PRECEDENT_CELLS])
+        extra = len(dependents) - MAX_PRECEDENT_CELLS
+        more = f" and {extra} more" if extra > 0 else ""
+        lines.append(f"Dependents (cells that use this one): {names}{more}")
+    return "\n".join(lines)
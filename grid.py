@@ -0,0 +1,212 @@
+"""
+grid.py – windows of a cached sheet for the assistant page's virtualized
+table: a block of rows × columns, optionally sorted by one column and
+filtered by a text match, as JSON-ready lists.
+
+Unsorted, unfiltered windows are positional slices of the stored frame
+(views – nothing is copied but the cells sent). A sort or filter is turned
+into an array of row positions once (`row_order`) and cached by the caller,
+so scrolling a sorted 100k-row sheet costs the same as the first page.
+"""
+import datetime
+import math
+from typing import Mapping, NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Largest window one request may ask for
+MAX_WINDOW_ROWS = 500
+MAX_WINDOW_COLUMNS = 100
+
+
+class GridQuery(NamedTuple):
+    start: int = 0
+    count: int = 100
+    col_start: int = 0
+    col_count: int = 20
+    sort: int | None = None  # column position
+    descending: bool = False
+    filter: str = ""  # case-insensitive substring
+    filter_col: int | None = None  # None → any column
+
+    @classmethod
+    def from_args(
+        cls, args: Mapping[str, str], columns: Sequence | None = None
+    ) -> "GridQuery":
+        """
+        Parse request args; raises ValueError on malformed numbers. With the
+        sheet's `columns`, `sort` / `filter_col` may also name a column, and a
+        position past the last column or an unknown name is an error.
+        """
+        def number(
+            name: str, default: int | None, low: int = 0, high: int | None = None
+        ) -> int | None:
+            raw = args.get(name, "")
+            if raw == "":
+                return default
+            value = int(raw)
+            if value < low:
+                raise ValueError(f"{name} must be ≥ {low}")
+            return min(value, high) if high is not None else value
+
+        def column(name: str) -> int | None:
+            raw = args.get(name, "").strip()
+            if columns is None or raw == "":
+                return number(name, None)
+            if raw.isdigit():  # positions win – the page only ever sends these
+                if int(raw) >= len(columns):
+                    raise ValueError(f"{name} must be < {len(columns)}")
+                return int(raw)
+            labels = [str(label).strip().lower() for label in columns]
+            if raw.lower() not in labels:
+                raise ValueError(f"{name}: no column named {raw!r}")
+            return labels.index(raw.lower())
+
+        defaults = cls()
+        return cls(
+            start=number("start", defaults.start),
+            count=number("count", defaults.count, 1, MAX_WINDOW_ROWS),
+            col_start=number("col_start", defaults.col_start),
+            col_count=number("col_count", defaults.col_count, 1, MAX_WINDOW_COLUMNS),
+            sort=column("sort"),
+            descending=args.get("desc", "") in ("1", "true"),
+            filter=args.get("filter", "").strip()[:200],
+            filter_col=column("filter_col"),
+        )
+
+    @property
+    def view(self) -> tuple:
+        """The part of the query that decides row order (cache key for `row_order`)."""
+        return self.sort, self.descending, self.filter.lower(), self.filter_col
+
+    @property
+    def is_plain(self) -> bool:
+        return self.sort is None and not self.filter
+
+
+def _text(col: pd.Series) -> pd.Series:
+    return col.astype(str).where(col.notna(), "").str.lower()
+
+
+def _matches(col: pd.Series, needle: str) -> np.ndarray:
+    """Rows whose cell text contains `needle` (already lower-case)."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        hits = _matches(pd.Series(col.cat.categories), needle)
+        return np.append(hits, False)[col.cat.codes.to_numpy()]  # code -1 = blank
+    types = pd.api.types
+    if not types.is_bool_dtype(col.dtype) and (
+        types.is_numeric_dtype(col.dtype) or types.is_datetime64_any_dtype(col.dtype)
+    ):
+        # Numbers and dates only ever match text with a digit in it
+        if not any(ch.isdigit() for ch in needle):
+            return np.zeros(len(col), dtype=bool)
+        return _text(col).str.contains(needle, regex=False).to_numpy()
+    hits = [u for u in col.dropna().unique() if needle in str(u).lower()]
+    return col.isin(hits).to_numpy()
+
+
+def row_order(df: pd.DataFrame, query: GridQuery) -> np.ndarray:
+    """Row positions matching the query's filter, in its sort order."""
+    positions = np.arange(len(df))
+    if query.filter:
+        needle = query.filter.lower()
+        columns = (
+            [query.filter_col]
+            if query.filter_col is not None and query.filter_col < df.shape[1]
+            else range(df.shape[1])
+        )
+        keep = np.zeros(len(df), dtype=bool)
+        for j in columns:
+            keep = keep | _matches(df.iloc[:, j], needle)
+        positions = positions[keep]
+    if query.sort is not None and query.sort < df.shape[1]:
+        col = df.iloc[positions, query.sort].reset_index(drop=True)
+        try:
+            ranked = col.sort_values(
+                ascending=not query.descending, kind="stable", na_position="last"
+            )
+        except TypeError:  # mixed numbers / text – compare as text
+            ranked = _text(col).where(col.notna()).sort_values(
+                ascending=not query.descending, kind="stable", na_position="last"
+            )
+        positions = positions[ranked.index.to_numpy()]
+    return positions
+
+
+def json_value(value):
+    """A cell as JSON: numbers stay numbers, blanks → null, dates → ISO text."""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, datetime.datetime):
+        midnight = value.time() == datetime.time()
+        return value.date().isoformat() if midnight else value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if value is pd.NA:
+        return None
+    return str(value)
+
+
+def _kind(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "date"
+    return "text"
+
+
+def sheet_window(
+    df: pd.DataFrame, types: dict | None, query: GridQuery,
+    order: np.ndarray | None = None,
+) -> dict:
+    """
+    One window of the sheet. `order` is `row_order(df, query)` for sorted /
+    filtered views (None → sheet order). Error cells the type inference set
+    aside are shown as their Excel token again.
+    """
+    matched = len(df) if order is None else len(order)
+    start = min(query.start, matched)
+    stop = min(start + query.count, matched)
+    col_start = min(query.col_start, df.shape[1])
+    col_stop = min(col_start + query.col_count, df.shape[1])
+
+    if order is None:
+        positions = np.arange(start, stop)
+        block = df.iloc[start:stop, col_start:col_stop]
+    else:
+        positions = order[start:stop]
+        block = df.iloc[positions, col_start:col_stop]
+
+    data = [[json_value(v) for v in row] for row in block.to_numpy(dtype=object)]
+    if types and types.get("errors"):
+        at = {int(p): i for i, p in enumerate(positions.tolist())}
+        for row, col, token in types["errors"]:
+            if row in at and col_start <= col < col_stop:
+                data[at[row]][col - col_start] = token
+
+    return {
+        "rows": matched,
+        "total_rows": len(df),
+        "total_columns": df.shape[1],
+        "start": start,
+        "col_start": col_start,
+        "columns": [
+            {
+                "index": j, "label": json_value(df.columns[j]),
+                "kind": _kind(df.dtypes.iloc[j]),
+            }
+            for j in range(col_start, col_stop)
+        ],
+        "row_ids": positions.tolist(),
+        "data": data,
+        "sampled": (types or {}).get("sampled"),
+    }
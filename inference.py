@@ -0,0 +1,199 @@
+"""
+inference.py – columnar type inference for loaded sheets. Readers hand over
+object columns (one boxed Python value per cell); this stage turns them into
+compact numpy / pandas dtypes one column at a time:
+
+• numbers, currency / percent / accounting strings ("$1,200", "12.5%",
+  "(300)") → int32 / float32 where the values survive the cast exactly,
+  else int64 / float64;
+• Excel dates and ISO date strings → datetime64;
+• all-TRUE/FALSE columns → bool;
+• repetitive text → category.
+
+Excel error tokens do not block a conversion: they become NaN and are kept
+in the report as (row, column, token) triples so data-quality scans, the
+preview and cell lookups still see them. A column with any other stray text
+is left as it is.
+"""
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+from quality import ERROR_TOKENS
+
+# Text columns become categorical when they have at least this many rows and
+# at most this share of distinct values
+CATEGORY_MIN_ROWS = 32
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+_NUMBER_KINDS = {"integer", "floating", "mixed-integer-float", "decimal"}
+_DATE_KINDS = {"datetime", "datetime64", "date"}
+
+_NUMBER_TEXT_RE = re.compile(
+    r"(?P<open>\()?\s*(?P<sign>[-+])?\s*[$€£¥]?\s*(?P<sign2>[-+])?\s*"
+    r"(?P<digits>\d[\d,]*(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?\s*(?P<pct>%)?\s*(?P<close>\))?"
+)
+_NUMBER_STRIP_RE = r"[()$€£¥,%\s+]"
+_ISO_DATE_RE = r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"
+
+
+def _parse_number_text(text: pd.Series) -> pd.Series | None:
+    """
+    Vectorised "$1,234.50" / "(12)" / "7.5%" → float; None if any value is
+    not a number.
+    """
+    if not text.str.fullmatch(_NUMBER_TEXT_RE.pattern).all():
+        return None
+    parts = text.str.extract(_NUMBER_TEXT_RE.pattern)
+    if not parts["open"].isna().eq(parts["close"].isna()).all():  # unbalanced "(12"
+        return None
+    stripped = text.str.replace(_NUMBER_STRIP_RE, "", regex=True)
+    numbers = pd.to_numeric(stripped, errors="coerce")
+    if numbers.isna().any():
+        return None
+    negative = parts["open"].notna() | parts["sign"].eq("-") | parts["sign2"].eq("-")
+    numbers = numbers.abs().where(~negative, -numbers.abs())
+    return numbers.where(parts["pct"].isna(), numbers / 100).astype(float)
+
+
+def _compact_numbers(values: pd.Series, integers: bool) -> pd.Series:
+    """Smallest dtype that holds every value exactly (NaN forces a float)."""
+    array = values.to_numpy(dtype=float)
+    if integers and not np.isnan(array).any():
+        for dtype in (np.int32, np.int64):
+            info = np.iinfo(dtype)
+            if array.min(initial=0) >= info.min and array.max(initial=0) <= info.max:
+                return pd.Series(array.astype(dtype), index=values.index)
+    with np.errstate(over="ignore", invalid="ignore"):
+        narrow = array.astype(np.float32)
+    if np.array_equal(narrow.astype(float), array, equal_nan=True):
+        return pd.Series(narrow, index=values.index)
+    return pd.Series(array, index=values.index)
+
+
+def _infer_column(col: pd.Series) -> tuple[pd.Series, dict | None, np.ndarray]:
+    """
+    (converted column, change record or None, positions of error tokens that
+    were replaced by NaN).
+    """
+    none = np.empty(0, dtype=np.intp)
+    if col.dtype != object and not isinstance(col.dtype, pd.StringDtype):
+        return col, None, none
+    present = col.notna().to_numpy()
+    errors = col.isin(ERROR_TOKENS).to_numpy()
+    values = col[present & ~errors]
+    if values.empty:
+        return col, None, none
+
+    kind = infer_dtype(values, skipna=False)
+    converted, parsed, integers = None, 0, False
+    if kind in _NUMBER_KINDS:
+        converted, integers = pd.to_numeric(values), kind == "integer"
+    elif kind in _DATE_KINDS:
+        try:
+            converted = pd.to_datetime(values)
+        except (TypeError, ValueError, OverflowError):
+            converted = None
+    elif kind in ("string", "mixed-integer", "mixed"):
+        is_text = (
+            np.ones(len(values), dtype=bool) if kind == "string"
+            else values.map(type).eq(str).to_numpy()
+        )
+        if kind == "string" or (
+            infer_dtype(values[~is_text], skipna=False) in _NUMBER_KINDS
+        ):
+            text = values.astype(str).str.strip()
+            blank = text.eq("").to_numpy()
+            text, values = text[~blank], values[~blank]
+            if not text.empty:
+                converted = _parse_number_text(text)
+                if converted is not None:
+                    parsed = int(is_text[~blank].sum())
+                elif kind == "string" and text.str.fullmatch(_ISO_DATE_RE).all():
+                    converted = pd.to_datetime(text, format="ISO8601", errors="coerce")
+                    converted = None if converted.isna().any() else converted
+                    parsed = len(text) if converted is not None else 0
+    elif kind == "boolean" and not errors.any() and present.all():
+        converted = values.astype(bool)
+
+    if converted is None:
+        if kind == "string" and not errors.any() and _is_repetitive(values, len(col)):
+            out = col.astype("category")
+            change = {"from": str(col.dtype), "to": "category"}
+            return out, {**change, "parsed": 0, "errors": 0}, none
+        return col, None, none
+
+    if pd.api.types.is_datetime64_any_dtype(converted):
+        out = pd.Series(pd.NaT, index=col.index, dtype=converted.dtype)
+        out[converted.index] = converted
+    elif converted.dtype == bool:
+        out = converted.reindex(col.index)
+    else:
+        full = pd.Series(np.nan, index=col.index)
+        full[converted.index] = converted.astype(float)
+        out = _compact_numbers(full, integers and len(converted) == len(col))
+    change = {
+        "from": str(col.dtype), "to": str(out.dtype), "parsed": parsed,
+        "errors": int(errors.sum()),
+    }
+    return out, change, np.flatnonzero(errors)
+
+
+def _is_repetitive(values: pd.Series, rows: int) -> bool:
+    if rows < CATEGORY_MIN_ROWS:
+        return False
+    try:
+        return values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * rows
+    except TypeError:  # unhashable cell values
+        return False
+
+
+def infer_types(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Convert a freshly loaded sheet to compact dtypes. Returns the new frame
+    and a JSON-safe report:
+
+        {"columns": [{"column": "Revenue", "from": "object", "to": "float32",
+                      "parsed": 3, "errors": 1}, …],
+         "errors": [[row, col, "#DIV/0!"], …],   # 0-based frame positions
+         "bytes_before": …, "bytes_after": …}
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    columns, changes, errors = {}, [], []
+    for j in range(df.shape[1]):
+        out, change, error_rows = _infer_column(df.iloc[:, j])
+        columns[j] = out
+        if change is not None:
+            changes.append({"column": str(df.columns[j]), **change})
+            tokens = df.iloc[error_rows, j].tolist()
+            rows = error_rows.tolist()
+            errors.extend([int(r), j, t] for r, t in zip(rows, tokens, strict=True))
+
+    if changes:
+        typed = pd.DataFrame(columns, index=df.index)
+        typed.columns = df.columns
+    else:
+        typed = df
+    after = int(typed.memory_usage(deep=True).sum()) if changes else before
+    report = {
+        "columns": changes, "errors": errors,
+        "bytes_before": before, "bytes_after": after,
+    }
+    if changes:
+        logging.info(
+            "Typed %d of %d columns – %.1f MB → %.1f MB",
+            len(changes), df.shape[1], before / 2**20, after / 2**20,
+        )
+    return typed, report
+
+
+def restore_errors(df: pd.DataFrame, report: dict | None) -> pd.DataFrame:
+    """Object copy of `df` with the report's error tokens put back (small frames)."""
+    out = df.astype(object)
+    for row, col, token in (report or {}).get("errors", ()):
+        if row < len(out):
+            out.iat[row, col] = token
+    return out
@@ -0,0 +1,549 @@
+"""
+ingest.py – single-pass .xlsx ingestion. Streams each worksheet's XML once and
+collects both the cached cell values (→ DataFrame, like
+`pd.read_excel(dtype=object)`) and the cell formulas (→ compact
+{cell: formula} map), so the file is never parsed twice and no full openpyxl
+Workbook object model is ever built.
+
+`LazyWorkbook` goes one step further: an upload only reads the sheet list and
+each sheet's dimensions, and individual tabs are parsed on first use. Loaded
+tabs go through `inference.infer_types`, so cached frames hold compact
+numeric / datetime / category columns instead of boxed Python objects.
+
+Values match `pd.read_excel` / openpyxl with one intended difference: a cached
+error result such as "#DIV/0!" is kept as its token string, where pandas
+reads NaN, so `infer_types` and quality.py can report the cell instead of
+taking it for a blank.
+"""
+import io
+import posixpath
+import sys
+import threading
+import zipfile
+from typing import IO, Callable, Iterator
+from xml.etree.ElementTree import ParseError, iterparse
+
+import numpy as np
+import pandas as pd
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+from inference import infer_types
+from telemetry import span
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _local(tag: str) -> str:
+    """Strip the XML namespace – transitional and strict OOXML differ."""
+    return tag[tag.rfind("}") + 1:]
+
+
+def _children(elem, name: str) -> Iterator:
+    return (child for child in elem if _local(child.tag) == name)
+
+
+def _text(elem) -> str:
+    """Concatenate all <t> runs below `elem` (rich text, skipping phonetics)."""
+    parts = []
+    for child in elem:
+        tag = _local(child.tag)
+        if tag == "t":
+            parts.append(child.text or "")
+        elif tag == "r":
+            parts.extend(t.text or "" for t in _children(child, "t"))
+    return "".join(parts)
+
+
+_COLUMN_INDEX: dict[str, int] = {}
+
+
+def column_index(ref: str) -> int:
+    """1-based column of an A1 reference, memoised per column letter."""
+    letters = ref.rstrip("0123456789")
+    idx = _COLUMN_INDEX.get(letters)
+    if idx is None:
+        idx = _COLUMN_INDEX[letters] = column_index_from_string(letters)
+    return idx
+
+
+def _cast_number(raw: str) -> int | float:
+    """Same rule as pandas' openpyxl reader: integral numbers become int."""
+    value = float(raw)
+    return int(value) if value.is_integer() and abs(value) < 2**53 else value
+
+
+class XlsxReader:
+    """
+    Minimal streaming reader for the parts of .xlsx we need: sheet list,
+    shared strings, date styles, cell values and formulas.
+    Raises BadZipFile / KeyError / ValueError on malformed files.
+    """
+
+    def __init__(self, source: str | IO[bytes]) -> None:
+        self.zip = zipfile.ZipFile(source)
+        self.epoch = CALENDAR_WINDOWS_1900
+        self.sheet_paths = self._read_workbook()
+        self.shared_strings = self._read_shared_strings()
+        self.date_styles = self._read_date_styles()
+        self.header_rows: dict[str, int] = {}  # Excel row of each read sheet's header
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def __enter__(self) -> "XlsxReader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def sheet_names(self) -> list[str]:
+        return list(self.sheet_paths)
+
+    # ── workbook-level parts ── #
+
+    def _read_workbook(self) -> dict[str, str]:
+        rels = {}
+        with self.zip.open("xl/_rels/workbook.xml.rels") as fh:
+            for _, elem in iterparse(fh):
+                if _local(elem.tag) == "Relationship":
+                    target = elem.get("Target", "")
+                    rels[elem.get("Id")] = (
+                        target.lstrip("/") if target.startswith("/")
+                        else posixpath.normpath(posixpath.join("xl", target))
+                    )
+
+        paths = {}
+        with self.zip.open("xl/workbook.xml") as fh:
+            for _, elem in iterparse(fh):
+                tag = _local(elem.tag)
+                if tag == "workbookPr" and elem.get("date1904") in ("1", "true"):
+                    self.epoch = CALENDAR_MAC_1904
+                elif tag == "sheet":
+                    rid = elem.get(f"{{{REL_NS}}}id") or elem.get("id")
+                    if rid in rels:
+                        paths[elem.get("name")] = rels[rid]
+        if not paths:
+            raise ValueError("Workbook contains no worksheets")
+        return paths
+
+    def _read_shared_strings(self) -> list[str]:
+        if "xl/sharedStrings.xml" not in self.zip.namelist():
+            return []
+        strings = []
+        with self.zip.open("xl/sharedStrings.xml") as fh:
+            for _, elem in iterparse(fh):
+                if _local(elem.tag) == "si":
+                    strings.append(_text(elem))
+                    elem.clear()
+        return strings
+
+    def _read_date_styles(self) -> set[int]:
+        """Indices of cellXfs entries whose number format is a date/time."""
+        if "xl/styles.xml" not in self.zip.namelist():
+            return set()
+        custom: dict[int, str] = {}
+        xf_formats: list[int] = []
+        in_cell_xfs = False
+        with self.zip.open("xl/styles.xml") as fh:
+            for event, elem in iterparse(fh, events=("start", "end")):
+                tag = _local(elem.tag)
+                if tag == "cellXfs":
+                    in_cell_xfs = event == "start"
+                elif event == "end" and tag == "numFmt":
+                    custom[int(elem.get("numFmtId"))] = elem.get("formatCode", "")
+                elif event == "end" and tag == "xf" and in_cell_xfs:
+                    xf_formats.append(int(elem.get("numFmtId", 0)))
+        codes = (custom.get(f) or BUILTIN_FORMATS.get(f, "General") for f in xf_formats)
+        return {i for i, code in enumerate(codes) if is_date_format(code)}
+
+    # ── worksheets ── #
+
+    def dimension(self, sheet: str) -> str | None:
+        """
+        The sheet's used range (e.g. "A1:D13") from its <dimension> element,
+        which precedes the cell data – only the first few bytes are parsed.
+        """
+        with self.zip.open(self.sheet_paths[sheet]) as fh:
+            for _, elem in iterparse(fh, events=("start",)):
+                tag = _local(elem.tag)
+                if tag == "dimension":
+                    return elem.get("ref")
+                if tag == "sheetData":
+                    return None
+        return None
+
+    def _convert(self, kind: str, raw: str | None, style: int, inline: str | None):
+        if kind == "inlineStr":
+            return inline
+        if raw is None:
+            return None
+        if kind == "s":
+            return self.shared_strings[int(raw)]
+        if kind in ("str", "e"):
+            return raw  # formula string result / error token such as "#N/A"
+        if kind == "b":
+            return raw in ("1", "true")
+        if kind == "d":
+            return pd.Timestamp(raw).to_pydatetime()
+        if style in self.date_styles:
+            return from_excel(float(raw), self.epoch)
+        return _cast_number(raw)
+
+    def iter_cells(self, sheet: str) -> Iterator[tuple[int, int, object, str | None]]:
+        """
+        Yield (row, col, value, formula) for every stored cell, 1-based.
+        Shared formulas are expanded to each dependent cell's own references.
+        """
+        shared: dict[str, tuple[str, str]] = {}
+        row_idx = 0
+        tags = None
+        with self.zip.open(self.sheet_paths[sheet]) as fh:
+            # Work row by row on "end" events only and compare fully
+            # qualified tags – this loop runs once per cell
+            for _, row in iterparse(fh):
+                if tags is None:
+                    ns = row.tag[:row.tag.rfind("}") + 1]
+                    tags = row_tag, c_tag, v_tag, f_tag, is_tag = (
+                        f"{ns}row", f"{ns}c", f"{ns}v", f"{ns}f", f"{ns}is"
+                    )
+                if row.tag != row_tag:
+                    continue
+                r = row.get("r")
+                row_idx = int(r) if r else row_idx + 1
+                col_idx = 0
+                for cell in row:
+                    if cell.tag != c_tag:
+                        continue
+                    ref = cell.get("r")
+                    if ref:
+                        col_idx = column_index(ref)
+                    else:
+                        col_idx += 1
+                        ref = f"{get_column_letter(col_idx)}{row_idx}"
+
+                    raw = formula = inline = None
+                    for child in cell:
+                        if child.tag == v_tag:
+                            raw = child.text
+                        elif child.tag == f_tag:
+                            formula = self._formula(child, ref, shared)
+                        elif child.tag == is_tag:
+                            inline = _text(child)
+
+                    value = self._convert(
+                        cell.get("t", "n"), raw, int(cell.get("s", 0)), inline
+                    )
+                    if value is not None or formula is not None:
+                        yield row_idx, col_idx, value, formula
+                row.clear()
+
+    @staticmethod
+    def _formula(f, ref: str, shared: dict[str, tuple[str, str]]) -> str | None:
+        text = f.text
+        if f.get("t") == "shared":
+            si = f.get("si")
+            if text:
+                shared[si] = (ref, f"={text}")
+            elif si in shared:
+                origin, master = shared[si]
+                return Translator(master, origin=origin).translate_formula(ref)
+            else:
+                return None
+        return f"={text}" if text else None
+
+    def read_sheet(self, sheet: str) -> tuple[pd.DataFrame, dict[str, str]]:
+        """Return (values DataFrame with a header row, {cell: formula})."""
+        rows: dict[int, dict[int, object]] = {}
+        formulas: dict[str, str] = {}
+        max_col = 0
+        for r, c, value, formula in self.iter_cells(sheet):
+            if formula is not None:
+                formulas[f"{get_column_letter(c)}{r}"] = formula
+            if value is not None:
+                rows.setdefault(r, {})[c] = value
+                max_col = max(max_col, c)
+        self.header_rows[sheet] = min(rows, default=1)
+        return _to_frame(rows, max_col), formulas
+
+    def read_formulas(self, sheet: str) -> dict[str, str]:
+        """{cell: formula} only – no values are kept and no frame is built."""
+        return {
+            f"{get_column_letter(c)}{r}": formula
+            for r, c, _, formula in self.iter_cells(sheet)
+            if formula is not None
+        }
+
+    def iter_row_chunks(
+        self, sheet: str, chunk_rows: int
+    ) -> Iterator[tuple[int, pd.DataFrame]]:
+        """
+        Values only, `chunk_rows` sheet rows at a time: yields (offset, frame)
+        where offset is the 0-based data-row position of the frame's first
+        row (the first stored row is the header, as in `read_sheet`). Only
+        one chunk is held at a time; a run of empty rows longer than a chunk
+        is skipped rather than filled in.
+        """
+        dim = self.dimension(sheet)
+        width = column_index(dim.split(":")[-1]) if dim else 0
+        header: list | None = None
+        first = start = 0
+        rows: dict[int, dict[int, object]] = {}
+        for r, c, value, _ in self.iter_cells(sheet):
+            if value is None:
+                continue
+            if header is None:
+                first, start, header = r, r + 1, []
+                self.header_rows[sheet] = r
+            if r == first:
+                header.append((c, value))
+                width = max(width, c)
+                continue
+            if r - start >= chunk_rows:
+                if rows:
+                    yield start - first - 1, _chunk_frame(rows, start, header, width)
+                start += (r - start) // chunk_rows * chunk_rows
+                rows = {}
+            rows.setdefault(r, {})[c] = value
+            width = max(width, c)
+        if rows:
+            yield start - first - 1, _chunk_frame(rows, start, header, width)
+
+
+def _chunk_frame(
+    rows: dict[int, dict[int, object]], start: int, header: list, width: int
+) -> pd.DataFrame:
+    """Rows start … max(rows) as a DataFrame under the sheet's header."""
+    cells = dict(header)
+    labels = _header_labels([cells.get(c) for c in range(1, width + 1)])
+    data = np.full((max(rows) - start + 1, width), np.nan, dtype=object)
+    for r, values in rows.items():
+        for c, value in values.items():
+            data[r - start, c - 1] = value
+    return pd.DataFrame(data, columns=labels)
+
+
+def _header_labels(header: list) -> list:
+    """Mirror pandas: blank headers → "Unnamed: i", duplicates → "name.1"."""
+    labels, seen = [], {}
+    for i, value in enumerate(header):
+        label = f"Unnamed: {i}" if value is None else value
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        labels.append(label)
+    return labels
+
+
+def _to_frame(rows: dict[int, dict[int, object]], max_col: int) -> pd.DataFrame:
+    """Turn sparse {row: {col: value}} into a header + data DataFrame."""
+    if not rows:
+        return pd.DataFrame()
+    first, last = min(rows), max(rows)
+    header_cells = rows[first]
+    header = _header_labels([header_cells.get(c) for c in range(1, max_col + 1)])
+
+    data = np.full((last - first, max_col), np.nan, dtype=object)
+    for r, cells in rows.items():
+        if r == first:
+            continue
+        for c, value in cells.items():
+            data[r - first - 1, c - 1] = value
+    return pd.DataFrame(data, columns=header)
+
+
+def read_xlsx(data: IO[bytes] | str) -> dict:
+    """
+    Single streaming pass over every worksheet.
+    Returns {"sheets": {name: DataFrame}, "formulas": {name: {cell: formula}}}.
+    """
+    sheets, formulas = {}, {}
+    with XlsxReader(data) as reader:
+        for name in reader.sheet_names:
+            sheets[name], formulas[name] = reader.read_sheet(name)
+    return {"sheets": sheets, "formulas": formulas}
+
+
+class LazyWorkbook:
+    """
+    Sheet index + on-demand sheet loading. `sheet(name)` materialises a tab
+    the first time it is requested (thread-safe, so a background prefetch and
+    a /switch-sheet never parse the same sheet twice) and keeps the result.
+
+    `loader(name)` must return (DataFrame, {cell: formula}) with raw values,
+    which are typed here, or (DataFrame, formulas, type report) for a frame
+    that was typed before (e.g. read back from the disk store). The report's
+    "header_row" is the Excel row of the frame's header (see `header_row`).
+    """
+
+    def __init__(
+        self,
+        sheet_names: list[str],
+        dimensions: dict[str, str | None] | None = None,
+        loader: Callable[[str], tuple[pd.DataFrame, dict[str, str]]] | None = None,
+        has_formulas: bool = True,
+    ) -> None:
+        self.sheet_names = list(sheet_names)
+        self.dimensions = dimensions or {}
+        self.has_formulas = has_formulas
+        self.source: bytes | None = None  # raw .xlsx bytes, if sheets can be re-read
+        self.reader: XlsxReader | None = None
+        self._loader = loader
+        self._frames: dict[str, pd.DataFrame] = {}
+        self._formulas: dict[str, dict[str, str]] = {}
+        self._types: dict[str, dict] = {}  # infer_types report per loaded sheet
+        self._locks = {name: threading.Lock() for name in self.sheet_names}
+
+    @classmethod
+    def from_xlsx(cls, data: bytes) -> "LazyWorkbook":
+        """Index an .xlsx – reads workbook metadata and dimensions only."""
+        with span("index_workbook"):
+            reader = XlsxReader(io.BytesIO(data))
+            dims = {name: reader.dimension(name) for name in reader.sheet_names}
+        wb = cls(reader.sheet_names, dims, loader=reader.read_sheet)
+        wb.source, wb.reader = data, reader
+        return wb
+
+    @classmethod
+    def from_frames(
+        cls,
+        sheets: dict[str, pd.DataFrame],
+        formulas: dict[str, dict[str, str]] | None = None,
+        types: dict[str, dict] | None = None,
+    ) -> "LazyWorkbook":
+        """
+        Wrap already-loaded frames (e.g. legacy .xls via pandas). Frames are
+        typed here unless their type reports are passed in.
+        """
+        dims = {
+            name: f"A1:{get_column_letter(max(df.shape[1], 1))}{df.shape[0] + 1}"
+            for name, df in sheets.items()
+        }
+        wb = cls(list(sheets), dims, has_formulas=formulas is not None)
+        for name, df in sheets.items():
+            if types is not None and name in types:
+                wb._frames[name], wb._types[name] = df, types[name]
+            else:
+                wb._frames[name], wb._types[name] = infer_types(df)
+        wb._formulas = dict(formulas or {})
+        return wb
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._locks
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._frames
+
+    def loaded_sheets(self) -> list[str]:
+        return [name for name in self.sheet_names if name in self._frames]
+
+    def _ensure(self, name: str) -> None:
+        if name in self._frames:
+            return
+        with self._locks[name]:  # KeyError for unknown sheets
+            if name in self._frames:
+                return
+            with span("parse_sheet"):
+                loaded = self._loader(name)
+            df, formulas = loaded[:2]
+            types = loaded[2] if len(loaded) > 2 else None
+            if types is None:
+                with span("infer_types"):
+                    df, types = infer_types(df)
+            if self.reader is not None and name in self.reader.header_rows:
+                types.setdefault("header_row", self.reader.header_rows[name])
+            self._formulas[name] = formulas
+            self._types[name] = types
+            self._frames[name] = df
+
+    def preload(
+        self, name: str, df: pd.DataFrame, formulas: dict[str, str] | None,
+        types: dict | None = None,
+    ) -> None:
+        """Install a sheet parsed (and typed) elsewhere, e.g. in a worker process."""
+        with self._locks[name]:
+            self._formulas[name] = formulas or {}
+            self._types[name] = types or {}
+            self._frames[name] = df
+
+    def sheet(self, name: str) -> pd.DataFrame:
+        self._ensure(name)
+        return self._frames[name]
+
+    def formulas(self, name: str) -> dict[str, str] | None:
+        """{cell: formula} for `name`, or None if the format has no formulas."""
+        if not self.has_formulas:
+            return None
+        self._ensure(name)
+        return self._formulas.get(name, {})
+
+    def scan_formulas(self, name: str) -> dict[str, str] | None:
+        """
+        Like `formulas`, but a sheet that is not loaded yet is not loaded: its
+        XML is streamed once for the formula cells alone, without building or
+        typing a frame. None if the format has no formulas.
+        """
+        if not self.has_formulas:
+            return None
+        reader = self.reader
+        if reader is None or name in self._frames:
+            return self.formulas(name)
+        return reader.read_formulas(name)
+
+    def header_row(self, name: str) -> int:
+        """
+        Excel row holding the sheet's header – the first stored row; frame
+        row i is Excel row `header_row + 1 + i`.
+        """
+        return self.type_report(name).get("header_row", 1)
+
+    def type_report(self, name: str) -> dict:
+        """What `infer_types` changed in `name` – converted columns, error cells."""
+        self._ensure(name)
+        return self._types.get(name, {})
+
+    def __sizeof__(self) -> int:
+        """Approximate footprint – picked up by the bounded caches."""
+        size = len(self.source or b"")
+        frames = list(self._frames.values())
+        size += sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+        size += sum(
+            sum(len(k) + len(v) + 100 for k, v in cells.items())
+            for cells in list(self._formulas.values())
+        )
+        size += sum(100 * len(t.get("errors", ())) for t in list(self._types.values()))
+        if self.reader is not None:
+            size += sum(sys.getsizeof(s) for s in self.reader.shared_strings)
+        return size
+
+
+def parse_workbook(data: bytes, filename: str) -> LazyWorkbook:
+    """
+    Index raw Excel bytes: for .xlsx only the sheet list and dimensions are
+    read here, and each sheet (values + {cell: formula} map) is streamed on
+    first use. Raises ValueError / BadZipFile if the file is unreadable.
+    """
+    if filename.lower().endswith(".xlsx"):
+        try:
+            return LazyWorkbook.from_xlsx(data)
+        except (KeyError, ParseError) as exc:
+            raise ValueError(f"Malformed .xlsx – {exc}") from exc
+
+    # Legacy .xls – values only, no formula metadata
+    sheets: dict[str, pd.DataFrame] = pd.read_excel(
+        io.BytesIO(data), sheet_name=None, dtype=object
+    )
+    return LazyWorkbook.from_frames(sheets)
+
+
+def load_sheet(wb: LazyWorkbook, name: str) -> pd.DataFrame:
+    """Materialise one sheet, mapping XML-level failures to ValueError."""
+    try:
+        return wb.sheet(name)
+    except (KeyError, ParseError) as exc:
+        raise ValueError(f"Unreadable sheet {name!r} – {exc}") from exc
@@ -0,0 +1,193 @@
+"""
+jobs.py – background job pipeline for uploads. Parsing + profiling run in a
+process pool (CPU-bound, off the request thread), the LLM wait runs on an
+I/O thread pool, and job state lives in a local SQLite file so any worker
+can answer status polls. Jobs left behind by a worker that died are failed
+once they go stale, and a crashed pool process is replaced.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from ingest import LazyWorkbook, load_sheet, parse_workbook
+from profiling import process_dataframe
+
+JOB_DB = os.getenv(
+    "JOB_DB", os.path.join(tempfile.gettempdir(), "docubridge-jobs.sqlite3")
+)
+JOB_PROCESSES = int(os.getenv("JOB_PROCESSES", 2))
+JOB_IO_THREADS = int(os.getenv("JOB_IO_THREADS", 8))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", 24 * 60 * 60))
+# A queued / running job that has not moved for this long lost its worker
+# (restart, crash) and is reported as failed
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", 15 * 60))
+STALE_JOB_ERROR = "The server restarted before this upload finished. Please try again."
+
+# queued → running (stage: parsing / asking) → done | failed
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobStore:
+    """Tiny SQLite-backed job table; one short-lived connection per call."""
+
+    def __init__(
+        self, path: str = JOB_DB, stale_after: float = JOB_STALE_SECONDS
+    ) -> None:
+        self.path = path
+        self.stale_after = stale_after
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT,"
+                " created REAL NOT NULL, updated REAL NOT NULL,"
+                " result TEXT, error TEXT)"
+            )
+        self.fail_stale()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def create(self) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM jobs WHERE updated < ?", (now - JOB_TTL_SECONDS,)
+            )
+            db.execute(
+                "INSERT INTO jobs (id, status, created, updated)"
+                " VALUES (?, 'queued', ?, ?)",
+                (job_id, now, now),
+            )
+        return job_id
+
+    def update(self, job_id: str, status: str, stage: str | None = None,
+               result: dict | None = None, error: str | None = None) -> None:
+        if status not in STATUSES:
+            raise ValueError(f"Unknown job status: {status}")
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, result = ?, error = ?,"
+                " updated = ? WHERE id = ?",
+                (status, stage, json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id),
+            )
+
+    def fail_stale(self, job_id: str | None = None) -> int:
+        """
+        Mark queued / running jobs (or just `job_id`) that have not been
+        updated for `stale_after` seconds as failed; returns how many.
+        """
+        now = time.time()
+        sql = (
+            "UPDATE jobs SET status = 'failed', error = ?, updated = ?"
+            " WHERE status IN ('queued', 'running') AND updated < ?"
+        )
+        params: tuple = (STALE_JOB_ERROR, now, now - self.stale_after)
+        if job_id is not None:
+            sql, params = sql + " AND id = ?", (*params, job_id)
+        with self._connect() as db:
+            return db.execute(sql, params).rowcount
+
+    def get(self, job_id: str) -> dict | None:
+        job = self._get(job_id)
+        stale = time.time() - self.stale_after
+        if job and job["status"] in ("queued", "running") and job["updated"] < stale:
+            self.fail_stale(job_id)
+            job = self._get(job_id)
+        return job
+
+    def _get(self, job_id: str) -> dict | None:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT id, status, stage, created, updated, result, error"
+                " FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "stage", "created", "updated", "result", "error")
+        job = dict(zip(keys, row, strict=True))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+# ───────────────────────────── Worker pools ──────────────────────────────── #
+
+_process_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+IO_POOL = ThreadPoolExecutor(max_workers=JOB_IO_THREADS, thread_name_prefix="job-io")
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Created lazily (after gunicorn forks) with spawn – safe alongside threads."""
+    global _process_pool
+    if _process_pool is None:
+        with _pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=JOB_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _process_pool
+
+
+def run_in_process(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    `fn(*args)` in the process pool, blocking for the result; its exceptions
+    are re-raised here. A worker that dies (BrokenProcessPool) breaks the
+    whole pool, so it is dropped and the next job starts a fresh one.
+    """
+    global _process_pool
+    pool = process_pool()
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _process_pool is pool:
+                _process_pool = None
+        pool.shutdown(wait=False)
+        raise
+
+
+def ingest_and_profile(data: bytes, filename: str) -> dict:
+    """
+    Runs in a worker process: index the workbook, parse + profile its first
+    sheet, and return a picklable snapshot for `restore_workbook`.
+    """
+    wb = parse_workbook(data, filename)
+    first = wb.sheet_names[0]
+    df = load_sheet(wb, first)
+    snapshot = {
+        "sheet": first,
+        "df": df,
+        "formulas": wb.formulas(first),
+        "types": wb.type_report(first),
+        "meta": process_dataframe(df, wb.type_report(first)),
+    }
+    if wb.source is None:  # .xls – everything is already in memory
+        snapshot["frames"] = {name: wb.sheet(name) for name in wb.sheet_names}
+        snapshot["frame_types"] = {n: wb.type_report(n) for n in wb.sheet_names}
+    return snapshot
+
+
+def restore_workbook(data: bytes, filename: str, snapshot: dict) -> LazyWorkbook:
+    """Rebuild the LazyWorkbook in the web process from a worker's snapshot."""
+    if "frames" in snapshot:
+        return LazyWorkbook.from_frames(
+            snapshot["frames"], types=snapshot["frame_types"]
+        )
+    wb = parse_workbook(data, filename)  # index only – cheap for .xlsx
+    wb.preload(
+        snapshot["sheet"], snapshot["df"], snapshot["formulas"], snapshot["types"]
+    )
+    return wb
@@ -0,0 +1,334 @@
+"""
+llm.py – shared, long-lived chat client used by every route. One module-level
+`LLMClient` wraps a pluggable backend (real Cohere over a pooled keep-alive
+HTTP connection, or an offline fake) and adds per-call timeouts, jittered
+retries on transient errors, a concurrency cap with backpressure, and
+latency metrics. Streaming is exposed as a plain iterator of text chunks so
+routes can relay tokens over Server-Sent Events.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator
+
+import cohere
+import httpx
+
+from telemetry import LLM_SECONDS, PROMPT_CHARS, REGISTRY, record_span, span
+
+MODEL = "command-r"
+
+# "cohere" (default) or "fake" – the fake needs no network or API key
+LLM_BACKEND = os.getenv("LLM_BACKEND", "cohere")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))              # seconds per call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))  # wait for a free slot
+
+# HTTP statuses worth retrying: timeouts, rate limiting, upstream hiccups
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(Exception):
+    """No slot freed up in time, or every retry failed."""
+
+
+class FakeChatClient:
+    """
+    Offline stand-in for `cohere.Client` with the same `chat` / `chat_stream`
+    surface. Answers are deterministic, so pages and streams can be exercised
+    without an API key; `token_delay` simulates generation speed.
+    """
+
+    def __init__(
+        self, answer: str | None = None, token_delay: float = 0.0, failures: int = 0
+    ) -> None:
+        self.answer = answer
+        self.token_delay = token_delay
+        self.failures = failures  # first N calls raise TimeoutError (retry testing)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            if self.failures > 0:
+                self.failures -= 1
+                raise TimeoutError("simulated upstream timeout")
+
+    def _reply(self, message: str) -> str:
+        if self.answer is not None:
+            return self.answer
+        question = re.search(r'question: "(.*)"', message, re.S)
+        topic = question.group(1) if question else message[:80]
+        return (
+            f"**Offline answer** to: _{topic}_\n\n"
+            f"- Prompt size: {len(message)} characters\n"
+            "- Set `LLM_BACKEND=cohere` for real answers."
+        )
+
+    def chat(self, message: str = "", **_) -> SimpleNamespace:
+        self._start_call()
+        if self.token_delay:
+            time.sleep(self.token_delay * len(self._reply(message).split()))
+        return SimpleNamespace(text=self._reply(message))
+
+    def chat_stream(self, message: str = "", **_) -> Iterator[SimpleNamespace]:
+        self._start_call()
+        yield SimpleNamespace(event_type="stream-start")
+        for token in re.findall(r"\S+\s*|\s+", self._reply(message)):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield SimpleNamespace(event_type="text-generation", text=token)
+        yield SimpleNamespace(event_type="stream-end", finish_reason="COMPLETE")
+
+
+# ─────────────────────────────── Backends ────────────────────────────────── #
+
+
+def _cohere_backend() -> Any:
+    """Cohere SDK client on one keep-alive httpx pool (no per-request TLS)."""
+    http = httpx.Client(
+        timeout=LLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONCURRENCY,
+            max_keepalive_connections=LLM_MAX_CONCURRENCY,
+        ),
+    )
+    # Retries are ours (jittered, metered), so the SDK's own are disabled
+    return cohere.Client(
+        os.getenv("COHERE_API_KEY"), timeout=LLM_TIMEOUT, max_retries=0,
+        httpx_client=http,
+    )
+
+
+def _fake_backend() -> Any:
+    return FakeChatClient(token_delay=float(os.getenv("FAKE_LLM_TOKEN_DELAY", 0.02)))
+
+
+# name → zero-argument factory; register_backend() adds more (e.g. test stubs)
+BACKENDS: dict[str, Callable[[], Any]] = {
+    "cohere": _cohere_backend, "fake": _fake_backend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], Any]) -> None:
+    BACKENDS[name] = factory
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors where a retry might succeed."""
+    transient = (
+        httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError
+    )
+    if isinstance(exc, transient):
+        return True
+    return getattr(exc, "status_code", None) in TRANSIENT_STATUSES
+
+
+# ──────────────────────────────── Metrics ────────────────────────────────── #
+
+
+class LatencyStats:
+    """Call counters plus a sliding window of recent latencies (seconds)."""
+
+    def __init__(self, window: int = 512) -> None:
+        self._lock = threading.Lock()
+        self._recent: deque[float] = deque(maxlen=window)
+        self.calls = self.errors = self.retries = self.rejected = 0
+        self.in_flight = 0
+        self.total_seconds = 0.0
+
+    def incr(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += not ok
+            self.total_seconds += seconds
+            self._recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            calls = self.calls
+
+            def pct(p: float) -> float | None:
+                if not recent:
+                    return None
+                return recent[min(len(recent) - 1, int(p * len(recent)))]
+
+            return {
+                "calls": calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "mean_seconds": self.total_seconds / calls if calls else None,
+                "p50_seconds": pct(0.50),
+                "p95_seconds": pct(0.95),
+            }
+
+
+# ──────────────────────────────── Client ─────────────────────────────────── #
+
+
+class LLMClient:
+    """
+    Thread-safe wrapper shared by all requests. At most `max_concurrency`
+    calls run at once; further callers wait up to `queue_timeout` seconds and
+    then get LLMUnavailable instead of piling onto a slow upstream.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        model: str = MODEL,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+    ) -> None:
+        self.backend = backend
+        self.model = model
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.metrics = LatencyStats()
+
+    def _acquire(self) -> None:
+        with span("llm_queue"):
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            self.metrics.incr("rejected")
+            raise LLMUnavailable("Too many concurrent LLM calls")
+        self.metrics.incr("in_flight")
+
+    def _release(self) -> None:
+        self.metrics.incr("in_flight", -1)
+        self._slots.release()
+
+    def _record(self, mode: str, seconds: float, ok: bool) -> None:
+        self.metrics.record(seconds, ok=ok)
+        LLM_SECONDS.observe(seconds, mode=mode, outcome="ok" if ok else "error")
+        record_span("llm", seconds)
+
+    def _backoff(self, attempt: int, exc: BaseException) -> None:
+        ceiling = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        self.metrics.incr("retries")
+        logging.warning(
+            "LLM call failed (%s) – retry %d in %.2fs", exc, attempt + 1, delay
+        )
+        time.sleep(delay)
+
+    def chat(self, prompt: str) -> str:
+        """Return the full answer text (blocking)."""
+        PROMPT_CHARS.observe(len(prompt))
+        self._acquire()
+        try:
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    text = self.backend.chat(model=self.model, message=prompt).text
+                except Exception as exc:
+                    self._record("chat", time.perf_counter() - start, ok=False)
+                    if attempt < self.max_retries and is_transient(exc):
+                        self._backoff(attempt, exc)
+                        continue
+                    raise
+                elapsed = time.perf_counter() - start
+                self._record("chat", elapsed, ok=True)
+                logging.info(
+                    "LLM call took %.0f ms (%d prompt chars)",
+                    elapsed * 1000, len(prompt),
+                )
+                return text.strip()
+        finally:
+            self._release()
+        raise LLMUnavailable("LLM retries exhausted")
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yield answer text chunks as they are generated. Transient failures are
+        retried only until the first token has been sent.
+        """
+        PROMPT_CHARS.observe(len(prompt))
+        self._acquire()
+        try:
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                sent = False
+                try:
+                    for event in self.backend.chat_stream(
+                        model=self.model, message=prompt
+                    ):
+                        if event.event_type == "text-generation":
+                            sent = True
+                            yield event.text
+                except Exception as exc:
+                    self._record("stream", time.perf_counter() - start, ok=False)
+                    if not sent and attempt < self.max_retries and is_transient(exc):
+                        self._backoff(attempt, exc)
+                        continue
+                    raise
+                elapsed = time.perf_counter() - start
+                self._record("stream", elapsed, ok=True)
+                logging.info(
+                    "LLM stream took %.0f ms (%d prompt chars)",
+                    elapsed * 1000, len(prompt),
+                )
+                return
+        finally:
+            self._release()
+
+
+_client: LLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_llm() -> LLMClient:
+    """The process-wide client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(BACKENDS[LLM_BACKEND]())
+    return _client
+
+
+def set_backend(backend: Any) -> LLMClient:
+    """Swap in another backend (e.g. FakeChatClient in tests / benchmarks)."""
+    global _client
+    with _client_lock:
+        _client = LLMClient(backend)
+    return _client
+
+
+def _client_stat(name: str) -> Callable[[], int | None]:
+    return lambda: _client.metrics.snapshot()[name] if _client is not None else None
+
+
+REGISTRY.callback(
+    "docubridge_llm_in_flight", "LLM calls currently holding a slot",
+    _client_stat("in_flight"),
+)
+REGISTRY.callback(
+    "docubridge_llm_retries_total", "LLM calls retried after a transient error",
+    _client_stat("retries"), "counter",
+)
+REGISTRY.callback(
+    "docubridge_llm_rejected_total",
+    "LLM calls refused – no slot within LLM_QUEUE_TIMEOUT",
+    _client_stat("rejected"), "counter",
+)
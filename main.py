@@ -12,6 +12,8 @@ from openpyxl import load_workbook
 from werkzeug.exceptions import RequestEntityTooLarge
 from zipfile import BadZipFile
 
+from quality import ERROR_TOKENS, scan_sheet
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_API_KEY", "a-default-secret-key-for-development")
 
@@ -28,22 +30,13 @@ UPLOAD_CACHE = {}
 def process_dataframe(df):
     """Analyzes a DataFrame to extract metadata, stats, and trends."""
     # --- Data Quality Checks ---
-    error_tokens = ['#DIV/0!', '#N/A', '#VALUE!', '#REF!', '#NAME?', '#NUM!']
-    error_cells = []
-    for r_idx, row in df.iterrows():
-        for c_idx, value in row.items():
-            if isinstance(value, str) and any(tok in value for tok in error_tokens):
-                error_cells.append((f"{c_idx}{r_idx + 2}", value))
-
-    missing_cells = []
-    for r_idx, row in df.iterrows():
-        for c_idx, value in row.items():
-            if pd.isna(value):
-                missing_cells.append(f"{c_idx}{r_idx + 2}")
+    quality = scan_sheet(df)
+    error_cells = quality['error_cells']
+    missing_cells = quality['missing_cells']
 
     # --- Data Preview ---
-    df_clean = df.replace(error_tokens, 'ERROR')
-    table_html = df_clean.head(10).to_html(classes='table table-striped', index=False, border=0)
+    df_clean = df.head(10).replace(list(ERROR_TOKENS), 'ERROR')
+    table_html = df_clean.to_html(classes='table table-striped', index=False, border=0)
 
     # --- Numeric Stats ---
     numeric_cols = df.select_dtypes(include='number').columns.tolist()
@@ -82,7 +75,7 @@ def process_dataframe(df):
     head_text = json.dumps(df.head(3).to_dict(orient='records'), indent=2, default=str)
     notes = []
     if error_cells:
-        notes.append(f"Errors found in cells like: {error_cells[0][0]}.")
+        notes.append(f"Errors found in cells like: {error_cells[0]}.")
     if missing_cells:
         notes.append(f"Missing values found in cells like: {missing_cells[0]}.")
     prefix = ("Note: " + " ".join(notes) + " ") if notes else ""
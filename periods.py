@@ -0,0 +1,124 @@
+"""
+periods.py – recognising reporting periods in a sheet. Financial models put
+them either down the rows (a date column, or labels like "Jan-23") or across
+the columns as headers ("FY2022", "Q1-23", "Mar 2024"). Both layouts are
+mapped onto pandas Periods with a monthly, quarterly or yearly frequency.
+Fiscal years are treated as calendar years.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Label columns with more distinct values than this are not checked for periods
+MAX_PERIOD_LABELS = 5000
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate((
+        "jan january", "feb february", "mar march", "apr april", "may", "jun june",
+        "jul july", "aug august", "sep sept september", "oct october", "nov november",
+        "dec december",
+    ))
+    for name in names.split()
+}
+MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+# A year in free text: "2023", "FY2023", "FY'23", "'23"
+YEAR_PATTERN = r"(?:fy\s?'?)?(?P<year>(?:19|20)\d{2}|'\d{2})"
+# Headers may abbreviate years without the apostrophe ("Q1-23", "Jan-23")
+_LABEL_YEAR = r"(?:fy\s?'?)?(?P<year>(?:19|20)\d{2}|'?\d{2})"
+
+_QUARTER_LABEL_RES = [
+    re.compile(rf"q(?P<quarter>[1-4])\s*[-/ ]?\s*{_LABEL_YEAR}"),
+    re.compile(rf"{_LABEL_YEAR}\s*[-/ ]?\s*q(?P<quarter>[1-4])"),
+    re.compile(r"(?P<quarter>[1-4])q\s*(?P<year>'?\d{2})"),
+]
+_MONTH_LABEL_RE = re.compile(rf"(?P<month>{MONTH_PATTERN})\.?\s*[-/ ]?\s*{_LABEL_YEAR}")
+_ISO_MONTH_RE = re.compile(r"(?P<year>(?:19|20)\d{2})[-/](?P<month>\d{1,2})")
+_YEAR_LABEL_RE = re.compile(rf"{YEAR_PATTERN}|fy\s?'?(?P<short>\d{{2}})")
+
+# Periods per year, and the frequencies from finest to coarsest
+PER_YEAR = {"M": 12, "Q": 4, "Y": 1}
+FREQUENCIES = ("M", "Q", "Y")
+
+
+def to_year(text: str | None) -> int | None:
+    """"2023" / "23" / "'23" → 2023."""
+    if not text:
+        return None
+    text = text.lstrip("'")
+    return int(text) if len(text) == 4 else 2000 + int(text)
+
+
+def parse_period(label) -> pd.Period | None:
+    """
+    Header / label → Period: dates and "Jan-23" / "2023-01" → month,
+    "Q1 2023" / "Q1-23" / "2023 Q1" / "1Q23" → quarter, "FY2023" / "2023" → year.
+    """
+    dated = hasattr(label, "year") and hasattr(label, "month")
+    if isinstance(label, (pd.Timestamp, np.datetime64)) or dated:
+        try:
+            return pd.Period(label, freq="M")
+        except (TypeError, ValueError):
+            return None
+    if isinstance(label, (int, np.integer)) and 1900 <= label <= 2100:
+        return pd.Period(year=int(label), freq="Y")
+    if not isinstance(label, str):
+        return None
+    text = label.strip().lower()
+    for pattern in _QUARTER_LABEL_RES:
+        m = pattern.fullmatch(text)
+        if m:
+            year, quarter = to_year(m["year"]), int(m["quarter"])
+            return pd.Period(year=year, quarter=quarter, freq="Q")
+    m = _MONTH_LABEL_RE.fullmatch(text)
+    if m:
+        return pd.Period(year=to_year(m["year"]), month=MONTHS[m["month"]], freq="M")
+    m = _ISO_MONTH_RE.fullmatch(text)
+    if m and 1 <= int(m["month"]) <= 12:
+        return pd.Period(year=int(m["year"]), month=int(m["month"]), freq="M")
+    m = _YEAR_LABEL_RE.fullmatch(text)
+    if m:
+        return pd.Period(year=to_year(m["year"] or m["short"]), freq="Y")
+    return None
+
+
+def freq_of(periods) -> str | None:
+    """Finest frequency among some Periods ("M", "Q" or "Y")."""
+    freqs = {p.freqstr[0] for p in periods if isinstance(p, pd.Period)}
+    return next((f for f in FREQUENCIES if f in freqs), None)
+
+
+def is_text(dtype) -> bool:
+    return pd.api.types.is_object_dtype(dtype) or isinstance(
+        dtype, (pd.StringDtype, pd.CategoricalDtype)
+    )
+
+
+def row_periods(df: pd.DataFrame) -> tuple[int | None, pd.Series | None]:
+    """
+    (column position, Period per row) for the first date column or column of
+    period labels – monthly Periods for dates – else (None, None).
+    """
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        if pd.api.types.is_datetime64_any_dtype(col.dtype):
+            return j, col.dt.to_period("M")
+        if is_text(col.dtype):
+            uniques = col.dropna().unique()
+            if 0 < len(uniques) <= MAX_PERIOD_LABELS:
+                parsed = {u: parse_period(u) for u in uniques}
+                if all(p is not None for p in parsed.values()):
+                    return j, col.map(parsed)
+    return None, None
+
+
+def column_periods(df: pd.DataFrame, columns: list[int]) -> dict[int, pd.Period]:
+    """
+    Column position → Period for headers that name one, keeping only the
+    finest frequency – a "FY2023" total next to its months is left out.
+    """
+    headers = {j: parse_period(df.columns[j]) for j in columns}
+    headers = {j: p for j, p in headers.items() if p is not None}
+    freq = freq_of(headers.values())
+    return {j: p for j, p in headers.items() if p.freqstr[0] == freq}
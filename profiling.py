@@ -0,0 +1,174 @@
+"""
+profiling.py – per-sheet profiling: numeric stats, ratios, trends and
+data-quality notes used to prime the LLM. Kept free of Flask so it
+can run in worker processes.
+"""
+import json
+
+import pandas as pd
+
+from inference import restore_errors
+from quality import SAMPLE_LIMIT, scan_sheet
+from telemetry import span
+from trends import PanelBuilder, analyse_panel, ratio_lines, trend_lines
+from trends import analyse as analyse_trends
+
+
+def process_dataframe(df: pd.DataFrame, types: dict | None = None) -> dict:
+    """
+    Lightweight profiling – returns stats, trends, ratios, data-quality
+    notes, and a JSON snippet used to prime the LLM. `types` is
+    the sheet's `infer_types` report (error cells set aside, conversions).
+    Sheets read in large-file mode carry their streamed profile in the
+    report, since `df` is only a sample of their rows.
+    """
+    if (types or {}).get("profile"):
+        return types["profile"]
+
+    with span("profile"):
+        # Locate Excel error tokens and NaNs (column-wise boolean masks)
+        quality = scan_sheet(
+            df, header_row=(types or {}).get("header_row", 1),
+            typed_errors=(types or {}).get("errors"),
+        )
+
+        # Numeric summaries – float64 copies, so float32 storage never rounds a total
+        numeric_cols = df.select_dtypes("number").columns
+        numbers = df[numeric_cols].astype("float64")
+        stats = _stat_lines(numbers.sum(skipna=True), numbers.mean(skipna=True))
+
+        # Growth (MoM / QoQ / YoY, CAGR, rolling averages) and margins for every
+        # series, whether periods run down the rows or across the headers
+        trend_report = analyse_trends(df)
+
+        parsed = [c["column"] for c in (types or {}).get("columns", ()) if c["parsed"]]
+        return _profile(
+            stats, trend_report, quality, parsed, restore_errors(df.head(3), types)
+        )
+
+
+def _stat_lines(sums: pd.Series, means: pd.Series) -> list[tuple[str, str]]:
+    return [
+        (str(c), f"{c}: sum={sums[c]:,.2f}, mean={means[c]:,.2f}")
+        for c in sums.index
+    ]
+
+
+def _profile(
+    stats: list, trend_report: dict | None, quality: dict, parsed: list[str],
+    head: pd.DataFrame,
+) -> dict:
+    """The profile dict shared by in-memory and streamed sheets."""
+    stats_text = "; ".join(text for _, text in stats) or "No numeric columns found."
+    trends = trend_lines(trend_report)
+    ratios = ratio_lines(trend_report)
+    ratio_text = (
+        "; ".join(text for _, text in ratios) or "No key financial ratios calculated."
+    )
+    trend_text = (
+        "; ".join(text for _, text in trends) or "No clear time-series trends detected."
+    )
+
+    # Data-quality notes
+    notes = []
+    if quality["error_cells"]:
+        notes.append(
+            f"Errors in {quality['error_count']} cells e.g. "
+            f"{', '.join(quality['error_cells'][:3])}"
+        )
+    if quality["missing_cells"]:
+        notes.append(
+            f"Missing values in {quality['missing_count']} cells e.g. "
+            f"{', '.join(quality['missing_cells'][:3])}"
+        )
+    if parsed:
+        notes.append(
+            "Numbers or dates stored as text were converted in: "
+            + ", ".join(parsed[:5])
+        )
+    prefix = "Note: " + " ".join(notes) if notes else ""
+
+    head_text = json.dumps(head.to_dict(orient="records"), indent=2, default=str)
+
+    return {
+        "stats_text": stats_text,
+        "stats": stats,  # (column, text) pairs – prompts.py ranks them per question
+        "trends": trends,
+        "trend_text": trend_text,
+        "ratios": ratios,
+        "ratio_text": ratio_text,
+        "trend_report": trend_report,  # numbers behind trends / ratios (see trends.py)
+        "prefix": prefix,
+        "head_text": head_text,
+        "quality": quality,
+    }
+
+
+class StreamingProfile:
+    """
+    `process_dataframe` for a sheet read in row chunks (large-file mode):
+    running sums and counts, null / error tallies and the trend panel are
+    updated chunk by chunk, so nothing larger than one chunk is ever held.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self._sums = pd.Series(dtype="float64")
+        self._counts = pd.Series(dtype="float64")
+        self._quality: dict | None = None
+        self._parsed: dict[str, None] = {}
+        self._panel = PanelBuilder()
+        self._head: pd.DataFrame | None = None
+
+    def add(
+        self, df: pd.DataFrame, types: dict, offset: int, header_row: int = 1
+    ) -> None:
+        """
+        Fold in one typed chunk whose first row is data row `offset` (0-based);
+        the sheet's header is on Excel row `header_row`.
+        """
+        if self._head is None:
+            self._head = restore_errors(df.head(3), types)
+        numbers = df.select_dtypes("number").astype("float64")
+        numbers.columns = [str(c) for c in numbers.columns]
+        self._sums = self._sums.add(numbers.sum(), fill_value=0)
+        self._counts = self._counts.add(numbers.count(), fill_value=0)
+        # Cell addresses stay right: the chunk starts `offset` rows below the header
+        part = scan_sheet(
+            df, header_row=header_row + offset, typed_errors=types.get("errors")
+        )
+        self._quality = (
+            part if self._quality is None else _merge_quality(self._quality, part)
+        )
+        parsed = (c["column"] for c in types.get("columns", ()) if c["parsed"])
+        self._parsed.update(dict.fromkeys(parsed))
+        self._panel.add(df)
+        self.rows = offset + len(df)
+
+    def result(self) -> dict:
+        order = list(self._quality["columns"]) if self._quality else []
+        sums = self._sums.reindex([c for c in order if c in self._sums.index])
+        means = sums / self._counts.reindex(sums.index).where(lambda n: n > 0)
+        quality = self._quality or scan_sheet(pd.DataFrame())
+        quality["rows"] = self.rows
+        trend_report = analyse_panel(self._panel.panel(), self._panel.layout)
+        head = self._head if self._head is not None else pd.DataFrame()
+        return _profile(
+            _stat_lines(sums, means), trend_report, quality, list(self._parsed), head
+        )
+
+
+def _merge_quality(total: dict, part: dict) -> dict:
+    """Add one chunk's `scan_sheet` result into the running totals."""
+    for key in ("error_count", "missing_count"):
+        total[key] += part[key]
+    for name, col in part["columns"].items():
+        if name in total["columns"]:
+            total["columns"][name]["errors"] += col["errors"]
+            total["columns"][name]["missing"] += col["missing"]
+        else:
+            total["columns"][name] = dict(col)
+    for key in ("error_cells", "missing_cells"):
+        total[key] = (total[key] + part[key])[:SAMPLE_LIMIT]
+    total["cols"] = max(total["cols"], part["cols"])
+    return total
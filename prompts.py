@@ -0,0 +1,229 @@
+"""
+prompts.py – token-budgeted prompt assembly for profile-based questions.
+
+Wide sheets would otherwise inline every column's stats, the full column list
+and whole sample rows. Instead each piece of context (a column name, its
+stats or trend line, a sample row) is scored against the question by word
+overlap with column names and row labels, and pieces are added
+most-relevant-first until the token budget is spent. Every build also
+returns a usage report: tokens used against the budget, and how many
+columns / stats / trends / rows made it in.
+"""
+import json
+import math
+import os
+import re
+from typing import NamedTuple
+
+import pandas as pd
+
+from telemetry import span
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 2000))
+
+# No tokenizer ships with the app – ~4 characters per token is close for
+# English mixed with numbers, and errs high for JSON
+CHARS_PER_TOKEN = 4
+
+# Sample rows: label matches for the question first, then the first rows
+PREVIEW_ROWS = 3
+MAX_MATCHED_ROWS = 5
+# On wide sheets a sample row only shows this many (most relevant) columns
+MAX_ROW_COLUMNS = 12
+
+_STOP_WORDS = frozenset({
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "be", "by", "can",
+    "did", "do", "does", "for", "from", "give", "has", "have", "how", "i", "in",
+    "is", "it", "its", "me", "much", "my", "of", "on", "or", "our", "over", "per",
+    "show", "tell", "than", "that", "the", "their", "there", "this", "to", "total",
+    "was", "we", "were", "what", "when", "where", "which", "who", "why", "will",
+    "with", "you", "your",
+})
+
+# Order of sections when relevance ties – and their order in the prompt
+_SECTIONS = ("columns", "stats", "ratios", "trends", "rows")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _words(text) -> set[str]:
+    """Lower-case content words, with a trailing plural "s" dropped."""
+    words = set()
+    for word in re.findall(r"[a-z0-9]+", str(text).lower()):
+        if word in _STOP_WORDS:
+            continue
+        words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return words
+
+
+class _Piece(NamedTuple):
+    score: int
+    rank: int  # position within its section (sheet order / match order)
+    section: str
+    text: str
+
+
+def _label_column(df: pd.DataFrame) -> int | None:
+    """Position of the first text column – its values act as row labels."""
+    for j in range(df.shape[1]):
+        dtype = df.dtypes.iloc[j]
+        if pd.api.types.is_object_dtype(dtype) or isinstance(
+            dtype, (pd.StringDtype, pd.CategoricalDtype)
+        ):
+            return j
+    return None
+
+
+def _matching_rows(
+    df: pd.DataFrame, label: int | None, words: set[str]
+) -> list[tuple[int, int]]:
+    """(row position, score) for rows whose label mentions question words."""
+    words = {w for w in words if len(w) > 2}
+    if label is None or not words or df.empty:
+        return []
+    labels = df.iloc[:, label].astype(str).str.lower()
+    score = pd.Series(0, index=df.index)
+    for word in words:
+        score += labels.str.contains(word, regex=False, na=False).astype(int)
+    hits = score.to_numpy().nonzero()[0]
+    ranked = sorted(hits.tolist(), key=lambda i: -score.iat[i])[:MAX_MATCHED_ROWS]
+    return [(i, int(score.iat[i])) for i in ranked]
+
+
+def _row_columns(col_scores: list[int], label: int | None) -> list[int]:
+    """Columns shown in sample rows: everything, or label + most relevant."""
+    if len(col_scores) <= MAX_ROW_COLUMNS:
+        return list(range(len(col_scores)))
+    ranked = sorted(range(len(col_scores)), key=lambda j: (-col_scores[j], j))
+    chosen = [label] if label is not None else []
+    chosen += [j for j in ranked if j != label][:MAX_ROW_COLUMNS - len(chosen)]
+    return sorted(chosen)
+
+
+def _records(
+    df: pd.DataFrame, rows: list[int], cols: list[int], types: dict | None
+) -> list[str]:
+    """
+    Compact JSON per row: empty cells left out, floats cut to 6 significant
+    digits, error tokens set aside by type inference put back.
+    """
+    block = df.iloc[rows, cols].astype(object)
+    errors = {(r, c): token for r, c, token in (types or {}).get("errors", ())}
+    out = []
+    for i, row in enumerate(rows):
+        record = {}
+        for j, col in enumerate(cols):
+            value = errors.get((row, col), block.iat[i, j])
+            if value is None or value is pd.NaT:
+                continue
+            if isinstance(value, float) and math.isnan(value):
+                continue
+            if isinstance(value, float):
+                value = float(f"{value:.6g}")
+            record[str(df.columns[col])] = value
+        out.append(json.dumps(record, default=str, ensure_ascii=False))
+    return out
+
+
+@span("prompt")
+def assemble_prompt(
+    meta: dict, df: pd.DataFrame, question: str, types: dict | None = None,
+    budget: int = PROMPT_TOKEN_BUDGET,
+) -> tuple[str, dict]:
+    """
+    Prompt for a question about one sheet, kept within `budget` tokens
+    (the question and data-quality notes are always included). Returns
+    (prompt, usage).
+    """
+    words = _words(question)
+    names = [str(c) for c in df.columns]
+    col_scores = [len(_words(name) & words) for name in names]
+    by_name = dict(zip(names, col_scores, strict=True))
+    label = _label_column(df)
+
+    pieces = [
+        _Piece(score, j, "columns", repr(name))
+        for j, (name, score) in enumerate(zip(names, col_scores, strict=True))
+    ]
+    for section in ("stats", "trends"):
+        pieces += [
+            _Piece(by_name.get(col, 0), j, section, text)
+            for j, (col, text) in enumerate(meta.get(section, ()))
+        ]
+    ratios = meta.get("ratios") or [("", meta["ratio_text"])]
+    pieces += [
+        _Piece(len(_words(f"{name} {text}") & words), j, "ratios", text)
+        for j, (name, text) in enumerate(ratios)
+    ]
+
+    matched = _matching_rows(df, label, words)
+    first = [i for i in range(min(PREVIEW_ROWS, len(df))) if i not in dict(matched)]
+    rows = matched + [(i, 0) for i in first]
+    row_texts = []
+    if rows:
+        shown = _row_columns(col_scores, label)
+        row_texts = _records(df, [i for i, _ in rows], shown, types)
+    pieces += [
+        _Piece(score, k, "rows", text)
+        for k, ((_, score), text) in enumerate(zip(rows, row_texts, strict=True))
+    ]
+
+    def listing(texts: list[str], available, fallback: str) -> str:
+        if texts:
+            return "; ".join(texts)
+        return "(left out to fit the prompt budget)" if available else fallback
+
+    def render(chosen: dict[str, list[str]]) -> str:
+        shown, total = len(chosen["columns"]), len(names)
+        columns = f"{total} columns"
+        if shown < total:
+            columns += f" (the {shown} most relevant are listed)"
+        stats = listing(chosen["stats"], meta.get("stats"), meta["stats_text"])
+        ratios = listing(chosen["ratios"], meta.get("ratios"), meta["ratio_text"])
+        trends = listing(chosen["trends"], meta.get("trends"), meta["trend_text"])
+        if meta.get("sampled"):  # large-file mode: df is a random sample of the sheet
+            preview = f"{len(df)}-row random sample"
+            if matched:
+                preview += ", rows matching the question first"
+        elif matched:
+            preview = "rows matching the question, then the first rows"
+        else:
+            preview = "first rows"
+        return (
+            f'{meta["prefix"]} '
+            "Analyze the following spreadsheet data. "
+            f"The sheet has {meta.get('rows', len(df))} rows and {columns}: "
+            f"[{', '.join(chosen['columns'])}]. "
+            f"Key Stats: {stats}. "
+            f"Financial Ratios: {ratios}. "
+            f"Time-series Trends: {trends}. "
+            f"Data Preview ({preview}): [{', '.join(chosen['rows'])}]. "
+            f'Given this context, answer the user\'s question: "{question}".'
+        )
+
+    # Greedy fill, most relevant first; ties go round-robin across sections
+    chosen: dict[str, list[_Piece]] = {section: [] for section in _SECTIONS}
+    # (16 tokens of room for the notes)
+    remaining = budget - estimate_tokens(render({s: [] for s in _SECTIONS})) - 16
+    order = sorted(pieces, key=lambda p: (-p.score, p.rank, _SECTIONS.index(p.section)))
+    for piece in order:
+        cost = estimate_tokens(piece.text) + 1
+        if cost <= remaining:
+            chosen[piece.section].append(piece)
+            remaining -= cost
+
+    # Shown in sheet order, not relevance order
+    prompt = render({
+        s: [p.text for p in sorted(chosen[s], key=lambda p: p.rank)] for s in _SECTIONS
+    })
+    tokens = estimate_tokens(prompt)
+    totals = {s: sum(p.section == s for p in pieces) for s in _SECTIONS}
+    usage = {
+        "tokens": tokens,
+        "budget": budget,
+        "used": round(tokens / budget, 3) if budget else None,
+        **{s: [len(chosen[s]), totals[s]] for s in _SECTIONS},
+    }
+    return prompt, usage
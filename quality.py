@@ -0,0 +1,80 @@
+"""
+quality.py – vectorised data-quality scan for uploaded sheets. Builds boolean
+masks for Excel error tokens and missing values one column at a time, so the
+cost grows with the number of columns instead of with per-cell Python work.
+"""
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+ERROR_TOKENS = frozenset({"#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?", "#NUM!"})
+
+# How many example cell addresses to keep per category
+SAMPLE_LIMIT = 20
+
+
+def _sample_cells(
+    mask: np.ndarray, letters: list[str], limit: int, first_row: int
+) -> list[str]:
+    """Return up to `limit` A1 addresses for True cells, in row-major order."""
+    if not limit or not mask.any():
+        return []
+    hits = np.flatnonzero(mask.ravel())[:limit]
+    rows, cols = np.divmod(hits, mask.shape[1])
+    return [
+        f"{letters[c]}{r + first_row}"
+        for r, c in zip(rows.tolist(), cols.tolist(), strict=True)
+    ]
+
+
+def scan_sheet(
+    df: pd.DataFrame, sample_limit: int = SAMPLE_LIMIT, header_row: int = 1,
+    typed_errors: list | None = None,
+) -> dict:
+    """
+    Count error tokens and missing values per column and for the whole sheet.
+
+    Cell addresses use real Excel column letters (A, B, … AA); the header
+    sits on Excel row `header_row` (`LazyWorkbook.header_row`) with the data
+    rows directly below it.
+    `typed_errors` lists (row, col, token) cells whose token became NaN when
+    the column was typed (see inference.py); they count as errors.
+    """
+    n_rows, n_cols = df.shape
+    letters = [get_column_letter(i + 1) for i in range(n_cols)]
+    errors = np.zeros((n_rows, n_cols), dtype=bool)
+    missing = np.zeros((n_rows, n_cols), dtype=bool)
+
+    for i in range(n_cols):
+        col = df.iloc[:, i]
+        missing[:, i] = col.isna().to_numpy()
+        # Numeric / datetime columns cannot hold error strings
+        text_like = isinstance(col.dtype, (pd.StringDtype, pd.CategoricalDtype))
+        if col.dtype == object or text_like:
+            errors[:, i] = col.isin(ERROR_TOKENS).to_numpy()
+    if typed_errors:
+        rows, cols = np.array([(r, c) for r, c, _ in typed_errors]).T
+        errors[rows, cols] = True
+        missing[rows, cols] = False
+
+    error_counts = errors.sum(axis=0)
+    missing_counts = missing.sum(axis=0)
+    first_row = header_row + 1
+
+    return {
+        "rows": n_rows,
+        "cols": n_cols,
+        "error_count": int(error_counts.sum()),
+        "missing_count": int(missing_counts.sum()),
+        "columns": {
+            str(name): {
+                "letter": letters[i],
+                "errors": int(error_counts[i]),
+                "missing": int(missing_counts[i]),
+            }
+            for i, name in enumerate(df.columns)
+        },
+        "error_cells": _sample_cells(errors, letters, sample_limit, first_row),
+        "missing_cells": _sample_cells(missing, letters, sample_limit, first_row),
+    }
+
@@ -0,0 +1,634 @@
+"""
+queries.py – exact answers for questions the sheet can answer by itself:
+"total revenue in 2023", "average monthly opex", "which quarter had the
+highest margin", "how many deals in North were above 10k".
+
+A small intent parser maps the question onto an aggregate (sum / mean /
+median / min / max / count), a metric (a numeric column, or a row label on
+sheets laid out with periods across the columns), period and category
+filters, a numeric comparison and an optional group-by. The work runs as
+vectorised pandas operations, leaving out "Total" / "Subtotal" rows; a sheet
+whose totals cannot be told apart from its data goes to the LLM. The parser
+is deliberately strict: every content word of the question has to be
+accounted for, otherwise `answer()` returns None and the question goes to
+the LLM as before.
+"""
+import logging
+import re
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from formula_index import format_value
+from periods import (
+    MONTH_PATTERN,
+    MONTHS,
+    YEAR_PATTERN,
+    column_periods,
+    freq_of,
+    is_text,
+    row_periods,
+    to_year,
+)
+from telemetry import span
+
+# Group-by answers list at most this many groups
+MAX_LISTED_GROUPS = 12
+# Category filters only consider text columns with at most this many values
+MAX_FILTER_VALUES = 1000
+
+_FILLER = frozenset({
+    "a", "across", "all", "amount", "an", "and", "are", "as", "at", "be", "by", "can",
+    "column", "data", "did", "do", "does", "during", "entire", "figure", "for",
+    "from", "full", "give", "had", "has", "have", "in", "is", "it", "its", "me",
+    "my", "number", "of", "on", "our", "over", "period", "please", "row", "sheet",
+    "show", "tell", "that", "the", "their", "there", "this", "to", "value",
+    "values", "was", "we", "were", "what", "whole", "with", "workbook", "you",
+})
+
+_AGGREGATE_RE = [
+    ("count", re.compile(r"\bhow many\b|\bnumber of\b|\bcount\b")),
+    ("mean", re.compile(r"\baverage\b|\bavg\b|\bmean\b")),
+    ("median", re.compile(r"\bmedian\b")),
+    ("max", re.compile(
+        r"\bhighest\b|\bmaximum\b|\bmax\b|\blargest\b|\bbiggest\b|\bpeak\b|\bmost\b"
+        r"|\btop\b"
+    )),
+    ("min", re.compile(r"\blowest\b|\bminimum\b|\bmin\b|\bsmallest\b|\bleast\b")),
+    ("sum", re.compile(
+        r"\btotal\b|\bsum\b|\bhow much\b|\boverall\b|\bcombined\b|\bcumulative\b"
+    )),
+]
+_AGGREGATE_LABEL = {
+    "sum": "Total", "mean": "Average", "median": "Median", "max": "Highest",
+    "min": "Lowest", "count": "Number of rows",
+}
+
+_FREQ_WORDS = {"month": "M", "quarter": "Q", "year": "Y"}
+_GROUP_RE = re.compile(
+    r"\b(?:which|what)\s+(?P<which>\w+)\b|\b(?:by|per|each|every)\s+(?P<by>\w+)\b"
+    r"|\b(?P<adverb>monthly|quarterly|yearly|annual|annually)\b"
+)
+_ADVERB_FREQ = {
+    "monthly": "M", "quarterly": "Q", "yearly": "Y", "annual": "Y", "annually": "Y"
+}
+
+_COMPARE_RE = re.compile(
+    r"\b(?P<op>above|over|more than|greater than|exceeding|at least|below|under"
+    r"|less than|at most)"
+    r"\s+\$?(?P<num>-?\d[\d,]*(?:\.\d+)?)"
+    r"\s*(?P<scale>k|m|mn|bn|thousand|million|billion)?\b"
+)
+_SCALE = {
+    None: 1, "k": 1e3, "thousand": 1e3, "m": 1e6, "mn": 1e6, "million": 1e6,
+    "bn": 1e9, "billion": 1e9,
+}
+
+_PERIOD_RES = [
+    re.compile(
+        rf"\bq(?P<quarter>[1-4])"
+        rf"(?:\s*(?:of\s+)?[-/ ]?\s*{YEAR_PATTERN}|(?:\s*fy\s?'?)(?P<fy>\d{{2}}))?\b"
+    ),
+    re.compile(rf"\b(?P<month>{MONTH_PATTERN})\b\.?(?:\s*[-/ ]?\s*{YEAR_PATTERN})?"),
+    re.compile(rf"\b{YEAR_PATTERN}\b|\bfy\s?'?(?P<short>\d{{2}})\b"),
+]
+
+# Words that mean the same measure in finance sheets
+_SYNONYMS = {
+    "sale": "revenue", "turnover": "revenue", "expense": "cost", "spend": "cost"
+}
+_PHRASES = [
+    (re.compile(r"\boperating expenses?\b"), "opex"),
+    (re.compile(r"\bnet income\b"), "profit"),
+]
+
+_RATIO_RE = re.compile(r"margin|ratio|rate|%|percent|growth|yield|share", re.I)
+# Labels of rows (or period columns) that add up the others
+_TOTAL_RE = re.compile(r"\b(?:sub-?\s?)?totals?\b", re.I)
+
+_FOOTNOTE = "_Computed directly from the sheet._"
+
+
+def _canonical(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return _SYNONYMS.get(word, word)
+
+
+def _name_words(name) -> set[str]:
+    text = str(name).lower()
+    for pattern, replacement in _PHRASES:
+        text = pattern.sub(replacement, text)
+    return {_canonical(w) for w in re.findall(r"[a-z0-9]+", text)} - _FILLER
+
+
+# ─────────────────────────────── Periods ─────────────────────────────────── #
+
+
+class PeriodFilter(NamedTuple):
+    year: int | None = None
+    quarter: int | None = None
+    month: int | None = None
+
+    def label(self) -> str:
+        parts = []
+        if self.month:
+            parts.append(pd.Timestamp(2000, self.month, 1).strftime("%B"))
+        if self.quarter:
+            parts.append(f"Q{self.quarter}")
+        if self.year:
+            parts.append(str(self.year))
+        return " ".join(parts)
+
+    def mask(self, periods: pd.Series) -> pd.Series | None:
+        """Rows whose period lies inside the filter; None if periods are too coarse."""
+        freq = freq_of(periods)
+        if freq is None:
+            return None
+        if (self.month and freq != "M") or (self.quarter and freq == "Y"):
+            return None
+        keep = pd.Series(True, index=periods.index)
+        if self.year:
+            keep &= periods.map(lambda p: p.year == self.year)
+        if self.quarter:
+            keep &= periods.map(lambda p: p.quarter == self.quarter)
+        if self.month:
+            keep &= periods.map(lambda p: p.month == self.month)
+        return keep
+
+
+# ─────────────────────────────── Parsing ─────────────────────────────────── #
+
+
+class _Words:
+    """The question's words with their spans; recognisers mark what they use."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.spans = [
+            (m.start(), m.end(), _canonical(m.group()))
+            for m in re.finditer(r"[a-z0-9]+", text)
+        ]
+        self.used = [w in _FILLER for _, _, w in self.spans]
+
+    def take(self, start: int, end: int) -> None:
+        for i, (s, e, _) in enumerate(self.spans):
+            if s >= start and e <= end:
+                self.used[i] = True
+
+    def free(self) -> set[str]:
+        pairs = zip(self.spans, self.used, strict=True)
+        return {w for (_, _, w), used in pairs if not used}
+
+    def take_words(self, words: set[str]) -> None:
+        for i, (_, _, w) in enumerate(self.spans):
+            if w in words:
+                self.used[i] = True
+
+
+class Query(NamedTuple):
+    aggregate: str
+    metric: tuple | None  # ("column", j) | ("row", i) | ("margin", profit j, revenue j)
+    period: PeriodFilter | None
+    categories: list[tuple[int, str]]  # (column position, value)
+    compare: tuple[str, float] | None
+    group: str | int | None  # "M" / "Q" / "Y", or a text column position
+    layout: str  # "rows" (records down the sheet) or "wide" (periods across)
+
+
+class _Sheet:
+    """What the parser needs to know about a frame, computed once per call."""
+
+    def __init__(self, df: pd.DataFrame, header_row: int = 1) -> None:
+        self.df = df
+        self.header_row = header_row  # Excel row of the header (ingest.py)
+        self.names = [str(c) for c in df.columns]
+        self.numeric = [
+            j for j in range(df.shape[1])
+            if pd.api.types.is_numeric_dtype(df.dtypes.iloc[j])
+            and not pd.api.types.is_bool_dtype(df.dtypes.iloc[j])
+        ]
+        self.text = [j for j in range(df.shape[1]) if is_text(df.dtypes.iloc[j])]
+        self.label = self.text[0] if self.text else None
+        # Periods down the rows, or across the columns ("wide" financial layout)
+        self.period_column, self.row_periods = row_periods(df)
+        self.col_periods = column_periods(df, self.numeric)
+        self.wide = len(self.col_periods) >= 2 and self.label is not None
+        # "Total" / "Subtotal" / "Grand total" rows would count everything twice
+        self.totals = pd.Series(False, index=df.index)
+        for j in self.text:
+            self.totals |= df.iloc[:, j].astype(str).str.contains(_TOTAL_RE)
+        key = self.label if self.period_column is None else self.period_column
+        self.unnamed = None if key is None else df.iloc[:, key].isna()
+
+
+def _has_subtotals(values: pd.Series, unnamed: pd.Series | None) -> bool:
+    """
+    True if an unnamed row holds the sum of two or more rows directly above it –
+    a total (a SUM formula over the column) without a "Total" label. Sheets
+    with nothing to name their rows by are checked for a grand total at the end.
+    """
+    v = values.fillna(0.0).to_numpy(dtype=float)
+    if unnamed is None:
+        return len(v) >= 3 and v[-1] != 0 and np.isclose(v[-1], v[:-1].sum())
+    prefix = np.round(np.concatenate([[0.0], np.cumsum(v)]), 6)
+    seen, first = np.unique(prefix, return_index=True)
+    # v[i] == v[j] + … + v[i-1] for some j <= i-2  <=>  prefix[j] == prefix[i] - v[i]
+    start = np.round(prefix[:-1] - v, 6)
+    pos = np.minimum(np.searchsorted(seen, start), len(seen) - 1)
+    found = (seen[pos] == start) & (first[pos] <= np.arange(len(v)) - 2)
+    return bool((found & (v != 0) & unnamed.to_numpy()).any())
+
+
+def _find_metric(sheet: _Sheet, words: _Words) -> tuple | None:
+    """Best numeric column (or row label on wide sheets) named in the question."""
+    free = words.free()
+    candidates = []
+    if sheet.wide:
+        labels = sheet.df.iloc[:, sheet.label]
+        for i, value in labels.items():
+            if isinstance(value, str):
+                name = _name_words(value)
+                if name and name <= free:
+                    candidates.append((len(name), ("row", int(i)), name))
+    for j in sheet.numeric:
+        if sheet.wide and j in sheet.col_periods:
+            continue
+        name = _name_words(sheet.names[j])
+        if name and name <= free:
+            candidates.append((len(name), ("column", j), name))
+    # "profit margin" without a margin column is the derived ratio, not profit
+    if "margin" in free and not any("margin" in c[2] for c in candidates):
+        return _derived_margin(sheet, words)
+    if not candidates:
+        return None
+    candidates.sort(key=lambda c: -c[0])
+    best = [c for c in candidates if c[0] == candidates[0][0]]
+    # ambiguous – two different measures match equally well
+    if len({frozenset(c[2]) for c in best}) > 1:
+        return None
+    if len(best) > 1 and best[0][1][0] == "row":
+        return None
+    words.take_words(best[0][2])
+    return best[0][1]
+
+
+def _derived_margin(sheet: _Sheet, words: _Words) -> tuple | None:
+    """Margin without a margin column: sum(profit) / sum(revenue)."""
+    def column(word: str) -> int | None:
+        hits = [j for j in sheet.numeric if word in _name_words(sheet.names[j])]
+        return hits[0] if len(hits) == 1 else None
+
+    profit, revenue = column("profit"), column("revenue")
+    if sheet.wide or profit is None or revenue is None:
+        return None
+    words.take_words({"margin", "profit"})
+    return ("margin", profit, revenue)
+
+
+def _find_period(words: _Words) -> PeriodFilter | None:
+    year = quarter = month = None
+    for pattern in _PERIOD_RES:
+        for m in pattern.finditer(words.text):
+            groups = m.groupdict()
+            if groups.get("quarter") and quarter is None:
+                quarter = int(groups["quarter"])
+                year = year or to_year(groups.get("year") or groups.get("fy"))
+            elif groups.get("month") and month is None:
+                if groups["month"] == "may" and not groups.get("year"):
+                    continue  # the verb, most likely
+                month = MONTHS[groups["month"]]
+                year = year or to_year(groups.get("year"))
+            elif groups.get("year") or groups.get("short"):
+                year = year or to_year(groups.get("year") or groups.get("short"))
+            else:
+                continue
+            words.take(*m.span())
+    return PeriodFilter(year, quarter, month) if (year or quarter or month) else None
+
+
+def _find_categories(
+    sheet: _Sheet, words: _Words, skip: int | None
+) -> list[tuple[int, str]]:
+    """Text-column values named in the question ("North", "Enterprise")."""
+    found = []
+    for j in sheet.text:
+        if j == skip or (sheet.wide and j == sheet.label):
+            continue
+        col = sheet.df.iloc[:, j].dropna()
+        uniques = col.unique()
+        if len(uniques) > MAX_FILTER_VALUES:
+            continue
+        free = words.free()
+        matches = [
+            (len(w), str(v), w) for v in uniques if (w := _name_words(v)) and w <= free
+        ]
+        if matches:
+            _, value, value_words = max(matches)
+            words.take_words(value_words | (_name_words(sheet.names[j]) & free))
+            found.append((j, value))
+    return found
+
+
+def _find_group(sheet: _Sheet, words: _Words) -> str | int | None:
+    for m in _GROUP_RE.finditer(words.text):
+        if m["adverb"]:
+            words.take(*m.span())
+            return _ADVERB_FREQ[m["adverb"]]
+        word = _canonical(m["which"] or m["by"])
+        if word in _FREQ_WORDS:
+            words.take(*m.span())
+            return _FREQ_WORDS[word]
+        for j in sheet.text:
+            if sheet.wide and j == sheet.label:
+                continue
+            if _name_words(sheet.names[j]) == {word}:
+                words.take(*m.span())
+                return j
+    return None
+
+
+def parse_query(question: str, df: pd.DataFrame) -> Query | None:
+    """Map a question onto the sheet; None unless every content word is understood."""
+    text = question.lower().replace("’", "'")
+    for pattern, replacement in _PHRASES:
+        text = pattern.sub(replacement, text)
+    words = _Words(text)
+    sheet = _Sheet(df)
+
+    aggregate = None
+    for name, pattern in _AGGREGATE_RE:
+        m = pattern.search(text)
+        if m:
+            aggregate = aggregate or name
+            words.take(*m.span())
+    compare = None
+    m = _COMPARE_RE.search(text)
+    if m:
+        value = float(m["num"].replace(",", "")) * _SCALE[m["scale"]]
+        if m["op"] in ("above", "over", "more than", "greater than", "exceeding"):
+            op = ">"
+        else:
+            op = {"at least": ">=", "at most": "<="}.get(m["op"], "<")
+        compare = (op, value)
+        words.take(*m.span())
+    group = _find_group(sheet, words)
+    period = _find_period(words)
+    metric = _find_metric(sheet, words)
+    skip = group if isinstance(group, int) else None
+    categories = _find_categories(sheet, words, skip)
+    words.take_words({"row", "entry", "record", "line"})
+    if aggregate is None and metric is not None and metric[0] == "margin":
+        aggregate = "sum"  # "what is the profit margin" – the overall ratio
+
+    if aggregate is None or words.free():
+        return None
+    if metric is None and (aggregate != "count" or compare is not None):
+        return None  # a comparison needs a measure to compare
+    layout = "wide" if metric and metric[0] == "row" else "rows"
+    if layout == "wide" and (categories or isinstance(group, int)):
+        return None
+    return Query(aggregate, metric, period, categories, compare, group, layout)
+
+
+# ────────────────────────────── Evaluation ───────────────────────────────── #
+
+
+class _Series(NamedTuple):
+    """Values to aggregate, with a display label and period per entry."""
+    values: pd.Series               # float64
+    denominator: pd.Series | None   # for derived ratios (margin)
+    labels: pd.Series               # row label / column header per entry
+    periods: pd.Series | None       # Period per entry, if known
+    group_keys: pd.Series | None    # category values for group-by a text column
+
+
+def _metric_label(sheet: _Sheet, metric: tuple | None) -> str:
+    if metric is None:
+        return ""
+    if metric[0] == "column":
+        return sheet.names[metric[1]]
+    if metric[0] == "row":
+        return str(sheet.df.iat[metric[1], sheet.label])
+    return "Margin"
+
+
+def _select(sheet: _Sheet, query: Query) -> _Series | None:
+    df = sheet.df
+    if query.layout == "wide":
+        cols = [j for j in sheet.col_periods if not _TOTAL_RE.search(sheet.names[j])]
+        periods = pd.Series([sheet.col_periods[j] for j in cols], dtype=object)
+        row = df.iloc[query.metric[1], cols]
+        values = pd.to_numeric(pd.Series(row.to_numpy()), errors="coerce").astype(float)
+        labels = pd.Series([sheet.names[j] for j in cols])
+        return _Series(values, None, labels, periods, None)
+
+    keep = ~sheet.totals
+    for j, value in query.categories:
+        keep &= df.iloc[:, j].astype(str).eq(value)
+    kind = query.metric[0] if query.metric else None
+    if kind == "column":
+        values, denominator = df.iloc[:, query.metric[1]].astype(float), None
+    elif kind == "margin":
+        values = df.iloc[:, query.metric[1]].astype(float)
+        denominator = df.iloc[:, query.metric[2]].astype(float)
+    else:
+        values, denominator = pd.Series(1.0, index=df.index), None
+    unnamed = None if sheet.unnamed is None else sheet.unnamed[keep]
+    if kind is not None and _has_subtotals(values[keep], unnamed):
+        return None  # cannot tell the totals from the data – leave it to the LLM
+    first = sheet.header_row + 1
+    labels = pd.Series([f"row {i + first}" for i in range(len(df))], index=df.index)
+    if sheet.label is not None and sheet.label != sheet.period_column:
+        labels = df.iloc[:, sheet.label].astype(str)
+    periods = sheet.row_periods
+    if periods is not None:
+        named = periods.astype(str)
+        if sheet.label not in (None, sheet.period_column):
+            named = named + " – " + labels
+        labels = named.where(periods.notna(), labels)
+    group_keys = None
+    if isinstance(query.group, int):
+        group_keys = df.iloc[:, query.group].astype(str)[keep]
+    return _Series(
+        values[keep], None if denominator is None else denominator[keep], labels[keep],
+        None if periods is None else periods[keep], group_keys,
+    )
+
+
+def _reduce(values: pd.Series, denominator: pd.Series | None, aggregate: str) -> float:
+    if denominator is not None:
+        total = denominator.sum()
+        return values.sum() / total if total else np.nan
+    if aggregate == "count":
+        return float(values.notna().sum())
+    return float(getattr(values, aggregate)())
+
+
+def _fmt(value: float, ratio: bool) -> str:
+    if ratio and not np.isnan(value) and abs(value) <= 10:
+        return f"{value:.2%}"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return f"{int(value):,}"
+    return format_value(float(value))
+
+
+def evaluate(query: Query, df: pd.DataFrame, header_row: int = 1) -> str | None:
+    """
+    Run a parsed query; markdown answer, or None if the data does not fit it.
+    Unlabelled rows are named by their Excel row, counted from `header_row`.
+    """
+    sheet = _Sheet(df, header_row)
+    data = _select(sheet, query)
+    if data is None:
+        return None
+    values, denominator = data.values, data.denominator
+    labels, periods = data.labels, data.periods
+    metric = _metric_label(sheet, query.metric)
+    ratio = query.metric is not None and (
+        query.metric[0] == "margin" or bool(_RATIO_RE.search(metric))
+    )
+    if ratio and query.aggregate == "sum" and query.metric[0] != "margin":
+        return None  # adding up percentages means nothing
+
+    keep = pd.Series(True, index=values.index)
+    if query.period:
+        if periods is None:
+            return None
+        mask = query.period.mask(periods)
+        if mask is None:
+            return None
+        keep &= mask.fillna(False).astype(bool)
+    if query.compare:
+        op, bound = query.compare
+        compare = {">": values.gt, ">=": values.ge, "<": values.lt, "<=": values.le}[op]
+        keep &= compare(bound)
+    values, labels = values[keep], labels[keep]
+    denominator = None if denominator is None else denominator[keep]
+    periods = None if periods is None else periods[keep]
+    if query.metric is not None:
+        present = values.notna()
+        values, labels = values[present], labels[present]
+        denominator = None if denominator is None else denominator[present]
+        periods = None if periods is None else periods[present]
+    if values.empty:
+        return None
+
+    scope = []
+    if query.categories:
+        scope.append(", ".join(value for _, value in query.categories))
+    if query.period:
+        scope.append(query.period.label())
+    if query.compare:
+        scope.append(f"{metric} {query.compare[0]} {_fmt(query.compare[1], False)}")
+    where = f" ({'; '.join(scope)})" if scope else ""
+
+    if query.group is not None:
+        if isinstance(query.group, int):
+            keys = data.group_keys[keep]
+            keys = keys[values.index]
+        else:
+            if periods is None or freq_of(periods) is None:
+                return None
+            if "MQY".index(freq_of(periods)) > "MQY".index(query.group):
+                return None  # quarterly data cannot be split into months
+            keys = periods.map(lambda p: p.asfreq(query.group))
+        if query.aggregate == "count":
+            inner = "count"
+        else:
+            inner = "mean" if ratio and denominator is None else "sum"
+        if query.aggregate in ("mean", "median") and not ratio:
+            inner = "sum"  # "average monthly opex" = mean of the monthly totals
+        grouped = values.groupby(keys.to_numpy(), sort=True)
+        if denominator is not None:
+            totals = denominator.groupby(keys.to_numpy(), sort=True).sum()
+            per_group = grouped.sum() / totals
+        elif inner == "count":
+            per_group = grouped.count().astype(float)
+        else:
+            per_group = getattr(grouped, inner)()
+        if isinstance(query.group, int):
+            unit = sheet.names[query.group]
+        else:
+            unit = {"M": "month", "Q": "quarter", "Y": "year"}[query.group]
+        name = f"{metric or 'rows'} per {unit}"
+        if query.aggregate in ("max", "min"):
+            best = getattr(per_group, f"idx{query.aggregate}")()
+            extreme = _AGGREGATE_LABEL[query.aggregate].lower()
+            head = (
+                f"**{best}** had the {extreme} {metric or 'row count'}{where}: "
+                f"**{_fmt(per_group[best], ratio)}**"
+            )
+        elif query.aggregate in ("mean", "median"):
+            value = getattr(per_group, query.aggregate)()
+            head = (
+                f"**{_AGGREGATE_LABEL[query.aggregate]} {name}{where}: "
+                f"{_fmt(value, ratio)}** (across {len(per_group)} {unit}s)"
+            )
+        else:
+            head = f"**{_AGGREGATE_LABEL[query.aggregate]} {name}{where}:**"
+        listed = per_group.head(MAX_LISTED_GROUPS)
+        lines = [f"- {key}: {_fmt(value, ratio)}" for key, value in listed.items()]
+        if len(per_group) > len(listed):
+            lines.append(f"- … {len(per_group) - len(listed)} more")
+        return f"{head}\n\n" + "\n".join(lines) + f"\n\n{_FOOTNOTE}"
+
+    if query.aggregate in ("max", "min") and denominator is None:
+        position = values.idxmax() if query.aggregate == "max" else values.idxmin()
+        value = values[position]
+        return (
+            f"**{_AGGREGATE_LABEL[query.aggregate]} {metric}{where}: "
+            f"{_fmt(value, ratio)}** ({labels[position]})\n\n{_FOOTNOTE}"
+        )
+    value = _reduce(values, denominator, query.aggregate)
+    if query.aggregate == "count":
+        return f"**{int(value):,}** rows{where}.\n\n{_FOOTNOTE}"
+    if denominator is not None:
+        label, basis = "Overall", "sum of profit / sum of revenue"
+    else:
+        label = _AGGREGATE_LABEL[query.aggregate]
+        basis = f"{query.aggregate} of {len(values)} values"
+    return f"**{label} {metric}{where}: {_fmt(value, ratio)}** ({basis})\n\n{_FOOTNOTE}"
+
+
+# ──────────────────────────────── Engine ─────────────────────────────────── #
+
+
+class LocalAnswerer:
+    """`answer()` plus counters of questions answered here vs passed to the LLM."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.handled = self.fallbacks = 0
+
+    @span("local_answer")
+    def answer(
+        self, question: str, df: pd.DataFrame, header_row: int = 1
+    ) -> str | None:
+        try:
+            query = parse_query(question, df)
+            answer = evaluate(query, df, header_row) if query is not None else None
+        except (ArithmeticError, KeyError, TypeError, ValueError) as exc:
+            logging.warning("Local answer failed for %r – %s", question, exc)
+            answer = None
+        with self._lock:
+            if answer is None:
+                self.fallbacks += 1
+            else:
+                self.handled += 1
+            handled, fallbacks = self.handled, self.fallbacks
+        if answer is not None:
+            logging.info(
+                "Answered locally – %d handled, %d passed to the LLM: %s",
+                handled, fallbacks, question,
+            )
+        return answer
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"handled": self.handled, "fallbacks": self.fallbacks}
+
+
+LOCAL_ANSWERS = LocalAnswerer()
@@ -0,0 +1,1353 @@
+"""
+recalc.py – local what-if recalculation over the workbook's own formulas.
+
+Formulas from the formula index are parsed once (openpyxl's tokenizer → a
+small expression tree) and evaluated against per-sheet value matrices: an
+object matrix for the raw values plus a float64 twin (NaN = not a number),
+so ranges are numpy slices and SUM / SUMPRODUCT / NPV / … run vectorised.
+
+`RecalcEngine.set_inputs()` is incremental: only the transitive dependents
+of the changed cells are marked dirty and recomputed, each after the dirty
+cells it reads (topological order without expanding ranges cell by cell).
+Formula cells without a cached value (e.g. files written by a library, not
+Excel) are computed on demand the same way.
+
+Scenarios run on `RecalcEngine.fork()`s of one base engine per workbook, so
+parsed formulas and sheet matrices are built once and each scenario starts
+from the values as loaded.
+"""
+import bisect
+import copy
+import datetime
+import math
+import re
+import threading
+from decimal import ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, Decimal
+from typing import Any, Callable, NamedTuple
+
+import numpy as np
+from openpyxl.formula.tokenizer import Token, Tokenizer, TokenizerError
+from openpyxl.utils.cell import (
+    column_index_from_string,
+    get_column_letter,
+    range_boundaries,
+)
+from openpyxl.utils.datetime import to_excel
+
+from formula_index import (
+    MAX_ROW,
+    CellKey,
+    FormulaIndex,
+    Ref,
+    SheetGrid,
+    format_value,
+    parse_reference,
+    qualified,
+    split_cell,
+    split_formula,
+)
+from ingest import LazyWorkbook
+from quality import ERROR_TOKENS
+
+# How many recalculated cells are listed individually in a scenario prompt
+MAX_LISTED_CHANGES = 40
+
+
+class FormulaError(Exception):
+    """An Excel error value (#DIV/0!, #N/A, …) produced during evaluation."""
+
+    def __init__(self, token: str) -> None:
+        super().__init__(token)
+        self.token = token
+
+
+# ─────────────────────────────── Parsing ─────────────────────────────────── #
+#
+# Nodes are tuples: ("num", 1.0), ("str", "x"), ("bool", True), ("err", "#N/A"),
+# ("blank",), ("ref", Ref), ("name", "Revenue"), ("array", Block),
+# ("neg", node), ("pct", node), ("op", "+", left, right), ("fn", "SUM", [args]).
+# Trees are parsed from the formula's shape (see `split_formula`), where each
+# reference is a ("slot", i) node, and then bound to the cell's own refs – a
+# column of filled-down formulas is tokenized once.
+
+_INFIX_POWER = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5,
+}
+# Excel binds unary minus tighter than ^ (=-2^2 is 4)
+_PREFIX_POWER = 6
+_SLOT_RE = re.compile(r"_REF(\d+)_")
+
+
+class _Parser:
+    def __init__(
+        self, tokens: list[Token], sheet: str, sheet_names: dict[str, str]
+    ) -> None:
+        self.tokens = tokens
+        self.pos = 0
+        self.sheet = sheet
+        self.sheet_names = sheet_names
+
+    def peek(self) -> Token | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Token:
+        if self.pos >= len(self.tokens):
+            raise ValueError("Unexpected end of formula")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def expression(self, min_power: int = 0) -> tuple:
+        left = self.prefix()
+        while (token := self.peek()) is not None:
+            if token.type == Token.OP_POST:
+                self.take()
+                left = ("pct", left)
+                continue
+            power = _INFIX_POWER.get(token.value) if token.type == Token.OP_IN else None
+            if power is None or power <= min_power:
+                break
+            self.take()
+            left = ("op", token.value, left, self.expression(power))
+        return left
+
+    def prefix(self) -> tuple:
+        token = self.take()
+        if token.type == Token.OPERAND:
+            return self.operand(token)
+        if token.type == Token.OP_PRE:
+            operand = self.expression(_PREFIX_POWER)
+            return ("neg", operand) if token.value == "-" else operand
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            return self.function(token.value[:-1])
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            inner = self.expression()
+            self.expect(Token.PAREN, Token.CLOSE)
+            return inner
+        if token.type == Token.ARRAY and token.subtype == Token.OPEN:
+            return self.array()
+        raise ValueError(f"Unexpected token {token.value!r}")
+
+    def expect(self, kind: str, subtype: str) -> None:
+        token = self.take()
+        if token.type != kind or token.subtype != subtype:
+            raise ValueError(f"Expected {kind} {subtype}, got {token.value!r}")
+
+    def operand(self, token: Token) -> tuple:
+        if token.subtype == Token.NUMBER:
+            return ("num", float(token.value))
+        if token.subtype == Token.TEXT:
+            return ("str", token.value[1:-1].replace('""', '"'))
+        if token.subtype == Token.LOGICAL:
+            return ("bool", token.value.upper() == "TRUE")
+        if token.subtype == Token.ERROR:
+            return ("err", token.value)
+        slot = _SLOT_RE.fullmatch(token.value)
+        if slot:
+            return ("slot", int(slot[1]))
+        ref = parse_reference(token.value, self.sheet, self.sheet_names)
+        return ("ref", ref) if ref is not None else ("name", token.value)
+
+    def function(self, name: str) -> tuple:
+        name = re.sub(r"^(_xlfn\.|_xlws\.)+", "", name, flags=re.I).upper()
+        args = []
+        expecting_arg = True
+        while True:
+            token = self.peek()
+            if token is None:
+                raise ValueError(f"Unclosed {name}(")
+            if token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                self.take()
+                if args and expecting_arg:
+                    args.append(("blank",))  # trailing empty argument, e.g. IF(A1,1,)
+                break
+            if token.type == Token.SEP and token.subtype == Token.ARG:
+                self.take()
+                if expecting_arg:
+                    args.append(("blank",))
+                expecting_arg = True
+                continue
+            args.append(self.expression())
+            expecting_arg = False
+        return ("fn", name, args)
+
+    def array(self) -> tuple:
+        rows, row = [], []
+        while True:
+            token = self.take()
+            if token.type == Token.ARRAY and token.subtype == Token.CLOSE:
+                rows.append(row)
+                break
+            if token.type == Token.SEP:
+                if token.subtype == Token.ROW:
+                    rows.append(row)
+                    row = []
+                continue
+            negate = token.type == Token.OP_PRE and token.value == "-"
+            if token.type == Token.OP_PRE:
+                token = self.take()
+            value = self.operand(token)[1]
+            row.append(-value if negate else value)
+        return ("array", Block.from_values(np.array(rows, dtype=object)))
+
+
+def parse_formula(
+    formula: str, sheet: str, sheet_names: dict[str, str] | None = None
+) -> tuple:
+    """Parse "=…" into a node tree. Raises ValueError on syntax we cannot read."""
+    try:
+        tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+    except TokenizerError as exc:
+        raise ValueError(str(exc)) from exc
+    parser = _Parser(tokens, sheet, sheet_names or {})
+    node = parser.expression()
+    if parser.peek() is not None:
+        raise ValueError(f"Unexpected token {parser.peek().value!r}")
+    return node
+
+
+def _bind(node: tuple, refs: list[Ref]) -> tuple:
+    """Replace the ("slot", i) nodes of a shape tree with ("ref", refs[i])."""
+    kind = node[0]
+    if kind == "slot":
+        return ("ref", refs[node[1]])
+    if kind in ("neg", "pct"):
+        return (kind, _bind(node[1], refs))
+    if kind == "op":
+        return ("op", node[1], _bind(node[2], refs), _bind(node[3], refs))
+    if kind == "fn":
+        return ("fn", node[1], [_bind(arg, refs) for arg in node[2]])
+    return node
+
+
+# ──────────────────────────────── Values ─────────────────────────────────── #
+
+
+def _is_error(value: Any) -> bool:
+    return isinstance(value, str) and value in ERROR_TOKENS
+
+
+def _as_float(value: Any) -> float:
+    """Numeric view of a cell for the float matrix – NaN for non-numbers."""
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return float(to_excel(value))
+    return math.nan
+
+
+_to_float = np.frompyfunc(_as_float, 1, 1)
+_to_error = np.frompyfunc(_is_error, 1, 1)
+
+
+class Block:
+    """A range (or array constant): parallel object / float / error views."""
+
+    __slots__ = ("obj", "num", "err")
+
+    def __init__(self, obj: np.ndarray, num: np.ndarray, err: np.ndarray) -> None:
+        self.obj, self.num, self.err = obj, num, err
+
+    @classmethod
+    def from_values(cls, obj: np.ndarray) -> "Block":
+        obj = np.atleast_2d(obj)
+        if obj.size == 0:
+            return cls(obj, np.empty(obj.shape), np.zeros(obj.shape, dtype=bool))
+        return cls(obj, _to_float(obj).astype(float), _to_error(obj).astype(bool))
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.obj.shape
+
+    def check(self) -> None:
+        """Raise the first error value in the block, like Excel aggregates do."""
+        if self.err.any():
+            raise FormulaError(self.obj[self.err][0])
+
+    def numbers(self) -> np.ndarray:
+        self.check()
+        flat = self.num.ravel()
+        return flat[~np.isnan(flat)]
+
+    def value(self, row: int, col: int) -> Any:
+        value = self.obj[row, col]
+        if _is_error(value):
+            raise FormulaError(value)
+        return value
+
+
+class SheetState:
+    """Mutable value matrices for one sheet, indexed [row - 1, col - 1]."""
+
+    def __init__(self, grid: SheetGrid, rows: int, cols: int) -> None:
+        base = grid.block(Ref("", 1, 1, max(rows, 1), max(cols, 1)))
+        self.obj = base
+        self.num = _to_float(base).astype(float)
+        self.err = _to_error(base).astype(bool)
+
+    def _grow(self, row: int, col: int) -> None:
+        rows, cols = self.obj.shape
+        if row <= rows and col <= cols:
+            return
+        shape = (max(rows, row), max(cols, col))
+        obj = np.full(shape, None, dtype=object)
+        num = np.full(shape, np.nan)
+        err = np.zeros(shape, dtype=bool)
+        obj[:rows, :cols] = self.obj
+        num[:rows, :cols] = self.num
+        err[:rows, :cols] = self.err
+        self.obj, self.num, self.err = obj, num, err
+
+    def copy(self) -> "SheetState":
+        state = copy.copy(self)
+        state.obj, state.num = self.obj.copy(), self.num.copy()
+        state.err = self.err.copy()
+        return state
+
+    def get(self, row: int, col: int) -> Any:
+        if row > self.obj.shape[0] or col > self.obj.shape[1]:
+            return None
+        return self.obj[row - 1, col - 1]
+
+    def put(self, row: int, col: int, value: Any) -> None:
+        self._grow(row, col)
+        self.obj[row - 1, col - 1] = value
+        self.num[row - 1, col - 1] = _as_float(value)
+        self.err[row - 1, col - 1] = _is_error(value)
+
+    def block(self, ref: Ref) -> Block:
+        """Views into the matrices – no copy for ranges inside the used area."""
+        if ref.max_row == MAX_ROW:  # whole columns stop at the last used row
+            ref = ref._replace(max_row=max(ref.min_row, self.obj.shape[0]))
+        rows = slice(ref.min_row - 1, ref.max_row)
+        cols = slice(ref.min_col - 1, ref.max_col)
+        view = Block(self.obj[rows, cols], self.num[rows, cols], self.err[rows, cols])
+        shape = (ref.max_row - ref.min_row + 1, ref.max_col - ref.min_col + 1)
+        if view.shape == shape:
+            return view
+        padded = np.full(shape, None, dtype=object)  # reaches past the used area
+        padded[:view.shape[0], :view.shape[1]] = view.obj
+        return Block.from_values(padded)
+
+
+# ─────────────────────────────── Functions ───────────────────────────────── #
+
+
+def _num(value: Any) -> float:
+    """Scalar → number with Excel's coercions (blank = 0, TRUE = 1, "12" = 12)."""
+    if isinstance(value, Block):
+        if value.shape != (1, 1):
+            raise FormulaError("#VALUE!")
+        value = value.value(0, 0)
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return float(to_excel(value))
+    if isinstance(value, str):
+        if _is_error(value):
+            raise FormulaError(value)
+        text = value.replace(",", "").strip()
+        scale = 100.0 if text.endswith("%") else 1.0
+        try:
+            return float(text.rstrip("%")) / scale
+        except ValueError:
+            raise FormulaError("#VALUE!") from None
+    raise FormulaError("#VALUE!")
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, Block):
+        if value.shape != (1, 1):
+            raise FormulaError("#VALUE!")
+        return value.value(0, 0)
+    if isinstance(value, np.ndarray):
+        return value.flat[0] if value.size else None
+    return value
+
+
+def _bool(value: Any) -> bool:
+    value = _scalar(value)
+    if isinstance(value, str) and value.upper() in ("TRUE", "FALSE"):
+        return value.upper() == "TRUE"
+    return _num(value) != 0
+
+
+def _text(value: Any) -> str:
+    value = _scalar(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.15g}"
+    return str(value)
+
+
+def _numbers(args: list) -> np.ndarray:
+    """Numbers for aggregates: ranges skip text / blanks, scalars are coerced."""
+    parts = []
+    for arg in args:
+        if isinstance(arg, Block):
+            parts.append(arg.numbers())
+        elif isinstance(arg, np.ndarray):
+            flat = arg.astype(float).ravel()
+            parts.append(flat[~np.isnan(flat)])
+        elif arg is not None:
+            parts.append(np.array([_num(arg)]))
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def _array(value: Any) -> np.ndarray:
+    """Float array view for element-wise maths (blank / text → 0)."""
+    if isinstance(value, Block):
+        value.check()
+        return np.nan_to_num(value.num)
+    if isinstance(value, np.ndarray):
+        return value.astype(float)
+    return np.array([[_num(value)]])
+
+
+def _round(value: float, digits: float, mode: str) -> float:
+    quantum = Decimal(1).scaleb(-int(digits))
+    if digits >= 0:
+        return float(Decimal(repr(value)).quantize(quantum, rounding=mode))
+    return float(
+        (Decimal(repr(value)) / quantum).quantize(Decimal(1), rounding=mode) * quantum
+    )
+
+
+def _average(*args):
+    values = _numbers(list(args))
+    if not len(values):
+        raise FormulaError("#DIV/0!")
+    return float(values.mean())
+
+
+def _count(*args):
+    total = len(_numbers([a for a in args if isinstance(a, (Block, np.ndarray))]))
+    total += sum(
+        1 for a in args if isinstance(a, (int, float)) and not isinstance(a, bool)
+    )
+    return float(total)
+
+
+def _counta(*args):
+    total = 0
+    for arg in args:
+        if isinstance(arg, Block):
+            total += arg.obj.size - int(np.count_nonzero(np.equal(arg.obj, None)))
+        elif arg is not None:
+            total += 1
+    return float(total)
+
+
+def _criteria(criteria: Any) -> Callable[[Block], np.ndarray]:
+    """SUMIF / COUNTIF criteria such as ">0", "=x", 5 or "<>" → mask function."""
+    criteria = _scalar(criteria)
+    if not isinstance(criteria, str):
+        target = _num(criteria)
+        return lambda block: block.num == target
+    m = re.match(r"^(<=|>=|<>|<|>|=)?(.*)$", criteria, re.S)
+    op, operand = m.group(1) or "=", m.group(2)
+    try:
+        target = float(operand)
+    except ValueError:
+        lowered = operand.lower()
+        texts = np.frompyfunc(lambda v: str(v).lower() if v is not None else "", 1, 1)
+        if op == "=":
+            return lambda block: texts(block.obj).astype(str) == lowered
+        if op == "<>":
+            return lambda block: texts(block.obj).astype(str) != lowered
+        raise FormulaError("#VALUE!") from None
+    compare = {
+        "=": np.equal, "<>": np.not_equal, "<": np.less,
+        ">": np.greater, "<=": np.less_equal, ">=": np.greater_equal,
+    }[op]
+    return lambda block: np.asarray(compare(block.num, target)) & ~np.isnan(block.num)
+
+
+def _sumif(block, criteria, sum_block=None):
+    mask = _criteria(criteria)(block)
+    # Excel sizes sum_range like the criteria range, from its top-left cell
+    values = (sum_block if isinstance(sum_block, Block) else block).num
+    values = values[:mask.shape[0], :mask.shape[1]]
+    return float(np.nansum(values[mask[:values.shape[0], :values.shape[1]]]))
+
+
+def _countif(block, criteria):
+    return float(np.count_nonzero(_criteria(criteria)(block)))
+
+
+def _averageif(block, criteria, avg_block=None):
+    mask = _criteria(criteria)(block)
+    values = (avg_block if isinstance(avg_block, Block) else block).num[mask]
+    values = values[~np.isnan(values)]
+    if not len(values):
+        raise FormulaError("#DIV/0!")
+    return float(values.mean())
+
+
+def _sumproduct(*arrays):
+    shape = None
+    product = None
+    for arr in arrays:
+        values = _array(arr)
+        if shape is not None and values.shape != shape:
+            raise FormulaError("#VALUE!")
+        shape = values.shape
+        product = values if product is None else product * values
+    return float(product.sum()) if product is not None else 0.0
+
+
+def _index(block, row=None, col=None):
+    if not isinstance(block, Block):
+        block = Block.from_values(np.array([[_scalar(block)]], dtype=object))
+    rows, cols = block.shape
+    r = int(_num(row)) if row is not None else 0
+    c = int(_num(col)) if col is not None else 0
+    if col is None and rows == 1 and cols > 1:  # INDEX(row vector, n)
+        r, c = 1, r
+    r, c = r or 1, c or 1
+    if not (1 <= r <= rows and 1 <= c <= cols):
+        raise FormulaError("#REF!")
+    return block.value(r - 1, c - 1)
+
+
+def _lookup_position(value: Any, block: Block, match_type: float = 1) -> int:
+    """0-based position of `value` in a 1-D block (MATCH semantics)."""
+    value = _scalar(value)
+    flat_obj = block.obj.ravel()
+    flat_num = block.num.ravel()
+    if match_type == 0:
+        if isinstance(value, str):
+            lowered = value.lower()
+            hits = [
+                i for i, v in enumerate(flat_obj)
+                if isinstance(v, str) and v.lower() == lowered
+            ]
+        else:
+            hits = np.flatnonzero(flat_num == _num(value)).tolist()
+        if not hits:
+            raise FormulaError("#N/A")
+        return hits[0]
+    target = _num(value)
+    hits = np.flatnonzero(flat_num <= target if match_type > 0 else flat_num >= target)
+    if not len(hits):
+        raise FormulaError("#N/A")
+    return int(hits.max())
+
+
+def _match(value, block, match_type=None):
+    if not isinstance(block, Block):
+        raise FormulaError("#N/A")
+    match_type = 1 if match_type is None else _num(match_type)
+    return float(_lookup_position(value, block, match_type) + 1)
+
+
+def _vlookup(value, block, col, approximate=None):
+    exact = approximate is not None and not _bool(approximate)
+    first = Block(block.obj[:, :1], block.num[:, :1], block.err[:, :1])
+    pos = _lookup_position(value, first, 0 if exact else 1)
+    c = int(_num(col))
+    if not 1 <= c <= block.shape[1]:
+        raise FormulaError("#REF!")
+    return block.value(pos, c - 1)
+
+
+def _npv(rate, *values):
+    rate = _num(rate)
+    flows = _numbers(list(values))
+    return float(np.sum(flows / (1 + rate) ** np.arange(1, len(flows) + 1)))
+
+
+def _irr(values, guess=None):
+    flows = _numbers([values])
+    rate = _num(guess) if guess is not None else 0.1
+    periods = np.arange(len(flows))
+    for _ in range(100):
+        factors = (1 + rate) ** periods
+        npv = np.sum(flows / factors)
+        slope = np.sum(-periods * flows / (factors * (1 + rate)))
+        if slope == 0:
+            break
+        step = npv / slope
+        rate -= step
+        if abs(step) < 1e-10:
+            return float(rate)
+    raise FormulaError("#NUM!")
+
+
+def _pmt(rate, nper, pv, fv=None, when=None):
+    rate, nper, pv = _num(rate), _num(nper), _num(pv)
+    fv, when = _num(fv), _num(when)
+    if rate == 0:
+        return -(pv + fv) / nper
+    growth = (1 + rate) ** nper
+    return -(rate * (pv * growth + fv)) / ((1 + rate * when) * (growth - 1))
+
+
+def _fv(rate, nper, pmt, pv=None, when=None):
+    rate, nper, pmt = _num(rate), _num(nper), _num(pmt)
+    pv, when = _num(pv), _num(when)
+    if rate == 0:
+        return -(pv + pmt * nper)
+    growth = (1 + rate) ** nper
+    return -(pv * growth + pmt * (1 + rate * when) * (growth - 1) / rate)
+
+
+def _pv(rate, nper, pmt, fv=None, when=None):
+    rate, nper, pmt = _num(rate), _num(nper), _num(pmt)
+    fv, when = _num(fv), _num(when)
+    if rate == 0:
+        return -(fv + pmt * nper)
+    growth = (1 + rate) ** nper
+    return -(fv + pmt * (1 + rate * when) * (growth - 1) / rate) / growth
+
+
+def _divide(a: float, b: float) -> float:
+    if b == 0:
+        raise FormulaError("#DIV/0!")
+    return a / b
+
+
+def _sqrt(x):
+    x = _num(x)
+    if x < 0:
+        raise FormulaError("#NUM!")
+    return math.sqrt(x)
+
+
+def _ln(x):
+    x = _num(x)
+    if x <= 0:
+        raise FormulaError("#NUM!")
+    return math.log(x)
+
+
+def _min_max(reduce):
+    def aggregate(*args):
+        values = _numbers(list(args))
+        return float(reduce(values)) if len(values) else 0.0
+    return aggregate
+
+
+# Eagerly evaluated functions: name → callable(*evaluated args)
+FUNCTIONS: dict[str, Callable[..., Any]] = {
+    "SUM": lambda *a: float(_numbers(list(a)).sum()),
+    "AVERAGE": _average,
+    "MIN": _min_max(np.min),
+    "MAX": _min_max(np.max),
+    "COUNT": _count,
+    "COUNTA": _counta,
+    "PRODUCT": lambda *a: float(np.prod(_numbers(list(a)))),
+    "SUMPRODUCT": _sumproduct,
+    "SUMIF": _sumif,
+    "COUNTIF": _countif,
+    "AVERAGEIF": _averageif,
+    "ABS": lambda x: abs(_num(x)),
+    "ROUND": lambda x, d=None: _round(_num(x), _num(d), ROUND_HALF_UP),
+    "ROUNDUP": lambda x, d=None: _round(_num(x), _num(d), ROUND_UP),
+    "ROUNDDOWN": lambda x, d=None: _round(_num(x), _num(d), ROUND_DOWN),
+    "INT": lambda x: float(math.floor(_num(x))),
+    "MOD": lambda x, d: _num(x) - _num(d) * math.floor(_divide(_num(x), _num(d))),
+    "POWER": lambda x, p: _num(x) ** _num(p),
+    "SQRT": _sqrt,
+    "EXP": lambda x: math.exp(_num(x)),
+    "LN": _ln,
+    "AND": lambda *a: all(_bool(x) for x in a),
+    "OR": lambda *a: any(_bool(x) for x in a),
+    "NOT": lambda x: not _bool(x),
+    "INDEX": _index,
+    "MATCH": _match,
+    "VLOOKUP": _vlookup,
+    "NPV": _npv,
+    "IRR": _irr,
+    "PMT": _pmt,
+    "FV": _fv,
+    "PV": _pv,
+    "CONCATENATE": lambda *a: "".join(_text(x) for x in a),
+    "CONCAT": lambda *a: "".join(_text(x) for x in a),
+}
+
+
+def _compare(op: str, a: Any, b: Any) -> bool:
+    a, b = _scalar(a), _scalar(b)
+    for value in (a, b):
+        if _is_error(value):
+            raise FormulaError(value)
+
+    def rank(v):  # Excel orders numbers < text < logicals
+        if isinstance(v, bool):
+            return 2, v
+        if isinstance(v, str):
+            return 1, v.lower()
+        return 0, _num(v)
+
+    if a is None:
+        a = "" if isinstance(b, str) else 0.0
+    if b is None:
+        b = "" if isinstance(a, str) else 0.0
+    left, right = rank(a), rank(b)
+    return {
+        "=": left == right, "<>": left != right, "<": left < right,
+        ">": left > right, "<=": left <= right, ">=": left >= right,
+    }[op]
+
+
+_ARITHMETIC = {
+    "+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "^": np.power,
+}
+
+
+# ──────────────────────────────── Engine ─────────────────────────────────── #
+
+
+class RecalcEngine:
+    """
+    Evaluates the workbook's formulas locally. Typical use:
+
+        engine = RecalcEngine(index, wb)
+        changes = engine.set_inputs({("P&L", "B2"): 121.0})
+        # {("P&L", "B2"): (110, 121.0), ("P&L", "D2"): (50, 61.0), …}
+
+    Long-lived engines are used through `fork()`: the base keeps the loaded
+    values, each fork gets its own copy of the sheets it touches.
+    """
+
+    def __init__(self, index: FormulaIndex, wb: LazyWorkbook) -> None:
+        self.index = index
+        self.wb = wb
+        self._names = {name.lower(): name for name in index.sheet_names}
+        self._sheets: dict[str, SheetState] = {}
+        self._trees: dict[CellKey, tuple] = {}
+        self._shapes: dict[tuple[str, str], tuple] = {}  # (shape, sheet) → tree
+        # cells whose stored value is stale: (sheet, column) → sorted rows
+        self._pending: dict[tuple[str, int], list[int]] = {}
+        self._by_sheet: dict[str, list[str]] = {}
+        for sheet, cell in index.formulas:
+            self._by_sheet.setdefault(sheet, []).append(cell)
+        self._computing: set[CellKey] = set()  # cells on the current evaluation path
+        self.unsupported: set[str] = set()
+        self.circular: set[CellKey] = set()
+        self._base: RecalcEngine | None = None
+        self._lock = threading.Lock()
+
+    def fork(self) -> "RecalcEngine":
+        """
+        A scenario copy that shares this engine's parsed formulas. Sheets are
+        built on the base (once) and copied into the fork on first use, so
+        the base never sees the fork's inputs. Safe to call from threads.
+        """
+        engine = copy.copy(self)
+        engine._base = self
+        engine._sheets, engine._pending, engine._computing = {}, {}, set()
+        engine.unsupported, engine.circular = set(), set()
+        return engine
+
+    def _snapshot(self, sheet: str) -> tuple[SheetState | None, dict]:
+        """Copy of a base sheet and its pending cells, for a fork."""
+        with self._lock:
+            state = self.sheet_state(sheet)
+            if state is None:
+                return None, {}
+            pending = {k: list(v) for k, v in self._pending.items() if k[0] == sheet}
+            return state.copy(), pending
+
+    def __sizeof__(self) -> int:
+        """Rough footprint of the built sheets, for the bounded caches."""
+        return sum(
+            50 * state.obj.size + state.num.nbytes + state.err.nbytes
+            for state in list(self._sheets.values())
+        )
+
+    # ── sheet state ── #
+
+    def resolve_sheet(self, name: str) -> str | None:
+        """Real spelling of a sheet name (Excel names are case-insensitive)."""
+        return self._names.get(name.strip("'").lower())
+
+    def sheet_state(self, sheet: str) -> SheetState | None:
+        """Value matrices of `sheet`, built on first use; None if unknown."""
+        state = self._sheets.get(sheet)
+        if state is not None or sheet not in self.wb:
+            return state
+        if self._base is not None:
+            state, pending = self._base._snapshot(sheet)
+            if state is not None:
+                self._sheets[sheet] = state
+                self._pending.update(pending)
+            return state
+        grid = SheetGrid.for_sheet(self.wb, sheet)
+        rows, cols = grid.last_row, grid.df.shape[1]
+        dim = self.wb.dimensions.get(sheet)
+        if dim:
+            try:
+                _, _, max_col, max_row = range_boundaries(dim)
+                rows, cols = max(rows, max_row or 0), max(cols, max_col or 0)
+            except (TypeError, ValueError):
+                pass
+        cells = [split_cell(c) for c in self._by_sheet.get(sheet, ())]
+        if cells:
+            rows = max(rows, max(r for r, _ in cells))
+            cols = max(cols, max(c for _, c in cells))
+        state = self._sheets[sheet] = SheetState(grid, rows, cols)
+        # Formulas without a cached result are computed when first read
+        for row, col in cells:
+            if state.get(row, col) is None:
+                self._mark((sheet, f"{get_column_letter(col)}{row}"))
+        return state
+
+    def _mark(self, key: CellKey) -> None:
+        row, col = split_cell(key[1])
+        rows = self._pending.setdefault((key[0], col), [])
+        i = bisect.bisect_left(rows, row)
+        if i == len(rows) or rows[i] != row:
+            rows.insert(i, row)
+
+    def _unmark(self, key: CellKey) -> bool:
+        row, col = split_cell(key[1])
+        rows = self._pending.get((key[0], col))
+        if not rows:
+            return False
+        i = bisect.bisect_left(rows, row)
+        if i < len(rows) and rows[i] == row:
+            del rows[i]
+            return True
+        return False
+
+    def _is_pending(self, key: CellKey) -> bool:
+        row, col = split_cell(key[1])
+        rows = self._pending.get((key[0], col))
+        if not rows:
+            return False
+        i = bisect.bisect_left(rows, row)
+        return i < len(rows) and rows[i] == row
+
+    def _pending_in(self, ref: Ref) -> list[CellKey]:
+        found = []
+        for col in range(ref.min_col, ref.max_col + 1):
+            rows = self._pending.get((ref.sheet, col))
+            if rows:
+                lo = bisect.bisect_left(rows, ref.min_row)
+                hi = bisect.bisect_right(rows, ref.max_row)
+                letter = get_column_letter(col)
+                found.extend((ref.sheet, f"{letter}{row}") for row in rows[lo:hi])
+        return found
+
+    # ── evaluation ── #
+
+    def _resolve(self, keys: list[CellKey]) -> None:
+        """
+        Bring pending cells up to date, precedents first. Iterative DFS: a
+        cell is computed when its (key, True) marker comes back off the
+        stack, i.e. after every pending cell it reads. A cell met again while
+        it is still on the path is a circular reference – its stored value is
+        used as-is.
+        """
+        stack = [(key, False) for key in keys]
+        while stack:
+            key, expanded = stack.pop()
+            if not self._is_pending(key):
+                continue
+            if expanded:
+                self._computing.discard(key)
+                self._unmark(key)
+                self._store(key, self._compute(key))
+                continue
+            if key in self._computing:
+                self.circular.add(key)
+                continue
+            self._computing.add(key)
+            stack.append((key, True))
+            for ref in self.index.precedents_of(*key):
+                if self.sheet_state(ref.sheet) is None:
+                    continue
+                blockers = self._pending_in(ref)
+                stack.extend((b, False) for b in blockers if b != key)
+
+    def _compute(self, key: CellKey) -> Any:
+        tree = self._trees.get(key)
+        if tree is None:
+            shape, refs = split_formula(self.index.formulas[key], key[0], self._names)
+            template = self._shapes.get((shape, key[0]))
+            if template is None:
+                try:
+                    template = parse_formula(shape, key[0], self._names)
+                except ValueError:
+                    template = ("err", "#NAME?")
+                self._shapes[shape, key[0]] = template
+            try:
+                tree = self._trees[key] = _bind(template, refs)
+            except IndexError:
+                tree = self._trees[key] = ("err", "#NAME?")
+        try:
+            value = self._eval(tree, key[0])
+        except FormulaError as exc:
+            return exc.token
+        except (ArithmeticError, ValueError):
+            return "#NUM!"
+        if isinstance(value, Block):
+            return value.obj[0, 0] if value.obj.size else None
+        if isinstance(value, np.ndarray):
+            return float(value.flat[0]) if value.size else None
+        if isinstance(value, (float, np.floating)):
+            value = float(value)
+            if math.isnan(value) or math.isinf(value):
+                return "#NUM!"
+        return value
+
+    def _store(self, key: CellKey, value: Any) -> None:
+        row, col = split_cell(key[1])
+        self.sheet_state(key[0]).put(row, col, value)
+
+    def _eval(self, node: tuple, sheet: str) -> Any:
+        kind = node[0]
+        if kind in ("num", "str", "bool"):
+            return node[1]
+        if kind == "blank":
+            return None
+        if kind == "err":
+            raise FormulaError(node[1])
+        if kind == "ref":
+            return self._read(node[1])
+        if kind == "array":
+            return node[1]
+        if kind == "name":
+            self.unsupported.add(node[1])
+            raise FormulaError("#NAME?")
+        if kind == "neg":
+            value = self._eval(node[1], sheet)
+            if isinstance(value, (Block, np.ndarray)):
+                return -_array(value)
+            return -_num(value)
+        if kind == "pct":
+            value = self._eval(node[1], sheet)
+            if isinstance(value, (Block, np.ndarray)):
+                return _array(value) / 100
+            return _num(value) / 100
+        if kind == "op":
+            left, right = self._eval(node[2], sheet), self._eval(node[3], sheet)
+            return self._operator(node[1], left, right)
+        if kind == "fn":
+            return self._call(node[1], node[2], sheet)
+        raise ValueError(f"Unknown node {kind}")
+
+    def _read(self, ref: Ref) -> Any:
+        state = self.sheet_state(ref.sheet)
+        if state is None:
+            raise FormulaError("#REF!")
+        pending = [key for key in self._pending_in(ref) if key not in self._computing]
+        if pending:
+            self._resolve(pending)
+        if ref.size == 1:
+            value = state.get(ref.min_row, ref.min_col)
+            if _is_error(value):
+                raise FormulaError(value)
+            return value
+        return state.block(ref)
+
+    def _operator(self, op: str, left: Any, right: Any) -> Any:
+        if op in _ARITHMETIC:
+            arrays = (Block, np.ndarray)
+            if isinstance(left, arrays) or isinstance(right, arrays):
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    return _ARITHMETIC[op](_array(left), _array(right))
+            a, b = _num(left), _num(right)
+            if op == "/":
+                return _divide(a, b)
+            if op == "^" and a < 0 and not b.is_integer():
+                raise FormulaError("#NUM!")
+            return float(_ARITHMETIC[op](a, b))
+        if op == "&":
+            return _text(left) + _text(right)
+        return _compare(op, left, right)
+
+    def _call(self, name: str, args: list, sheet: str) -> Any:
+        # Lazily evaluated: only the branch that is taken is computed
+        if name == "IF":
+            condition = _bool(self._eval(args[0], sheet))
+            if condition:
+                return self._eval(args[1], sheet) if len(args) > 1 else True
+            return self._eval(args[2], sheet) if len(args) > 2 else False
+        if name in ("IFERROR", "IFNA"):
+            try:
+                value = _scalar(self._eval(args[0], sheet))
+                if _is_error(value):
+                    raise FormulaError(value)
+                return value
+            except FormulaError as exc:
+                if name == "IFNA" and exc.token != "#N/A":
+                    raise
+                return self._eval(args[1], sheet)
+        if name in ("ISERROR", "ISNA", "ISNUMBER", "ISBLANK", "ISTEXT"):
+            try:
+                value = _scalar(self._eval(args[0], sheet))
+            except FormulaError as exc:
+                return name == "ISERROR" or (name == "ISNA" and exc.token == "#N/A")
+            if name == "ISNUMBER":
+                return isinstance(value, (int, float)) and not isinstance(value, bool)
+            if name == "ISBLANK":
+                return value is None
+            if name == "ISTEXT":
+                return isinstance(value, str)
+            return False
+        if name == "CHOOSE":
+            i = int(_num(self._eval(args[0], sheet)))
+            if not 1 <= i < len(args):
+                raise FormulaError("#VALUE!")
+            return self._eval(args[i], sheet)
+
+        function = FUNCTIONS.get(name)
+        if function is None:
+            self.unsupported.add(name)
+            raise FormulaError("#NAME?")
+        try:
+            return function(*(self._eval(arg, sheet) for arg in args))
+        except TypeError:  # wrong number of arguments
+            raise FormulaError("#VALUE!") from None
+
+    # ── public API ── #
+
+    def value(self, sheet: str, cell: str) -> Any:
+        """Current value of a cell (computing it first if it is stale)."""
+        key = (sheet, cell)
+        if self.sheet_state(sheet) is None:
+            return None
+        if self._is_pending(key):
+            self._resolve([key])
+        row, col = split_cell(cell)
+        return self._sheets[sheet].get(row, col)
+
+    def set_inputs(self, changes: dict[CellKey, Any]) -> dict[CellKey, tuple[Any, Any]]:
+        """
+        Apply new input values and recompute only what depends on them.
+        Returns {cell: (old value, new value)} for every cell that changed,
+        inputs included, in workbook order.
+        """
+        # 1. dirty set = transitive dependents of the inputs
+        dirty = self.index.dependents_closure(list(changes))
+
+        # 2. old values (bringing stale cells up to date first), then inputs
+        old = {key: self.value(*key) for key in [*changes, *dirty]}
+        for key, new in changes.items():
+            if self.sheet_state(key[0]) is None:
+                raise KeyError(key[0])
+            self._unmark(key)
+            self._store(key, new)
+
+        # 3. recompute dirty formulas, each after the dirty cells it reads
+        for key in dirty:
+            if key not in changes:
+                self._mark(key)
+        self._resolve([key for key in dirty if key not in changes])
+
+        # column by column, so a recalculated line item reads top to bottom
+        order = {name: i for i, name in enumerate(self.index.sheet_names)}
+        result = {}
+
+        def position(k: CellKey) -> tuple:
+            return order.get(k[0], -1), split_cell(k[1])[::-1]
+
+        for key in sorted(old, key=position):
+            new = self.value(*key)
+            if not _same(old[key], new):
+                result[key] = (old[key], new)
+        return result
+
+
+def _same(a: Any, b: Any) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-12)
+    return a == b
+
+
+# ────────────────────────── What-if questions ────────────────────────────── #
+
+
+class WhatIf(NamedTuple):
+    """A parsed scenario: change `target` by / to `amount`."""
+
+    target: str
+    mode: str       # "percent" | "delta" | "set"
+    amount: float
+
+
+_UP = (
+    r"grows?|grew|increases?|increased|rises?|rose|goes up|went up|is up|were up"
+    r"|changes?|changed"
+)
+_DOWN = (
+    r"decreases?|decreased|declines?|declined|falls?|fell|drops?|dropped|goes down|"
+    r"went down|is down|were down|shrinks?|shrank|is cut|are cut|were cut"
+)
+_AMOUNT = (
+    r"(?P<amount>[-+]?\$?\d[\d,]*(?:\.\d+)?|[-+]?\$?\.\d+)"
+    r"\s*(?P<unit>%|percent\b|pct\b|k\b|m\b|mn\b|bn\b)?"
+)
+_CHANGE_RE = re.compile(
+    rf"\b(?:if|assume|assuming|suppose|when)\s+(?:that\s+)?(?:the\s+|our\s+)?(?P<target>.+?)\s+"
+    rf"(?P<verb>{_UP}|{_DOWN})\s+(?:by\s+)?{_AMOUNT}",
+    re.I,
+)
+_SET_RE = re.compile(
+    rf"\b(?:if|assume|assuming|suppose|set)\s+(?:that\s+)?(?:the\s+|our\s+)?(?P<target>.+?)\s+"
+    rf"(?:is|was|were|are|=|becomes|became|to|equals|at|of)\s+{_AMOUNT}",
+    re.I,
+)
+_SCALE = {"k": 1e3, "m": 1e6, "mn": 1e6, "bn": 1e9}
+_RELATIVE_ROW_RE = re.compile(r"(?<![\w$.])(\$?[A-Z]{1,3})(\d+)(?![\w(])")
+_RELATIVE_COL_RE = re.compile(r"(?<![\w$.])([A-Z]{1,3})(\$?\d+)(?![\w(])")
+_LINE_SUM_RE = re.compile(
+    r"=\s*SUM\(\s*\$?([A-Z]{1,3})\$?(\d+):\$?([A-Z]{1,3})\$?(\d+)\s*\)\s*", re.I
+)
+# Line items whose values do not add up across periods
+_NOT_ADDITIVE_RE = re.compile(r"margin|ratio|rate|%|percent|growth|yield|price", re.I)
+_TARGET_REF_RE = re.compile(
+    r"(?:cells?\s+)?(?:(?P<sheet>'(?:[^']|'')+'|[\w.&-]+)!)?"
+    r"\$?(?P<c1>[A-Za-z]{1,3})\$?(?P<r1>\d+)(?::\$?(?P<c2>[A-Za-z]{1,3})\$?(?P<r2>\d+))?",
+    re.I,
+)
+
+
+def parse_what_if(question: str) -> WhatIf | None:
+    """
+    "What happens to net profit if revenue grows 10%?" → WhatIf("revenue",
+    "percent", 10.0); "if cost falls by 2,000" → delta; "if the tax rate is
+    25%" → set 0.25. None when the question is not a scenario.
+    """
+    m = _CHANGE_RE.search(question)
+    if m:
+        amount = float(m["amount"].replace("$", "").replace(",", ""))
+        if re.fullmatch(_DOWN, m["verb"], re.I):
+            amount = -abs(amount)
+        unit = (m["unit"] or "").lower()
+        if unit in ("%", "percent", "pct"):
+            return WhatIf(m["target"].strip(), "percent", amount)
+        return WhatIf(m["target"].strip(), "delta", amount * _SCALE.get(unit, 1))
+    m = _SET_RE.search(question)
+    if m:
+        amount = float(m["amount"].replace("$", "").replace(",", ""))
+        unit = (m["unit"] or "").lower()
+        if unit in ("%", "percent", "pct"):
+            amount /= 100
+        else:
+            amount *= _SCALE.get(unit, 1)
+        return WhatIf(m["target"].strip(), "set", amount)
+    return None
+
+
+def _label_matches(label: Any, text: str) -> bool:
+    if not isinstance(label, str) or not label.strip():
+        return False
+    pattern = rf"(?<!\w){re.escape(label.strip().lower())}(?!\w)"
+    return re.search(pattern, text) is not None
+
+
+def resolve_target(
+    engine: RecalcEngine, target: str, sheet: str
+) -> tuple[str, list[CellKey]]:
+    """
+    Cells a scenario changes: an explicit reference ("B5", "Sheet2!B2:B13"),
+    else the numeric cells under a matching column header, else those in a
+    row whose first cell matches (line items laid out across periods). The
+    active sheet is searched before the others.
+    """
+    text = target.lower().strip(" ?.,")
+    m = _TARGET_REF_RE.fullmatch(text)
+    if m:
+        ref_sheet = engine.resolve_sheet(m["sheet"]) if m["sheet"] else sheet
+        if ref_sheet is not None:
+            r1, c1 = int(m["r1"]), column_index_from_string(m["c1"].upper())
+            r2 = int(m["r2"]) if m["r2"] else r1
+            c2 = column_index_from_string(m["c2"].upper()) if m["c2"] else c1
+            ref = Ref(ref_sheet, min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2))
+            return ref.label, list(ref.cells())
+
+    others = [name for name in engine.index.sheet_names if name != sheet]
+    for name in [sheet, *others]:
+        state = engine.sheet_state(name)
+        if state is None:
+            continue
+        grid = SheetGrid.for_sheet(engine.wb, name)
+        header_row = grid.origin
+        numeric = ~np.isnan(state.num)
+        # longest matching label wins ("net revenue" over "revenue")
+        columns = sorted(
+            (
+                c for c in range(1, len(grid.header) + 1)
+                if _label_matches(grid.header[c - 1], text)
+            ),
+            key=lambda c: -len(str(grid.header[c - 1])),
+        )
+        if columns:
+            col = columns[0]
+            rows = np.flatnonzero(numeric[header_row:, col - 1]) + header_row + 1
+            cells = [(name, f"{get_column_letter(col)}{r}") for r in rows.tolist()]
+            if cells:
+                column = qualified(name, get_column_letter(col))
+                return f"{grid.header[col - 1]} ({column})", cells
+        labels = state.obj[:, 0]
+        rows = sorted(
+            (r for r in range(len(labels)) if _label_matches(labels[r], text)),
+            key=lambda r: -len(str(labels[r])),
+        )
+        if rows:
+            row = rows[0] + 1
+            cols = np.flatnonzero(numeric[row - 1, 1:]) + 2
+            cells = [(name, f"{get_column_letter(c)}{row}") for c in cols.tolist()]
+            if cells:
+                return f"{labels[row - 1]} ({qualified(name, str(row))})", cells
+    return target, []
+
+
+def _cell_label(engine: RecalcEngine, key: CellKey) -> str:
+    """ "P&L!D3 (Profit, 2023-02-01)" – column header and row label as context."""
+    sheet, cell = key
+    row, col = split_cell(cell)
+    state = engine.sheet_state(sheet)
+    grid = SheetGrid.for_sheet(engine.wb, sheet)
+    parts = []
+    header = None
+    if col <= len(grid.header) and row > grid.origin:
+        header = grid.header[col - 1]
+    if header is not None:
+        parts.append(str(header))
+    row_label = state.get(row, 1) if col > 1 else None
+    if isinstance(row_label, (str, datetime.date)):
+        parts.append(format_value(row_label))
+    return qualified(sheet, cell) + (f" ({', '.join(parts)})" if parts else "")
+
+
+def _shape(engine: RecalcEngine, key: CellKey, axis: str) -> str | None:
+    """
+    Formula with row numbers (axis "column") or column letters (axis "row")
+    made relative – equal along a filled-down column or filled-right row.
+    """
+    formula = engine.index.formula(*key)
+    if formula is None:
+        return None
+    row, col = split_cell(key[1])
+    if axis == "column":
+        return _RELATIVE_ROW_RE.sub(lambda m: f"{m[1]}R[{int(m[2]) - row}]", formula)
+    return _RELATIVE_COL_RE.sub(
+        lambda m: f"C[{column_index_from_string(m[1]) - col}]{m[2]}", formula
+    )
+
+
+def _target_axis(targets: list[CellKey]) -> str | None:
+    """ "column" or "row" if the targets run along one line of one sheet."""
+    if len(targets) < 2 or len({name for name, _ in targets}) > 1:
+        return None
+    rows, cols = zip(*(split_cell(cell) for _, cell in targets), strict=True)
+    if len(set(cols)) == 1:
+        return "column"
+    if len(set(rows)) == 1:
+        return "row"
+    return None
+
+
+def _is_line_total(engine: RecalcEngine, key: CellKey, axis: str) -> bool:
+    """True for =SUM(...) over a range inside the cell's own column / row."""
+    m = _LINE_SUM_RE.fullmatch(engine.index.formula(*key) or "")
+    if m is None:
+        return False
+    row, col = split_cell(key[1])
+    if axis == "column":
+        return m[1].upper() == m[3].upper() == get_column_letter(col)
+    return int(m[2]) == int(m[4]) == row
+
+
+def _line_title(engine: RecalcEngine, name: str, axis: str, line: int) -> str:
+    """ "Revenue ('P&L'!B)" for a column, "Revenue ('P&L'!2)" for a row."""
+    if axis == "column":
+        grid = SheetGrid.for_sheet(engine.wb, name)
+        label = grid.header[line - 1] if line <= len(grid.header) else None
+        ref = qualified(name, get_column_letter(line))
+    else:
+        label = engine.sheet_state(name).get(line, 1)
+        ref = qualified(name, str(line))
+    return f"{label} ({ref})" if label is not None else ref
+
+
+def run_what_if(engine: RecalcEngine, scenario: WhatIf, sheet: str) -> str | None:
+    """
+    Apply a parsed scenario (`parse_what_if`) and describe the exact results –
+    inputs changed, line totals before / after and the recalculated cells.
+    None if the scenario names nothing we can find. The engine is changed in
+    place – pass a `fork()` of a shared one.
+    """
+    label, targets = resolve_target(engine, scenario.target, sheet)
+    inputs = {}
+    for key in targets:
+        old = engine.value(*key)
+        base = _as_float(old)
+        if scenario.mode == "set":
+            inputs[key] = scenario.amount
+        elif not math.isnan(base):
+            if scenario.mode == "percent":
+                inputs[key] = base * (1 + scenario.amount / 100)
+            else:
+                inputs[key] = base + scenario.amount
+    if not inputs:
+        return None
+
+    changes = engine.set_inputs(inputs)
+    change_text = {
+        "percent": f"changed by {scenario.amount:+g}%",
+        "delta": f"changed by {scenario.amount:+,g}",
+        "set": f"set to {scenario.amount:,g}",
+    }[scenario.mode]
+    lines = [f"Scenario: {label} {change_text} ({len(inputs)} input cells)."]
+
+    dependents = [k for k in changes if k not in inputs]
+    if not dependents:
+        lines.append("No formula in the workbook depends on these cells.")
+    # Totals along the target's own layout – per column for records down the
+    # sheet, per row for line items across periods – and only for real line
+    # items: input lines and filled formulas (one shape), leaving out SUM
+    # totals inside the line and ratios, which do not add up
+    axis = _target_axis(list(inputs))
+    totals: dict[int, list[float]] = {}
+    if axis is not None:
+        target_sheet = next(iter(inputs))[0]
+        position = 1 if axis == "column" else 0
+        items: dict[int, list[CellKey]] = {}
+        for key in [*inputs, *dependents]:
+            if key[0] == target_sheet and not _is_line_total(engine, key, axis):
+                items.setdefault(split_cell(key[1])[position], []).append(key)
+        for line, keys in items.items():
+            shapes = {_shape(engine, key, axis) for key in keys if key not in inputs}
+            title = _line_title(engine, target_sheet, axis, line)
+            if len(keys) < 2 or len(shapes) > 1 or _NOT_ADDITIVE_RE.search(title):
+                continue
+            pairs = [changes.get(key, (engine.value(*key),) * 2) for key in keys]
+            before = [_as_float(old) for old, _ in pairs]
+            after = [_as_float(new) for _, new in pairs]
+            if not any(math.isnan(v) for v in before + after):
+                totals[line] = [math.fsum(before), math.fsum(after)]
+    if totals:
+        lines.append(f"{axis.capitalize()} totals (before → after):")
+        for line, (before, after) in totals.items():
+            title = _line_title(engine, target_sheet, axis, line)
+            lines.append(
+                f"- {title}: {format_value(before)} → {format_value(after)}"
+                f" ({after - before:+,.2f})"
+            )
+    if dependents:
+        lines.append(f"Recalculated cells ({len(dependents)} changed):")
+        for key in dependents[:MAX_LISTED_CHANGES]:
+            old, new = changes[key]
+            label = _cell_label(engine, key)
+            lines.append(f"- {label}: {format_value(old)} → {format_value(new)}")
+        if len(dependents) > MAX_LISTED_CHANGES:
+            lines.append(f"- … and {len(dependents) - MAX_LISTED_CHANGES} more")
+    if engine.unsupported:
+        unsupported = ", ".join(sorted(engine.unsupported))
+        lines.append(f"Not evaluated locally (treated as errors): {unsupported}")
+    return "\n".join(lines)
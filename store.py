@@ -0,0 +1,407 @@
+"""
+store.py – content-addressed storage for parsed workbooks and sheet profiles.
+
+Uploads are keyed by a SHA-256 of the raw file bytes, so several analysts
+uploading the same model share one parse, and each (file hash, sheet) pair is
+profiled exactly once no matter how many sessions or follow-ups touch it.
+Both stores are bounded (LRU + idle TTL + byte budget, see cache.py).
+"""
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from cache import BoundedCache
+from inference import infer_types
+from ingest import LazyWorkbook, XlsxReader
+
+try:  # optional – only needed for the shared on-disk upload store
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+# Budgets – override via environment for bigger / smaller workers
+WORKBOOK_CACHE_MAX_BYTES = int(os.getenv("WORKBOOK_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+PROFILE_CACHE_MAX_BYTES = int(os.getenv("PROFILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+FORMULA_CACHE_MAX_BYTES = int(os.getenv("FORMULA_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+VIEW_CACHE_MAX_BYTES = int(os.getenv("VIEW_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 60 * 60))
+
+
+def content_hash(data: bytes) -> str:
+    """Return the hex SHA-256 digest used as the key for an uploaded file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+# file hash → LazyWorkbook (sheet index; tabs are parsed on first use)
+WORKBOOK_STORE = BoundedCache(max_bytes=WORKBOOK_CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS)
+
+# (file hash, sheet name) → dict returned by process_dataframe
+PROFILE_STORE = BoundedCache(max_bytes=PROFILE_CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS)
+
+# file hash → FormulaIndex (whole-workbook formula / precedent graph)
+FORMULA_STORE = BoundedCache(max_bytes=FORMULA_CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS)
+
+# (file hash, sheet name, sort / filter) → row positions for the grid view (grid.py)
+VIEW_STORE = BoundedCache(max_bytes=VIEW_CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS)
+
+
+# ───────────────────────────── Upload stores ─────────────────────────────── #
+#
+# An upload store holds two things: session entries (upload id → file hash +
+# active sheet) and workbooks (file hash → LazyWorkbook). The
+# memory store keeps both in this process; the disk store spills them to a
+# shared directory so any gunicorn worker can serve a follow-up.
+
+UPLOAD_STORE_BACKEND = os.getenv("UPLOAD_STORE", "memory")
+UPLOAD_STORE_DIR = os.getenv(
+    "UPLOAD_STORE_DIR", os.path.join(tempfile.gettempdir(), "docubridge-uploads")
+)
+
+_UPLOAD_ID_RE = re.compile(r"[0-9a-f-]{36}")
+_FILE_HASH_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class MemoryUploadStore:
+    """Process-local store – fine for a single worker."""
+
+    def __init__(
+        self, sessions: BoundedCache, workbooks: BoundedCache = WORKBOOK_STORE
+    ) -> None:
+        self.sessions = sessions
+        self.workbooks = workbooks
+
+    def get_session(self, upload_id: str) -> dict | None:
+        return self.sessions.get(upload_id)
+
+    def put_session(self, upload_id: str, entry: dict) -> None:
+        self.sessions.put(upload_id, entry)
+
+    def get_workbook(self, file_hash: str) -> LazyWorkbook | None:
+        return self.workbooks.get(file_hash)
+
+    def put_workbook(self, file_hash: str, wb: LazyWorkbook) -> None:
+        """Store `wb`; call again after loading more sheets to re-account its size."""
+        self.workbooks.put(file_hash, wb)
+
+    def stats(self) -> dict:
+        return {"sessions": self.sessions.stats(), "workbooks": self.workbooks.stats()}
+
+
+class DiskUploadStore(MemoryUploadStore):
+    """
+    Shared-directory store for multi-worker deployments. The sheet index and
+    raw .xlsx are written at upload; each sheet, once some worker has parsed
+    it, is written as an uncompressed Arrow IPC file (read back memory-mapped)
+    with its column metadata and formula map in JSON. Loaded workbooks are
+    still kept in the in-process LRU so repeat follow-ups skip the disk.
+
+    Layout:  <root>/workbooks/<hash>/{manifest.json, source.xlsx,
+                                      0.arrow, 0.json, …}
+             <root>/sessions/<upload id>.json
+    """
+
+    SWEEP_INTERVAL = 300  # seconds between stale-file sweeps
+
+    def __init__(
+        self,
+        root: str,
+        sessions: BoundedCache,
+        workbooks: BoundedCache = WORKBOOK_STORE,
+        ttl: float | None = CACHE_TTL_SECONDS,
+    ) -> None:
+        if pa is None:
+            raise RuntimeError("DiskUploadStore requires pyarrow (pip install pyarrow)")
+        super().__init__(sessions, workbooks)
+        self.root = root
+        self.ttl = ttl
+        self._last_sweep = 0.0
+        os.makedirs(os.path.join(root, "workbooks"), exist_ok=True)
+        os.makedirs(os.path.join(root, "sessions"), exist_ok=True)
+
+    # ── sessions ── #
+
+    def _session_path(self, upload_id: str) -> str | None:
+        if not _UPLOAD_ID_RE.fullmatch(upload_id or ""):
+            return None
+        return os.path.join(self.root, "sessions", f"{upload_id}.json")
+
+    def get_session(self, upload_id: str) -> dict | None:
+        self._maybe_sweep()
+        path = self._session_path(upload_id)
+        if path is None or self._is_stale(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # idle TTL – touching keeps the session alive
+        return entry
+
+    def put_session(self, upload_id: str, entry: dict) -> None:
+        path = self._session_path(upload_id)
+        if path is None:
+            raise ValueError(f"Invalid upload id: {upload_id!r}")
+        _atomic_write(path, json.dumps(entry).encode("utf-8"))
+        self._maybe_sweep()
+
+    # ── workbooks ── #
+
+    def _workbook_dir(self, file_hash: str) -> str | None:
+        if not _FILE_HASH_RE.fullmatch(file_hash or ""):
+            return None
+        return os.path.join(self.root, "workbooks", file_hash)
+
+    def get_workbook(self, file_hash: str) -> LazyWorkbook | None:
+        self._maybe_sweep()
+        wb = self.workbooks.get(file_hash)
+        path = self._workbook_dir(file_hash)
+        if wb is not None:
+            # Served from the LRU – still touch the directory so a sweep in
+            # any worker does not delete the sheet files of a live workbook
+            if path is not None:
+                with contextlib.suppress(OSError):
+                    os.utime(path)
+            return wb
+        if path is None or self._is_stale(path):
+            return None
+        try:
+            wb = _open_workbook(path)
+        except (OSError, ValueError) as exc:
+            logging.warning("Could not load stored workbook %s – %s", file_hash, exc)
+            return None
+        os.utime(path)
+        self.workbooks.put(file_hash, wb)
+        return wb
+
+    def put_workbook(self, file_hash: str, wb: LazyWorkbook) -> None:
+        self.workbooks.put(file_hash, wb)
+        path = self._workbook_dir(file_hash)
+        if path is None:
+            raise ValueError(f"Invalid file hash: {file_hash!r}")
+        if not os.path.isdir(path):
+            parent = os.path.join(self.root, "workbooks")
+            tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+            try:
+                _write_index(tmp, wb)
+                os.rename(tmp, path)
+            except OSError:
+                # Another worker stored the same file first – keep theirs
+                shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.utime(path)
+        # Sheets parsed in this process become available to every worker
+        for name in wb.loaded_sheets():
+            i = wb.sheet_names.index(name)
+            if not os.path.exists(os.path.join(path, f"{i}.json")):
+                _write_sheet(
+                    path, i, wb.sheet(name), wb.formulas(name), wb.type_report(name)
+                )
+        self._maybe_sweep()
+
+    # ── housekeeping ── #
+
+    def _is_stale(self, path: str) -> bool:
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return True
+        return self.ttl is not None and age > self.ttl
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if self.ttl is None or now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for sub in ("sessions", "workbooks"):
+            base = os.path.join(self.root, sub)
+            for name in os.listdir(base):
+                path = os.path.join(base, name)
+                if self._is_stale(path):
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        with contextlib.suppress(OSError):
+                            os.remove(path)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["root"] = self.root
+        return stats
+
+
+def create_upload_store(sessions: BoundedCache) -> MemoryUploadStore:
+    """Build the store selected by UPLOAD_STORE ("memory" or "disk")."""
+    if UPLOAD_STORE_BACKEND == "disk":
+        if pa is not None:
+            return DiskUploadStore(UPLOAD_STORE_DIR, sessions)
+        logging.warning("UPLOAD_STORE=disk needs pyarrow – falling back to memory")
+    return MemoryUploadStore(sessions)
+
+
+# ─────────────────────────── On-disk encoding ────────────────────────────── #
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _encode_scalar(value: Any) -> Any:
+    """JSON-safe, type-tagged form of a cell value or column label."""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+def _decode_scalar(value: Any) -> Any:
+    if isinstance(value, dict) and "$dt" in value:
+        return pd.Timestamp(value["$dt"])
+    return value
+
+
+def _write_index(path: str, wb: LazyWorkbook) -> None:
+    manifest = {
+        "version": 2,
+        "sheets": wb.sheet_names,
+        "dimensions": wb.dimensions,
+        "has_formulas": wb.has_formulas,
+        "has_source": wb.source is not None,
+    }
+    if wb.source is not None:
+        with open(os.path.join(path, "source.xlsx"), "wb") as fh:
+            fh.write(wb.source)
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+
+
+def _encode_column(col: pd.Series) -> tuple[Any, dict]:
+    """
+    Arrow array + metadata for one column, laid out so `_read_sheet` can map
+    it back without copying: numbers keep NaN as a value (not an Arrow
+    null), dates are stored as their int64 ticks and categoricals as codes.
+    """
+    dtype = col.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = [_encode_scalar(v) for v in dtype.categories]
+        meta = {"encoding": "category", "categories": categories}
+        return pa.array(col.cat.codes.to_numpy()), meta
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return pa.array(col.to_numpy().view("int64")), {"encoding": "datetime"}
+    if isinstance(dtype, np.dtype) and dtype.kind in "iuf":
+        return pa.array(col.to_numpy(), from_pandas=False), {"encoding": "arrow"}
+    try:
+        return pa.array(col, from_pandas=True), {"encoding": "arrow"}
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object column (e.g. numbers + "#N/A") – keep the
+        # exact Python values by JSON-encoding each cell
+        array = pa.array([json.dumps(_encode_scalar(v)) for v in col], type=pa.string())
+        return array, {"encoding": "json"}
+
+
+def _write_sheet(
+    path: str, i: int, df: pd.DataFrame, formulas: dict[str, str] | None,
+    types: dict | None = None,
+) -> None:
+    """Write sheet `i` as <i>.arrow + <i>.json; the .json marks it complete."""
+    arrays, columns = [], []
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        array, col_meta = _encode_column(col)
+        arrays.append(array)
+        columns.append({
+            "label": _encode_scalar(df.columns[j]), "dtype": str(col.dtype), **col_meta
+        })
+    table = pa.Table.from_arrays(arrays, names=[f"c{j}" for j in range(len(arrays))])
+
+    fd, tmp = tempfile.mkstemp(dir=path, prefix=".tmp-")
+    os.close(fd)
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, os.path.join(path, f"{i}.arrow"))
+    meta = {"rows": len(df), "columns": columns, "formulas": formulas, "types": types}
+    _atomic_write(os.path.join(path, f"{i}.json"), json.dumps(meta).encode("utf-8"))
+
+
+def _read_sheet(path: str, i: int) -> tuple[pd.DataFrame, dict[str, str], dict | None]:
+    """
+    Sheet `i` as a frame whose numeric and date columns point straight into
+    the memory-mapped Arrow file: the pages are shared through the OS page
+    cache by every worker that opens the sheet, not copied into each one.
+    """
+    with open(os.path.join(path, f"{i}.json"), encoding="utf-8") as fh:
+        meta = json.load(fh)
+    source = pa.memory_map(os.path.join(path, f"{i}.arrow"), "r")
+    table = pa.ipc.open_file(source).read_all()
+    # One block per column – zero-copy wherever the Arrow layout allows
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+
+    for j, col_meta in enumerate(meta["columns"]):
+        encoding = col_meta["encoding"]
+        col = original = df.iloc[:, j]
+        if encoding == "datetime":
+            col = pd.Series(col.to_numpy().view(col_meta["dtype"]), copy=False)
+        elif encoding == "category":
+            categories = [_decode_scalar(v) for v in col_meta["categories"]]
+            col = pd.Series(pd.Categorical.from_codes(col.to_numpy(), categories))
+        elif encoding == "json":
+            col = col.map(lambda v: _decode_scalar(json.loads(v)))
+        if str(col.dtype) != col_meta["dtype"]:
+            col = col.astype(col_meta["dtype"])
+        if col is not original:
+            df.isetitem(j, col)
+    df.index = pd.RangeIndex(meta["rows"])
+    df.columns = [_decode_scalar(c["label"]) for c in meta["columns"]]
+    # Sheets stored without a type report hold raw values – typed on load
+    return df, meta["formulas"] or {}, meta.get("types")
+
+
+def _open_workbook(path: str) -> LazyWorkbook:
+    """Rebuild a LazyWorkbook whose sheets load from Arrow, else from source.xlsx."""
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    names = manifest["sheets"]
+    source = os.path.join(path, "source.xlsx") if manifest["has_source"] else None
+    reader = None
+
+    def load(name: str) -> tuple[pd.DataFrame, dict[str, str], dict | None]:
+        i = names.index(name)
+        if os.path.exists(os.path.join(path, f"{i}.json")):
+            try:
+                return _read_sheet(path, i)
+            except (OSError, ValueError, pa.ArrowException) as exc:
+                logging.warning("Stored sheet %s unreadable – %s", name, exc)
+        if source is None:
+            raise ValueError(f"Sheet {name!r} is not stored and no source is kept")
+        nonlocal reader
+        if reader is None:
+            reader = XlsxReader(source)
+        df, formulas = reader.read_sheet(name)
+        df, types = infer_types(df)
+        types["header_row"] = reader.header_rows[name]
+        _write_sheet(path, i, df, formulas, types)
+        return df, formulas, types
+
+    return LazyWorkbook(
+        names, manifest["dimensions"], loader=load,
+        has_formulas=manifest["has_formulas"],
+    )
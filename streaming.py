@@ -0,0 +1,299 @@
+"""
+streaming.py – large-workbook mode for .xlsx uploads above the 5 MB in-memory
+cap (consolidated models of 50–200 MB).
+
+• The request body is spooled to a temp file in 1 MB blocks and hashed on
+  the way, so the upload never sits in memory as one bytes object.
+• Each sheet is parsed in row chunks straight from the zip member. Every
+  chunk is typed (each column keeps one kind for the whole sheet – see
+  `ChunkTyper`), folded into a `profiling.StreamingProfile` (running sums,
+  counts, null / error tallies, trend panel) and offered to a reservoir
+  sample, then dropped.
+• What stays cached per sheet is that profile plus a uniform random sample
+  of rows, which stands in for the sheet in prompts and the preview.
+• Parsing runs under a memory ceiling: if the rows a parse holds at once
+  (the chunk being typed plus the sampled rows) need more than
+  STREAM_MEMORY_LIMIT_MB, the upload fails with `MemoryLimitExceeded` instead
+  of taking the worker down, and only LARGE_UPLOAD_SLOTS large parses run at
+  once. The budget counts the parse's own frames, not the process's resident
+  memory, so other requests and background jobs are not charged to it.
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import IO, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from inference import infer_types
+from ingest import LazyWorkbook, XlsxReader, _header_labels
+from profiling import StreamingProfile
+from quality import ERROR_TOKENS
+
+LARGE_UPLOAD_MAX_BYTES = int(os.getenv("LARGE_UPLOAD_MAX_MB", 200)) * 1024 * 1024
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 20_000))
+STREAM_SAMPLE_ROWS = int(os.getenv("STREAM_SAMPLE_ROWS", 2_000))
+STREAM_MEMORY_LIMIT_BYTES = (
+    int(os.getenv("STREAM_MEMORY_LIMIT_MB", 1024)) * 1024 * 1024
+)
+LARGE_UPLOAD_SLOTS = threading.BoundedSemaphore(
+    int(os.getenv("LARGE_UPLOAD_SLOTS", 1))
+)
+
+SPOOL_BLOCK_BYTES = 1024 * 1024
+
+
+class MemoryLimitExceeded(ValueError):
+    """A large-file parse outgrew STREAM_MEMORY_LIMIT_MB."""
+
+
+class SpooledUpload(NamedTuple):
+    path: str
+    file_hash: str
+    size: int
+
+
+def spool_upload(
+    stream: IO[bytes], max_bytes: int = LARGE_UPLOAD_MAX_BYTES
+) -> SpooledUpload:
+    """Copy an upload stream to a temp file block by block, hashing as it goes."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="docubridge-upload-", suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while block := stream.read(SPOOL_BLOCK_BYTES):
+                size += len(block)
+                if size > max_bytes:
+                    raise ValueError(f"Upload exceeds {max_bytes // 2**20} MB")
+                digest.update(block)
+                out.write(block)
+    except BaseException:
+        discard(path)
+        raise
+    return SpooledUpload(path, digest.hexdigest(), size)
+
+
+def discard(path: str) -> None:
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+
+# ───────────────────────────── Memory ceiling ────────────────────────────── #
+
+
+def resident_bytes() -> int | None:
+    """Current RSS of this process (Linux /proc), or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryGuard:
+    """
+    Byte budget for one parse: `check` is given what the parse holds right
+    now and raises MemoryLimitExceeded once that is more than `limit` bytes.
+    """
+
+    def __init__(self, limit: int = STREAM_MEMORY_LIMIT_BYTES) -> None:
+        self.limit = limit
+        self.peak = 0
+
+    def check(self, what: str, held: int) -> None:
+        self.peak = max(self.peak, held)
+        if held > self.limit:
+            raise MemoryLimitExceeded(
+                f"{what} needs more than {self.limit // 2**20} MB of memory"
+            )
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    """Deep size of a frame, Python objects included."""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+# ────────────────────────────── Row sampling ─────────────────────────────── #
+
+
+class Reservoir:
+    """
+    Uniform random sample of up to `size` rows from a stream of chunks
+    (Algorithm R; the replacement draws for a chunk are made in one call).
+    """
+
+    def __init__(self, size: int, seed: int = 0) -> None:
+        self.size = size
+        self.seen = 0
+        self.rows: list[np.ndarray] = []
+        self.positions: list[int] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, chunk: pd.DataFrame, offset: int) -> None:
+        values = chunk.to_numpy(dtype=object)
+        fill = min(len(values), self.size - len(self.rows))
+        self.rows.extend(values[:fill])
+        self.positions.extend(range(offset, offset + fill))
+        rest = np.arange(fill, len(values))
+        if rest.size:
+            slots = self._rng.integers(0, self.seen + rest + 1)
+            hits = slots < self.size
+            pairs = zip(rest[hits].tolist(), slots[hits].tolist(), strict=True)
+            for i, slot in pairs:
+                self.rows[slot], self.positions[slot] = values[i], offset + i
+        self.seen += len(values)
+
+    def frame(self, columns: list) -> pd.DataFrame:
+        """The sample in sheet order, padded to the widest chunk's columns."""
+        data = np.full((len(self.rows), len(columns)), np.nan, dtype=object)
+        order = np.argsort(self.positions, kind="stable")
+        for i, k in enumerate(order.tolist()):
+            row = self.rows[k]
+            data[i, :len(row)] = row
+        return pd.DataFrame(data, columns=columns)
+
+
+# ───────────────────────────── Chunk typing ──────────────────────────────── #
+
+
+def _summable(dtype) -> bool:
+    """Numeric and not bool – the columns `StreamingProfile` sums."""
+    types = pd.api.types
+    return types.is_numeric_dtype(dtype) and not types.is_bool_dtype(dtype)
+
+
+class ChunkTyper:
+    """
+    `infer_types` for a sheet read in chunks, with one kind of column per
+    sheet. A column is fixed as numeric or not by the first chunk holding a
+    value in it (blanks and error tokens do not count); later chunks are
+    made to agree, so a chunk with stray text cannot drop its numbers from
+    the sums and a text column cannot be summed from the chunks that happen
+    to hold only numbers.
+    """
+
+    def __init__(self) -> None:
+        self.numeric: dict[int, bool] = {}
+
+    def __call__(self, chunk: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+        typed, report = infer_types(chunk)
+        fixes = {}
+        for j in range(chunk.shape[1]):
+            raw, summable = chunk.iloc[:, j], _summable(typed.dtypes.iloc[j])
+            numeric = self.numeric.get(j)
+            if numeric is None:
+                if (raw.notna() & ~raw.isin(ERROR_TOKENS)).any():
+                    self.numeric[j] = summable
+            elif numeric and not summable:
+                fixes[j] = self._coerce(raw, j, report)
+            elif summable and not numeric:
+                fixes[j] = raw
+                _forget(report, chunk.columns[j], j)
+        if fixes:
+            typed = typed.copy(deep=False)
+            for j, col in fixes.items():
+                typed.isetitem(j, col)
+        return typed, report
+
+    @staticmethod
+    def _coerce(raw: pd.Series, j: int, report: dict) -> pd.Series:
+        """Numbers from a column of a numeric kind; error tokens join the report."""
+        _forget(report, raw.name, j)
+        errors = raw.isin(ERROR_TOKENS).to_numpy()
+        numbers = pd.to_numeric(raw.where(~errors), errors="coerce").astype("float64")
+        rows = np.flatnonzero(errors)
+        report["errors"].extend([int(r), j, raw.iat[r]] for r in rows.tolist())
+        text = raw.map(type).eq(str).to_numpy() & ~errors
+        report["columns"].append({
+            "column": str(raw.name), "from": str(raw.dtype), "to": "float64",
+            "parsed": int((text & numbers.notna().to_numpy()).sum()),
+            "errors": len(rows),
+        })
+        return numbers
+
+
+def _forget(report: dict, name, j: int) -> None:
+    """Drop a column's conversion record and typed error cells from a report."""
+    report["columns"] = [c for c in report["columns"] if c["column"] != str(name)]
+    report["errors"] = [e for e in report["errors"] if e[1] != j]
+
+
+# ─────────────────────────────── Sheets ──────────────────────────────────── #
+
+
+def stream_sheet(reader: XlsxReader, sheet: str) -> tuple[pd.DataFrame, dict, dict]:
+    """
+    Parse one sheet in row chunks. Returns (sampled rows, {}, type report);
+    the report is the sample's `infer_types` report plus "sampled" (row
+    counts, peak memory) and "profile" (the streamed whole-sheet profile).
+    """
+    with LARGE_UPLOAD_SLOTS:
+        guard = MemoryGuard(STREAM_MEMORY_LIMIT_BYTES)
+        started = time.perf_counter()
+        profile = StreamingProfile()
+        reservoir = Reservoir(STREAM_SAMPLE_ROWS)
+        type_chunk = ChunkTyper()
+        columns: list = []
+        chunks = 0
+        for offset, chunk in reader.iter_row_chunks(sheet, STREAM_CHUNK_ROWS):
+            if chunk.shape[1] > len(columns):
+                columns = list(chunk.columns)
+            typed, report = type_chunk(chunk)
+            # The raw and typed chunk, plus the sample at this chunk's row size
+            raw = _frame_bytes(chunk)
+            sampled = len(reservoir.rows) * raw // max(len(chunk), 1)
+            guard.check(f"Sheet {sheet!r}", raw + _frame_bytes(typed) + sampled)
+            profile.add(typed, report, offset, reader.header_rows[sheet])
+            reservoir.add(chunk, offset)
+            chunks += 1
+
+        sample, types = infer_types(reservoir.frame(columns or _header_labels([])))
+        meta = profile.result()
+        meta["rows"] = profile.rows
+        meta["sampled"] = True
+        types["sampled"] = {
+            "rows": profile.rows,
+            "sample_rows": len(sample),
+            "chunks": chunks,
+            "peak_bytes": guard.peak,
+        }
+        types["profile"] = meta
+        types["header_row"] = reader.header_rows.get(sheet, 1)
+        logging.info(
+            "Streamed sheet %s – %d rows in %d chunks, %d sampled, "
+            "peak %.0f MB held, %.1fs",
+            sheet, profile.rows, chunks, len(sample), guard.peak / 2**20,
+            time.perf_counter() - started,
+        )
+        return sample, {}, types
+
+
+def open_large_workbook(upload: SpooledUpload) -> LazyWorkbook:
+    """
+    Index a spooled .xlsx; sheets are streamed on first use. Formulas are not
+    kept in this mode. Call `close_large_workbook` once every sheet is loaded
+    so the temp file can go.
+    """
+    reader = XlsxReader(upload.path)
+    dims = {name: reader.dimension(name) for name in reader.sheet_names}
+    wb = LazyWorkbook(
+        reader.sheet_names, dims,
+        loader=lambda name: stream_sheet(reader, name), has_formulas=False,
+    )
+    wb.reader = reader
+    return wb
+
+
+def close_large_workbook(wb: LazyWorkbook | None, upload: SpooledUpload) -> None:
+    """Release the reader (and its shared strings) and delete the spooled file."""
+    loaded = wb is not None and all(map(wb.is_loaded, wb.sheet_names))
+    if loaded and wb.reader is not None:
+        wb.reader.close()
+        wb.reader = None
+    discard(upload.path)
@@ -0,0 +1,402 @@
+"""
+telemetry.py – request-scoped tracing and Prometheus metrics, using only
+the standard library (the Flask hooks and /metrics route live in MAIN.py).
+
+• Request IDs: `start_request()` binds an ID (the caller's X-Request-ID or a
+  fresh one) to the current context; `install_log_records()` stamps it on
+  every log record, whichever logger or handler emits it ("-" outside a
+  request), and `carry_context()` hands it to pool threads.
+• Spans: `with span("profile"):` times a stage into the
+  docubridge_stage_duration_seconds histogram and onto the request's trace,
+  which `finish_request()` sums up in one log line.
+• Metrics: counters, histograms and scrape-time callbacks in one registry,
+  rendered in the Prometheus text format by `render_metrics()`.
+• Slow requests: with SLOW_REQUEST_PROFILE_MS set, a sampling profiler
+  records the request thread's stack every SAMPLING_INTERVAL_MS, and the
+  collapsed stacks of any request slower than the threshold are written to
+  SLOW_REQUEST_PROFILE_DIR (flamegraph.pl / speedscope format).
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Iterable, Iterator
+
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", 0))  # 0 = off
+SLOW_REQUEST_PROFILE_DIR = os.getenv(
+    "SLOW_REQUEST_PROFILE_DIR",
+    os.path.join(tempfile.gettempdir(), "docubridge-profiles"),
+)
+SAMPLING_INTERVAL_MS = float(os.getenv("SAMPLING_INTERVAL_MS", 5))
+
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+# ──────────────────────────────── Metrics ────────────────────────────────── #
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key + tuple(extra.items())]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name, self.help = name, help
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_labels(key)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float]) -> None:
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[LabelKey, list] = {}  # key → [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, count) in series.items():
+            running = 0
+            for bound, n in zip(self.buckets, counts, strict=True):
+                running += n
+                yield f"{self.name}_bucket{_labels(key, le=_number(bound))} {running}"
+            yield f"{self.name}_sum{_labels(key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(key)} {count}"
+
+
+class Callback:
+    """
+    Gauge or counter read at scrape time: `read()` returns a number, or
+    (labels, number) pairs. Used to export the stats() of caches and stores.
+    """
+
+    def __init__(
+        self, name: str, help: str, kind: str, read: Callable[[], Any]
+    ) -> None:
+        self.name, self.help, self.kind, self._read = name, help, kind, read
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self._read()
+        except Exception as exc:  # a broken gauge must not break the scrape
+            logging.warning("Metric %s failed – %s", self.name, exc)
+            return
+        scalar = isinstance(value, (int, float)) or value is None
+        pairs = [({}, value)] if scalar else value
+        for labels, number in pairs:
+            if number is not None:
+                yield f"{self.name}{_labels(_key(labels))} {_number(number)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a module reload) replaces the old metric
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float]) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def callback(
+        self, name: str, help: str, read: Callable[[], Any], kind: str = "gauge"
+    ) -> Callback:
+        return self._add(Callback(name, help, kind, read))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+render_metrics = REGISTRY.render
+
+_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "docubridge_http_requests_total", "HTTP requests by endpoint, method and status"
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "docubridge_http_request_duration_seconds",
+    "Time to build the response, by endpoint", _SECONDS,
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "docubridge_stage_duration_seconds",
+    "Pipeline stage durations (parse, profile, prompt, …)", _SECONDS,
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "docubridge_llm_request_duration_seconds",
+    "LLM call latency by mode (chat / stream) and outcome",
+    (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+PROMPT_CHARS = REGISTRY.histogram(
+    "docubridge_prompt_chars", "Size of prompts sent to the LLM, in characters",
+    (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "docubridge_prompt_tokens",
+    "Estimated sheet-context tokens per prompt (see PROMPT_TOKEN_BUDGET)",
+    (125, 250, 500, 1000, 1500, 2000, 3000, 4000, 8000),
+)
+
+
+# ───────────────────────────── Request traces ────────────────────────────── #
+
+
+class Trace:
+    """
+    One request: its ID, start time, spans and (when profiling) stack
+    samples.
+    """
+
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+        self.stacks: collections.Counter | None = None
+
+
+_TRACE: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+
+def current_request_id() -> str:
+    trace = _TRACE.get()
+    return trace.request_id if trace is not None else "-"
+
+
+def install_log_records() -> None:
+    """
+    Give every log record a `request_id` attribute (use %(request_id)s in
+    the log format). Set in the record factory rather than a handler filter,
+    so third-party loggers and handlers added later format too.
+    """
+    make_record = logging.getLogRecordFactory()
+    if getattr(make_record, "stamps_request_id", False):
+        return
+
+    def factory(*args, **kwargs) -> logging.LogRecord:
+        record = make_record(*args, **kwargs)
+        record.request_id = current_request_id()
+        return record
+
+    factory.stamps_request_id = True
+    logging.setLogRecordFactory(factory)
+
+
+def carry_context(fn: Callable) -> Callable:
+    """
+    Wrap `fn` to run in a copy of the current context – pool jobs keep the
+    request ID.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def record_span(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.spans.append((name, seconds))
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a stage of the current request (or of a background job)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def start_request(incoming_id: str | None = None) -> Trace:
+    """Begin a trace for the request on this thread; honours a sane X-Request-ID."""
+    sane = incoming_id and _REQUEST_ID_RE.fullmatch(incoming_id)
+    request_id = incoming_id if sane else uuid.uuid4().hex[:16]
+    trace = Trace(request_id)
+    _TRACE.set(trace)
+    if PROFILER is not None:
+        trace.stacks = PROFILER.attach()
+    return trace
+
+
+def finish_request(
+    trace: Trace, method: str, endpoint: str, path: str, status: int,
+    quiet: bool = False,
+) -> float:
+    """
+    Record the request's metrics, log its span summary and unbind the trace;
+    returns seconds taken. Streamed responses call this once the body is sent.
+    """
+    elapsed = time.perf_counter() - trace.started
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    HTTP_SECONDS.observe(elapsed, endpoint=endpoint)
+    if PROFILER is not None:
+        PROFILER.detach()
+        if trace.stacks and elapsed * 1000 >= SLOW_REQUEST_PROFILE_MS:
+            write_profile(trace, elapsed)
+    if not quiet:
+        totals: dict[str, float] = {}
+        for name, seconds in trace.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        breakdown = ", ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in totals.items()
+        )
+        logging.info(
+            "%s %s %d – %.0f ms%s", method, path, status, elapsed * 1000,
+            f" ({breakdown})" if breakdown else "",
+        )
+    _TRACE.set(None)
+    return elapsed
+
+
+# ─────────────────────────── Sampling profiler ───────────────────────────── #
+
+
+def _collapse(frame, limit: int = 128) -> str:
+    """Stack as "file:function;…" from the outermost frame in."""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    One daemon thread samples the stacks of the threads serving traced
+    requests every `interval` seconds; idle when no request is attached.
+    Work handed to pool threads is not sampled.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._targets: dict[int, collections.Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def attach(self) -> collections.Counter:
+        stacks: collections.Counter = collections.Counter()
+        with self._lock:
+            self._targets[threading.get_ident()] = stacks
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="sampling-profiler", daemon=True
+                )
+                self._thread.start()
+        return stacks
+
+    def detach(self) -> None:
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                targets = list(self._targets.items())
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            for ident, stacks in targets:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+PROFILER = (
+    SamplingProfiler(SAMPLING_INTERVAL_MS / 1000)
+    if SLOW_REQUEST_PROFILE_MS > 0 else None
+)
+
+
+def write_profile(trace: Trace, elapsed: float) -> str | None:
+    """Write a slow request's collapsed stacks ("stack count" lines)."""
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{trace.request_id}.folded"
+    path = os.path.join(SLOW_REQUEST_PROFILE_DIR, name)
+    try:
+        os.makedirs(SLOW_REQUEST_PROFILE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.writelines(
+                f"{stack} {count}\n" for stack, count in trace.stacks.most_common()
+            )
+    except OSError as exc:
+        logging.warning("Could not write request profile – %s", exc)
+        return None
+    logging.warning(
+        "Slow request – %.0f ms, %d samples written to %s",
+        elapsed * 1000, sum(trace.stacks.values()), path,
+    )
+    return path
@@ -0,0 +1,34 @@
+"""
+Shared fixtures: small workbooks written with openpyxl, so every test
+starts from real .xlsx bytes the way an upload does.
+"""
+import io
+
+import pytest
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+
+def make_xlsx(sheets: dict[str, list[list]], blank_rows: int = 0) -> bytes:
+    """
+    {sheet name: rows} → .xlsx bytes. `blank_rows` styled but empty rows are
+    put above each sheet's first row, like a model with a title band.
+    """
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for r in range(1, blank_rows + 1):
+            ws.cell(row=r, column=1).font = Font(bold=True)
+        for i, row in enumerate(rows, start=blank_rows + 1):
+            for j, value in enumerate(row, start=1):
+                if value is not None:
+                    ws.cell(row=i, column=j, value=value)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def xlsx():
+    return make_xlsx
@@ -0,0 +1,44 @@
+import threading
+
+from answers import AnswerCache, normalize_question
+
+
+def test_questions_normalise_to_one_key():
+    assert normalize_question('  What is "Revenue"?? ') == "what is revenue"
+    assert AnswerCache.key(1, "followup", "h", "S", "Total sales?") == (
+        AnswerCache.key(1, "followup", "h", "S", "total  sales")
+    )
+
+
+def test_get_or_compute_reports_who_computed():
+    cache = AnswerCache()
+    assert cache.get_or_compute(("k",), lambda: "answer") == ("answer", True)
+    assert cache.get_or_compute(("k",), lambda: "other") == ("answer", False)
+    assert cache.stats()["hits"] == 1
+
+
+def test_coalesced_callers_reuse_the_leaders_answer():
+    cache = AnswerCache()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow() -> str:
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader = threading.Thread(
+        target=lambda: results.append(cache.get_or_compute(("k",), slow))
+    )
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(
+        target=lambda: results.append(cache.get_or_compute(("k",), slow))
+    )
+    follower.start()
+    while cache.stats()["coalesced"] == 0:
+        release.wait(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert sorted(results) == [("answer", False), ("answer", True)]
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import cache
+from cache import BoundedCache, estimate_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock for the cache module; advance with clock.now += s."""
+    fake = SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = BoundedCache(max_entries=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1  # "b" is now the least recently used
+    c.put("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_and_skips_oversized_values():
+    c = BoundedCache(max_bytes=100, sizeof=len)
+    c.put("a", "x" * 60)
+    c.put("b", "y" * 60)
+    assert "a" not in c and "b" in c
+    c.put("huge", "z" * 101)
+    assert "huge" not in c and "b" in c
+    assert c.stats()["bytes"] == 60
+    assert c.stats()["evictions"] == 2
+
+
+def test_idle_ttl_counts_from_the_last_access(clock):
+    c = BoundedCache(ttl=10)
+    c.put("a", 1)
+    clock.now += 8
+    assert c.get("a") == 1  # touched: another 10 s from here
+    clock.now += 8
+    assert c.get("a") == 1
+    clock.now += 11
+    assert c.get("a") is None
+    assert c.stats()["expirations"] == 1
+
+
+def test_expired_entries_are_pruned_on_write(clock):
+    c = BoundedCache(ttl=10)
+    c.put("old", 1)
+    clock.now += 11
+    c.put("new", 2)
+    assert len(c) == 1
+    assert c.stats()["expirations"] == 1
+
+
+def test_get_or_create_builds_once():
+    c = BoundedCache()
+    calls = []
+    for _ in range(3):
+        assert c.get_or_create("k", lambda: calls.append(1) or "v") == "v"
+    assert len(calls) == 1
+    assert c.stats()["hits"] == 2 and c.stats()["misses"] == 1
+
+
+def test_estimate_size_walks_containers():
+    df = pd.DataFrame({"A": range(1000)})
+    assert estimate_size({"df": df}) > df.memory_usage(deep=True).sum()
+    assert estimate_size(None) == 0
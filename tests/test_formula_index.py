@@ -0,0 +1,30 @@
+from formula_index import FormulaIndex, SheetGrid
+from ingest import LazyWorkbook
+
+
+def test_grid_addresses_follow_the_header_row(xlsx):
+    # Styled blank rows 1–2 widen the <dimension>, the header is on row 3
+    rows = [["Month", "Revenue"], ["Jan", 10], ["Feb", 12]]
+    wb = LazyWorkbook.from_xlsx(xlsx({"P&L": rows}, blank_rows=2))
+    assert wb.dimensions["P&L"].startswith("A1")
+
+    grid = SheetGrid.for_sheet(wb, "P&L")
+    assert grid.origin == 3
+    assert grid.value(3, 2) == "Revenue"
+    assert grid.value(4, 2) == 10
+    assert grid.value(5, 1) == "Feb"
+    assert grid.last_row == 5
+
+
+def test_index_is_built_without_loading_sheets(xlsx):
+    rows = [["Revenue", "Cost", "Profit"], [10, 4, "=A2-B2"], [12, 5, "=A3-B3"]]
+    summary = [["Total profit", "=SUM(Data!C2:C3)"]]
+    wb = LazyWorkbook.from_xlsx(xlsx({"Data": rows, "Summary": summary}))
+    index = FormulaIndex.from_workbook(wb)
+    assert wb.loaded_sheets() == []
+    assert index.formula("Data", "C3") == "=A3-B3"
+    assert index.dependents_of("Data", "C2") == [("Summary", "B1")]
+    assert dict(index.formulas) == {
+        (name, cell): formula
+        for name in wb.sheet_names for cell, formula in wb.formulas(name).items()
+    }
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from grid import MAX_WINDOW_COLUMNS, MAX_WINDOW_ROWS, GridQuery, row_order, sheet_window
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Region": ["North", "South", "East", "West", "North", "South"],
+        "Revenue": [50.0, 20.0, None, 40.0, 10.0, 30.0],
+        "Units": [5, 2, 7, 4, 1, 3],
+    })
+
+
+def test_window_is_a_block_of_rows_and_columns(df):
+    window = sheet_window(df, None, GridQuery(start=2, count=3, col_start=1,
+                                              col_count=1))
+    assert (window["start"], window["col_start"]) == (2, 1)
+    assert window["row_ids"] == [2, 3, 4]
+    assert [c["label"] for c in window["columns"]] == ["Revenue"]
+    assert window["data"] == [[None], [40.0], [10.0]]
+    assert (window["rows"], window["total_rows"], window["total_columns"]) == (6, 6, 3)
+
+
+def test_window_past_the_end_is_clamped(df):
+    window = sheet_window(df, None, GridQuery(start=4, count=10, col_start=2,
+                                              col_count=10))
+    assert window["row_ids"] == [4, 5]
+    assert [c["label"] for c in window["columns"]] == ["Units"]
+
+    window = sheet_window(df, None, GridQuery(start=99, col_start=99))
+    assert (window["start"], window["col_start"]) == (6, 3)
+    assert window["row_ids"] == window["columns"] == window["data"] == []
+
+
+def test_oversized_windows_are_capped():
+    query = GridQuery.from_args({"count": "100000", "col_count": "100000"})
+    assert (query.count, query.col_count) == (MAX_WINDOW_ROWS, MAX_WINDOW_COLUMNS)
+
+
+@pytest.mark.parametrize("args", [
+    {"start": "-1"}, {"count": "0"}, {"col_start": "-5"}, {"col_count": "0"},
+    {"start": "ten"},
+])
+def test_out_of_range_offsets_and_limits_are_rejected(args):
+    with pytest.raises(ValueError):
+        GridQuery.from_args(args)
+
+
+@pytest.mark.parametrize("sort", ["1", "Revenue", " revenue "])
+def test_sort_takes_a_position_or_a_column_name(df, sort):
+    query = GridQuery.from_args({"sort": sort}, df.columns)
+    assert query.sort == 1
+    assert row_order(df, query).tolist() == [4, 1, 5, 3, 0, 2]  # blank last
+    descending = query._replace(descending=True)
+    assert row_order(df, descending).tolist() == [0, 3, 5, 1, 4, 2]
+
+
+def test_sorted_window_follows_the_order(df):
+    query = GridQuery.from_args({"sort": "Units", "count": "2"}, df.columns)
+    window = sheet_window(df, None, query, row_order(df, query))
+    assert window["row_ids"] == [4, 1]
+    assert [row[0] for row in window["data"]] == ["North", "South"]
+
+
+@pytest.mark.parametrize("args", [
+    {"sort": "3"}, {"sort": "Profit"}, {"sort": "-1"}, {"filter_col": "Cost"},
+])
+def test_bad_sort_columns_are_rejected(df, args):
+    with pytest.raises(ValueError):
+        GridQuery.from_args(args, df.columns)
+
+
+def test_filter_by_named_column(df):
+    query = GridQuery.from_args({"filter": "north", "filter_col": "Region"},
+                                df.columns)
+    assert query.filter_col == 0
+    assert row_order(df, query).tolist() == [0, 4]
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from inference import CATEGORY_MIN_ROWS, infer_types, restore_errors
+
+
+def _typed(values: list) -> tuple[pd.Series, dict]:
+    df, report = infer_types(pd.DataFrame({"A": pd.Series(values, dtype=object)}))
+    return df["A"], report
+
+
+def test_small_integers_downcast_to_int32():
+    col, report = _typed([1, 2, 3])
+    assert col.dtype == np.int32
+    assert report["columns"][0]["to"] == "int32"
+
+
+def test_large_integers_stay_int64():
+    col, _ = _typed([1, 2**40])
+    assert col.dtype == np.int64
+
+
+def test_floats_narrow_only_when_exact():
+    assert _typed([0.5, 1.25])[0].dtype == np.float32
+    assert _typed([0.1, 1.25])[0].dtype == np.float64
+
+
+def test_currency_percent_and_accounting_text():
+    col, report = _typed(["$1,200", "12.5%", "(300)"])
+    assert col.tolist() == [1200.0, 0.125, -300.0]
+    assert report["columns"][0]["parsed"] == 3
+
+
+def test_error_tokens_become_nan_and_are_reported():
+    col, report = _typed([10, "#DIV/0!", 30])
+    assert col.dtype == np.float32
+    assert np.isnan(col[1])
+    assert report["errors"] == [[1, 0, "#DIV/0!"]]
+    restored = restore_errors(col.to_frame(), report)
+    assert restored.iat[1, 0] == "#DIV/0!"
+
+
+def test_stray_text_leaves_the_column_alone():
+    col, report = _typed([1, "n/a", 3])
+    assert col.dtype == object
+    assert report["columns"] == []
+
+
+def test_iso_date_text_becomes_datetime():
+    col, _ = _typed(["2024-01-31", "2024-02-29"])
+    assert pd.api.types.is_datetime64_dtype(col.dtype)
+    assert col[1] == pd.Timestamp("2024-02-29")
+
+
+def test_booleans_and_repetitive_text():
+    assert _typed([True, False])[0].dtype == bool
+    col, _ = _typed(["North", "South"] * CATEGORY_MIN_ROWS)
+    assert isinstance(col.dtype, pd.CategoricalDtype)
+    assert not isinstance(_typed(["North", "South"])[0].dtype, pd.CategoricalDtype)
@@ -0,0 +1,141 @@
+"""
+XlsxReader against pandas / openpyxl. openpyxl writes neither shared
+formulas, inline strings nor cached formula results, so the workbook here is
+assembled part by part, the way Excel saves one.
+"""
+import datetime
+import io
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from ingest import LazyWorkbook, XlsxReader
+
+_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_RELS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG = "http://schemas.openxmlformats.org/package/2006"
+
+_SHARED = ["Item", "Amount", "Double", "Date", "Ratio", "Gadget"]
+# A2 inline string, C2:C3 one shared formula, D styled as a date (style 1),
+# E2 a cached #DIV/0! result
+_ROWS = """
+<row r="1">
+  <c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c>
+  <c r="C1" t="s"><v>2</v></c><c r="D1" t="s"><v>3</v></c>
+  <c r="E1" t="s"><v>4</v></c>
+</row>
+<row r="2">
+  <c r="A2" t="inlineStr"><is><t>Widget</t></is></c><c r="B2"><v>10</v></c>
+  <c r="C2"><f t="shared" ref="C2:C3" si="0">B2*2</f><v>20</v></c>
+  <c r="D2" s="1"><v>44927</v></c>
+  <c r="E2" t="e"><f>B2/0</f><v>#DIV/0!</v></c>
+</row>
+<row r="3">
+  <c r="A3" t="s"><v>5</v></c><c r="B3"><v>7.5</v></c>
+  <c r="C3"><f t="shared" si="0"/><v>15</v></c>
+  <c r="D3" s="1"><v>44958.5</v></c>
+  <c r="E3"><f>B3/B2</f><v>0.75</v></c>
+</row>
+"""
+
+
+def _workbook_xlsx(date1904: bool = False) -> bytes:
+    strings = "".join(f"<si><t>{s}</t></si>" for s in _SHARED)
+    parts = {
+        "[Content_Types].xml": (
+            f'<Types xmlns="{_PKG}/content-types">'
+            '<Default Extension="rels" ContentType="application/'
+            'vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": (
+            f'<Relationships xmlns="{_PKG}/relationships">'
+            f'<Relationship Id="rId1" Type="{_RELS}/officeDocument"'
+            ' Target="xl/workbook.xml"/></Relationships>'
+        ),
+        "xl/workbook.xml": (
+            f'<workbook xmlns="{_MAIN}" xmlns:r="{_RELS}">'
+            f'<workbookPr date1904="{int(date1904)}"/>'
+            '<sheets><sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships xmlns="{_PKG}/relationships">'
+            f'<Relationship Id="rId1" Type="{_RELS}/worksheet"'
+            ' Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{_RELS}/styles" Target="styles.xml"/>'
+            f'<Relationship Id="rId3" Type="{_RELS}/sharedStrings"'
+            ' Target="sharedStrings.xml"/></Relationships>'
+        ),
+        "xl/styles.xml": (
+            f'<styleSheet xmlns="{_MAIN}">'
+            '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+            '</numFmts><fonts count="1"><font/></fonts>'
+            '<fills count="1"><fill><patternFill/></fill></fills>'
+            '<borders count="1"><border/></borders>'
+            '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+            '<cellXfs count="2"><xf numFmtId="0"/>'
+            '<xf numFmtId="164" applyNumberFormat="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/>'
+            "</cellStyles></styleSheet>"
+        ),
+        "xl/sharedStrings.xml": (
+            f'<sst xmlns="{_MAIN}" count="{len(_SHARED)}">{strings}</sst>'
+        ),
+        "xl/worksheets/sheet1.xml": (
+            f'<worksheet xmlns="{_MAIN}"><dimension ref="A1:E3"/>'
+            f"<sheetData>{_ROWS}</sheetData></worksheet>"
+        ),
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, xml in parts.items():
+            zf.writestr(name, xml)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("date1904", [False, True])
+def test_values_match_pandas(date1904):
+    data = _workbook_xlsx(date1904)
+    with XlsxReader(io.BytesIO(data)) as reader:
+        ours, _ = reader.read_sheet("Data")
+    theirs = pd.read_excel(io.BytesIO(data), sheet_name="Data", dtype=object)
+
+    # Error results are the one intended difference: pandas reads them as NaN
+    assert pd.isna(theirs.at[0, "Ratio"])
+    theirs.at[0, "Ratio"] = "#DIV/0!"
+    pd.testing.assert_frame_equal(ours, theirs, check_dtype=False)
+
+    # serial 44927 is 2023-01-01, or 1,462 days later counted from 1904
+    start = datetime.datetime(2027 if date1904 else 2023, 1, 2 if date1904 else 1)
+    assert ours.at[0, "Date"] == start
+    assert ours.at[1, "Date"] == start + datetime.timedelta(days=31, hours=12)
+
+
+def test_formulas_match_openpyxl():
+    data = _workbook_xlsx()
+    with XlsxReader(io.BytesIO(data)) as reader:
+        _, ours = reader.read_sheet("Data")
+    ws = openpyxl.load_workbook(io.BytesIO(data))["Data"]
+    theirs = {
+        cell.coordinate: cell.value
+        for row in ws.iter_rows() for cell in row if cell.data_type == "f"
+    }
+    assert ours == theirs
+    assert ours["C3"] == "=B3*2"  # shared formula, translated to its own row
+
+
+def test_error_tokens_reach_the_type_report():
+    wb = LazyWorkbook.from_xlsx(_workbook_xlsx())
+    assert pd.isna(wb.sheet("Data").at[0, "Ratio"])
+    assert wb.type_report("Data")["errors"] == [[0, 4, "#DIV/0!"]]
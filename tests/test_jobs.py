@@ -0,0 +1,91 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from zipfile import BadZipFile
+
+import pytest
+
+import jobs
+from jobs import STALE_JOB_ERROR, JobStore, ingest_and_profile, run_in_process
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """jobs.time on a settable clock – `clock.now += 60` moves it on."""
+    fake = SimpleNamespace(now=1_000_000.0)
+    fake.time = lambda: fake.now
+    monkeypatch.setattr(jobs, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_PROCESSES", 1)
+    yield
+    if jobs._process_pool is not None:
+        jobs._process_pool.shutdown()
+        jobs._process_pool = None
+
+
+def test_job_moves_from_queued_to_done(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create()
+    assert store.get(job_id)["status"] == "queued"
+    store.update(job_id, "running", stage="parsing")
+    assert (store.get(job_id)["status"], store.get(job_id)["stage"]) == (
+        "running", "parsing"
+    )
+    store.update(job_id, "done", result={"answer_html": "<p>42</p>"})
+    job = store.get(job_id)
+    assert (job["status"], job["stage"]) == ("done", None)
+    assert job["result"] == {"answer_html": "<p>42</p>"}
+    assert store.get("missing") is None
+
+
+def test_failed_jobs_keep_their_error(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create()
+    store.update(job_id, "failed", error="unreadable")
+    assert (store.get(job_id)["status"], store.get(job_id)["error"]) == (
+        "failed", "unreadable"
+    )
+    with pytest.raises(ValueError):
+        store.update(job_id, "paused")
+
+
+def test_stale_jobs_fail_after_a_restart(tmp_path, clock):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path, stale_after=60)
+    running, finished = store.create(), store.create()
+    store.update(running, "running", stage="asking")
+    store.update(finished, "done", result={})
+    clock.now += 30
+    fresh = store.create()
+
+    clock.now += 45  # `running` is 75 s old, `fresh` 45 s
+    JobStore(path, stale_after=60)  # a new worker starts on the same file
+    job = store.get(running)
+    assert (job["status"], job["error"]) == ("failed", STALE_JOB_ERROR)
+    assert store.get(finished)["status"] == "done"
+    assert store.get(fresh)["status"] == "queued"
+
+
+def test_polling_a_stale_job_fails_it(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), stale_after=60)
+    job_id = store.create()
+    clock.now += 61
+    assert store.get(job_id)["status"] == "failed"
+
+
+@pytest.mark.usefixtures("pool")
+def test_worker_errors_reach_the_caller():
+    with pytest.raises(BadZipFile):
+        run_in_process(ingest_and_profile, b"not a workbook", "book.xlsx")
+
+
+@pytest.mark.usefixtures("pool")
+def test_crashed_worker_gets_a_fresh_pool():
+    with pytest.raises(BrokenProcessPool):
+        run_in_process(os._exit, 1)
+    assert jobs._process_pool is None
+    assert run_in_process(abs, -3) == 3
@@ -0,0 +1,75 @@
+import pytest
+
+import llm
+from llm import FakeChatClient, LLMClient, LLMUnavailable
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff sleeps, recorded instead of slept; jitter always draws its ceiling."""
+    slept = []
+    monkeypatch.setattr(llm.time, "sleep", slept.append)
+    monkeypatch.setattr(llm.random, "uniform", lambda _low, high: high)
+    return slept
+
+
+def test_transient_failures_are_retried(delays):
+    backend = FakeChatClient(answer="ok", failures=2)
+    client = LLMClient(backend, max_retries=2, backoff_base=0.5)
+    assert client.chat("prompt") == "ok"
+    assert backend.calls == 3
+    assert delays == [0.5, 1.0]
+    snapshot = client.metrics.snapshot()
+    assert (snapshot["calls"], snapshot["errors"], snapshot["retries"]) == (3, 2, 2)
+
+
+@pytest.mark.usefixtures("delays")
+def test_retries_give_up_after_max_retries():
+    backend = FakeChatClient(answer="ok", failures=5)
+    client = LLMClient(backend, max_retries=2)
+    with pytest.raises(TimeoutError):
+        client.chat("prompt")
+    assert backend.calls == 3
+    assert client.metrics.snapshot()["in_flight"] == 0
+
+
+def test_backoff_is_capped(delays):
+    backend = FakeChatClient(answer="ok", failures=4)
+    client = LLMClient(backend, max_retries=4, backoff_base=1.0, backoff_cap=3.0)
+    client.chat("prompt")
+    assert delays == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_other_errors_are_not_retried(delays):
+    class Broken(FakeChatClient):
+        def chat(self, *_, **__):
+            self.calls += 1
+            raise ValueError("bad request")
+
+    backend = Broken()
+    with pytest.raises(ValueError):
+        LLMClient(backend, max_retries=3).chat("prompt")
+    assert backend.calls == 1
+    assert delays == []
+
+
+@pytest.mark.usefixtures("delays")
+def test_stream_retries_until_the_first_token():
+    backend = FakeChatClient(answer="two words", failures=1)
+    client = LLMClient(backend, max_retries=1)
+    assert "".join(client.stream("prompt")) == "two words"
+    assert backend.calls == 2
+
+
+def test_saturated_client_times_out_in_the_queue():
+    backend = FakeChatClient(answer="ok")
+    client = LLMClient(backend, max_concurrency=1, queue_timeout=0.05)
+    client._acquire()  # another request holds the only slot
+    with pytest.raises(LLMUnavailable):
+        client.chat("prompt")
+    assert backend.calls == 0
+    assert client.metrics.snapshot()["rejected"] == 1
+
+    client._release()
+    assert client.chat("prompt") == "ok"
+    assert client.metrics.snapshot()["in_flight"] == 0
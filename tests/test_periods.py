@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from periods import column_periods, freq_of, parse_period, row_periods
+
+
+@pytest.mark.parametrize(("label", "expected"), [
+    ("Q1 2023", pd.Period("2023Q1", freq="Q")),
+    ("Q1-23", pd.Period("2023Q1", freq="Q")),
+    ("2023 Q1", pd.Period("2023Q1", freq="Q")),
+    ("1Q23", pd.Period("2023Q1", freq="Q")),
+    ("Jan-23", pd.Period("2023-01", freq="M")),
+    ("2023-01", pd.Period("2023-01", freq="M")),
+    (pd.Timestamp("2023-03-31"), pd.Period("2023-03", freq="M")),
+    ("FY2023", pd.Period("2023", freq="Y")),
+    (2023, pd.Period("2023", freq="Y")),
+    ("Total", None),
+    ("2023-13", None),
+])
+def test_parse_period(label, expected):
+    assert parse_period(label) == expected
+
+
+def test_column_periods_keep_the_finest_frequency():
+    df = pd.DataFrame(columns=["Line", "Q1-23", "Q2-23", "FY2023"])
+    found = column_periods(df, [1, 2, 3])
+    assert list(found) == [1, 2]
+    assert freq_of(found.values()) == "Q"
+
+
+def test_row_periods_from_dates_and_labels():
+    dates = pd.to_datetime(["2023-01-31", "2023-02-28"])
+    j, periods = row_periods(pd.DataFrame({"x": [1, 2], "Date": dates}))
+    assert j == 1
+    assert periods.tolist() == [
+        pd.Period("2023-01", freq="M"), pd.Period("2023-02", freq="M")
+    ]
+    labelled = pd.DataFrame({"Quarter": ["Q1-23", "Q2-23"], "Sales": [1.0, 2.0]})
+    assert row_periods(labelled)[1].tolist() == [
+        pd.Period("2023Q1", freq="Q"), pd.Period("2023Q2", freq="Q")
+    ]
+    assert row_periods(pd.DataFrame({"Name": ["a", "b"]})) == (None, None)
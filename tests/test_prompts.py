@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inference import infer_types
+from profiling import process_dataframe
+from prompts import PROMPT_TOKEN_BUDGET, assemble_prompt, estimate_tokens
+
+QUESTION = "What is the freight cost for Freight Europe?"
+
+
+@pytest.fixture(scope="module")
+def wide():
+    """200 accounts × 60 unrelated metrics plus the one the question names."""
+    rng = np.random.default_rng(0)
+    columns = {"Account": [f"Account {i}" for i in range(200)]}
+    columns["Account"][150] = "Freight Europe"
+    for j in range(59):
+        columns[f"Metric {j:02d}"] = rng.integers(0, 10_000, 200).astype(float)
+    columns["Freight Cost"] = rng.integers(0, 500, 200).astype(float)
+    df, types = infer_types(pd.DataFrame(columns))
+    return process_dataframe(df, types), df, types
+
+
+@pytest.mark.parametrize("budget", [400, 800, PROMPT_TOKEN_BUDGET])
+def test_prompt_stays_within_the_budget(wide, budget):
+    prompt, usage = assemble_prompt(*wide[:2], QUESTION, wide[2], budget=budget)
+    assert usage["tokens"] == estimate_tokens(prompt) <= budget
+
+
+def test_truncation_keeps_the_header_and_relevant_rows(wide):
+    prompt, usage = assemble_prompt(*wide[:2], QUESTION, wide[2], budget=600)
+    assert "The sheet has 200 rows and 61 columns (the " in prompt
+    assert prompt.endswith(f'answer the user\'s question: "{QUESTION}".')
+    assert "'Freight Cost'" in prompt
+    assert "Freight Cost: sum=" in prompt
+    assert "'Metric 58'" not in prompt
+    assert usage["columns"][0] < usage["columns"][1] == 61
+    # the row the question names comes first, under its label column
+    preview = prompt.split("Data Preview (")[1]
+    assert preview.startswith("rows matching the question, then the first rows): [")
+    assert '[{"Account": "Freight Europe"' in preview
+    assert usage["rows"][0] >= 1
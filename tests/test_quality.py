@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from ingest import LazyWorkbook
+from profiling import process_dataframe
+from quality import scan_sheet
+
+
+def test_counts_errors_and_missing_per_column():
+    df = pd.DataFrame({"A": [1, "#N/A", None], "B": ["x", "y", "#DIV/0!"]})
+    report = scan_sheet(df)
+    assert report["error_count"] == 2
+    assert report["missing_count"] == 1
+    assert report["columns"]["A"] == {"letter": "A", "errors": 1, "missing": 1}
+    assert report["error_cells"] == ["A3", "B4"]
+    assert report["missing_cells"] == ["A4"]
+
+
+def test_typed_errors_count_as_errors_not_missing():
+    df = pd.DataFrame({"A": [1.0, np.nan, 3.0]})
+    report = scan_sheet(df, typed_errors=[(1, 0, "#REF!")])
+    assert report["error_count"] == 1
+    assert report["missing_count"] == 0
+    assert report["error_cells"] == ["A3"]
+
+
+def test_addresses_follow_the_header_row():
+    df = pd.DataFrame({"A": [1, "#N/A"], "B": [None, 2]})
+    report = scan_sheet(df, header_row=4)
+    assert report["error_cells"] == ["A6"]
+    assert report["missing_cells"] == ["B5"]
+
+
+def test_profile_addresses_match_the_workbook(xlsx):
+    # Title band on rows 1–2, header on row 3, data from row 4
+    rows = [["Month", "Revenue"], ["Jan", 10], ["Feb", "#N/A"], ["Mar", None]]
+    data = xlsx({"P&L": rows}, blank_rows=2)
+    wb = LazyWorkbook.from_xlsx(data)
+    df = wb.sheet("P&L")
+    assert wb.header_row("P&L") == 3
+    quality = process_dataframe(df, wb.type_report("P&L"))["quality"]
+    assert quality["error_cells"] == ["B5"]
+    assert quality["missing_cells"] == ["B6"]
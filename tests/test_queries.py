@@ -0,0 +1,85 @@
+import pandas as pd
+
+from queries import PeriodFilter, evaluate, parse_query
+
+
+def test_unlabelled_rows_are_named_by_their_excel_row():
+    df = pd.DataFrame({"Revenue": [10.0, 30.0, 20.0], "Cost": [1.0, 2.0, 3.0]})
+    query = parse_query("highest revenue", df)
+    assert "(row 3)" in evaluate(query, df)
+    assert "(row 5)" in evaluate(query, df, header_row=3)
+
+
+def _pnl() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Month": pd.date_range("2023-01-01", periods=6, freq="MS"),
+        "Region": ["North", "South"] * 3,
+        "Revenue": [100.0, 200.0, 150.0, 250.0, 120.0, 180.0],
+        "Profit": [10.0, 40.0, 15.0, 50.0, 12.0, 30.0],
+    })
+
+
+def test_parse_aggregate_metric_period_and_category():
+    query = parse_query("total revenue in North for Q1 2023", _pnl())
+    assert query.aggregate == "sum"
+    assert query.metric == ("column", 2)
+    assert query.period == PeriodFilter(2023, 1, None)
+    assert query.categories == [(1, "North")]
+
+
+def test_parse_group_and_comparison():
+    query = parse_query("average monthly revenue above 1k", _pnl())
+    assert (query.aggregate, query.group) == ("mean", "M")
+    assert query.compare == (">", 1000.0)
+
+
+def test_unknown_words_go_to_the_llm():
+    assert parse_query("total revenue forecast", _pnl()) is None
+    assert parse_query("revenue", _pnl()) is None  # no aggregate
+
+
+def test_comparison_needs_a_metric():
+    assert parse_query("how many rows above 100", _pnl()) is None
+    assert parse_query("how many rows in North", _pnl()).metric is None
+
+
+def test_profit_margin_is_the_derived_margin():
+    df = _pnl()
+    query = parse_query("what is the profit margin", df)
+    assert query.metric == ("margin", 3, 2)
+    assert "Overall Margin: 15.70%" in evaluate(query, df)
+
+
+def test_total_rows_are_left_out():
+    df = pd.DataFrame({
+        "Month": ["Jan", "Feb", "Mar", "Total"],
+        "Revenue": [100.0, 250.0, 250.0, 600.0],
+    })
+    assert "Total Revenue: 600** (sum of 3 values)" in evaluate(
+        parse_query("total revenue", df), df
+    )
+    assert "Average Revenue: 200**" in evaluate(parse_query("average revenue", df), df)
+    assert "**3** rows" in evaluate(parse_query("how many rows", df), df)
+
+
+def test_unlabelled_totals_go_to_the_llm():
+    df = pd.DataFrame({
+        "Month": ["Jan", "Feb", "Mar", None, "Apr"],
+        "Revenue": [100.0, 250.0, 250.0, 600.0, 80.0],
+    })
+    assert evaluate(parse_query("total revenue", df), df) is None
+    df = pd.DataFrame({"Revenue": [100.0, 250.0, 250.0, 600.0]})
+    assert evaluate(parse_query("total revenue", df), df) is None
+    # a running sequence with every row named is data, not subtotals
+    df = pd.DataFrame({"Month": ["Jan", "Feb", "Mar"], "Units": [1.0, 2.0, 3.0]})
+    assert "Total Units: 6**" in evaluate(parse_query("total units", df), df)
+
+
+def test_total_columns_are_left_out_of_wide_sheets():
+    df = pd.DataFrame({
+        "Line": ["Revenue", "Cost"],
+        "Jan-23": [1.0, 2.0], "Feb-23": [3.0, 4.0], "Total": [4.0, 6.0],
+    })
+    assert "Total Revenue: 4** (sum of 2 values)" in evaluate(
+        parse_query("total revenue", df), df
+    )
@@ -0,0 +1,104 @@
+import math
+
+import pytest
+
+from formula_index import FormulaIndex
+from ingest import LazyWorkbook
+from recalc import RecalcEngine, WhatIf, parse_formula, parse_what_if, run_what_if
+
+
+@pytest.fixture
+def engine(xlsx):
+    rows = [["Month", "Revenue", "Cost", "Profit", "Margin"]]
+    for r in range(2, 5):
+        rows.append([f"M{r - 1}", 100 * (r - 1), 40 * (r - 1), f"=B{r}-C{r}",
+                     f"=IFERROR(D{r}/B{r},0)"])
+    rows.append(["Total", "=SUM(B2:B4)", "=SUM(C2:C4)", "=SUM(D2:D4)", None])
+    summary = [
+        ["Profit x2", "='P&L'!D5*2"],
+        ["Lookup", '=VLOOKUP("M2",\'P&L\'!A2:C4,3,FALSE)'],
+    ]
+    wb = LazyWorkbook.from_xlsx(xlsx({"P&L": rows, "Summary": summary}))
+    return RecalcEngine(FormulaIndex.from_workbook(wb), wb)
+
+
+def test_parse_formula_precedence():
+    assert parse_formula("=1+2*3", "S") == (
+        "op", "+", ("num", 1.0), ("op", "*", ("num", 2.0), ("num", 3.0))
+    )
+
+
+def test_parse_formula_rejects_bad_syntax():
+    with pytest.raises(ValueError):
+        parse_formula("=SUM(1,", "S")
+
+
+def test_evaluates_formulas_without_cached_values(engine):
+    # openpyxl writes no cached results, so every formula is computed here
+    assert engine.value("P&L", "D2") == 60
+    assert engine.value("P&L", "E3") == pytest.approx(0.6)
+    assert engine.value("P&L", "D5") == 360
+    assert engine.value("Summary", "B1") == 720
+    assert engine.value("Summary", "B2") == 80
+
+
+def test_set_inputs_recomputes_dependents_only(engine):
+    changes = engine.set_inputs({("P&L", "B2"): 200.0})
+    assert changes[("P&L", "D2")] == (60, 160)
+    assert changes[("Summary", "B1")] == (720, 920)
+    assert ("P&L", "D3") not in changes
+
+
+def test_forks_leave_the_base_untouched(engine):
+    fork = engine.fork()
+    fork.set_inputs({("P&L", "C2"): 0.0})
+    assert fork.value("P&L", "D5") == 400
+    assert engine.value("P&L", "D5") == 360
+    assert engine.fork().value("P&L", "D5") == 360
+
+
+@pytest.mark.parametrize(("question", "expected"), [
+    ("What happens to profit if revenue grows 10%?", WhatIf("revenue", "percent", 10)),
+    ("if cost falls by 2,000", WhatIf("cost", "delta", -2000)),
+    ("what if the tax rate is 25%", WhatIf("tax rate", "set", 0.25)),
+    ("explain revenue", None),
+])
+def test_parse_what_if(question, expected):
+    assert parse_what_if(question) == expected
+
+
+def test_run_what_if_reports_totals(engine):
+    text = run_what_if(engine.fork(), parse_what_if("if revenue grows 10%"), "P&L")
+    assert "Scenario: Revenue" in text
+    assert "3 input cells" in text
+    # the SUM row is not added in again; margins and other sheets get no total
+    assert (
+        "Column totals (before → after):\n"
+        "- Revenue ('P&L'!B): 600.00 → 660.00 (+60.00)\n"
+        "- Profit ('P&L'!D): 360.00 → 420.00 (+60.00)\n"
+        "Recalculated cells"
+    ) in text
+    total = engine.fork()
+    total.set_inputs({("P&L", f"B{r}"): 110.0 * (r - 1) for r in range(2, 5)})
+    assert math.isclose(total.value("P&L", "D5"), 420)
+
+
+def test_run_what_if_totals_line_items_along_rows(xlsx):
+    rows = [
+        ["Line", "Jan-15", "Feb-15", "Mar-15", "Total"],
+        ["Revenue", 100, 200, 300, "=SUM(B2:D2)"],
+        ["COGS", 40, 80, 120, "=SUM(B3:D3)"],
+        ["Gross Profit", "=B2-B3", "=C2-C3", "=D2-D3", "=SUM(B4:D4)"],
+    ]
+    wb = LazyWorkbook.from_xlsx(xlsx({"P&L 1": rows}))
+    engine = RecalcEngine(FormulaIndex.from_workbook(wb), wb)
+    text = run_what_if(engine.fork(), parse_what_if("if revenue grows 10%"), "P&L 1")
+    assert (
+        "Row totals (before → after):\n"
+        "- Revenue ('P&L 1'!2): 600.00 → 660.00 (+60.00)\n"
+        "- Gross Profit ('P&L 1'!4): 360.00 → 420.00 (+60.00)\n"
+    ) in text
+    assert "Column totals" not in text
+    # a single cell says nothing about the layout – no totals
+    text = run_what_if(engine.fork(), parse_what_if("if cell B2 is 500"), "P&L 1")
+    assert "totals" not in text
@@ -0,0 +1,64 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from cache import BoundedCache  # noqa: E402
+from ingest import LazyWorkbook  # noqa: E402
+from store import DiskUploadStore  # noqa: E402
+
+HASH = "ab" * 32
+UPLOAD_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+def _store(root, ttl=None) -> DiskUploadStore:
+    return DiskUploadStore(str(root), BoundedCache(), BoundedCache(), ttl=ttl)
+
+
+def _frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Month": pd.to_datetime(["2024-01-01", None, "2024-03-01"]),
+        "Revenue": np.array([10.5, np.nan, 12.0], dtype="float32"),
+        "Units": np.array([1, 2, 3], dtype="int16"),
+        "Region": pd.Categorical(["North", None, "North"]),
+        "Note": ["ok", "#N/A", None],
+        "Mixed": [1, "#DIV/0!", 2.5],
+    })
+
+
+def test_disk_round_trip(tmp_path):
+    df = _frame()
+    types = {"columns": [], "errors": [], "header_row": 1}
+    wb = LazyWorkbook.from_frames({"P&L": df}, {"P&L": {"B2": "=1+1"}}, {"P&L": types})
+    _store(tmp_path).put_workbook(HASH, wb)
+
+    loaded = _store(tmp_path).get_workbook(HASH)
+    pd.testing.assert_frame_equal(loaded.sheet("P&L"), df)
+    assert loaded.formulas("P&L") == {"B2": "=1+1"}
+    assert loaded.type_report("P&L") == types
+
+
+def test_numeric_columns_map_the_stored_file(tmp_path):
+    wb = LazyWorkbook.from_frames({"P&L": _frame()}, types={"P&L": {}})
+    _store(tmp_path).put_workbook(HASH, wb)
+
+    df = _store(tmp_path).get_workbook(HASH).sheet("P&L")
+    # Read-only buffers – the values live in the memory-mapped Arrow file
+    for name in ("Month", "Revenue", "Units"):
+        assert not df[name].to_numpy().flags.writeable, name
+
+
+def test_sweep_runs_on_reads(tmp_path):
+    store = _store(tmp_path, ttl=60)
+    store.put_session(UPLOAD_ID, {"file_hash": HASH})
+    stale = os.path.join(str(tmp_path), "sessions", f"{UPLOAD_ID}.json")
+    old = time.time() - 120
+    os.utime(stale, (old, old))
+
+    store._last_sweep = 0.0
+    assert store.get_workbook(HASH) is None
+    assert not os.path.exists(stale)
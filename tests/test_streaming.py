@@ -0,0 +1,57 @@
+import pytest
+
+import streaming
+from ingest import LazyWorkbook, XlsxReader
+from profiling import process_dataframe
+
+
+@pytest.fixture
+def stream(tmp_path, monkeypatch):
+    """Streamed profile of an .xlsx sheet, read three rows at a time."""
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_ROWS", 3)
+
+    def profile(data: bytes, sheet: str) -> dict:
+        path = tmp_path / "upload.xlsx"
+        path.write_bytes(data)
+        with XlsxReader(str(path)) as reader:
+            return streaming.stream_sheet(reader, sheet)[2]["profile"]
+
+    return profile
+
+
+def test_mixed_type_chunks_match_the_in_memory_profile(xlsx, stream):
+    rows = [
+        ["Month", "Units", "Late", "Code"],
+        ["Jan-23", 1, None, "A1"], ["Feb-23", 2, None, "B2"], ["Mar-23", 3, None, "C3"],
+        ["Apr-23", "#N/A", 7, 4], ["May-23", None, 8, 5], ["Jun-23", "#N/A", 9, 6],
+        ["Jul-23", "1,200", 10, 7], ["Aug-23", 5, "#DIV/0!", 8], ["Sep-23", 6, 11, 9],
+    ]
+    data = xlsx({"S": rows})
+    wb = LazyWorkbook.from_xlsx(data)
+    expected = process_dataframe(wb.sheet("S"), wb.type_report("S"))
+    streamed = stream(data, "S")
+    for key in ("stats_text", "trend_text", "ratio_text", "prefix"):
+        assert streamed[key] == expected[key]
+    for key in ("error_count", "missing_count", "error_cells", "missing_cells"):
+        assert streamed["quality"][key] == expected["quality"][key]
+    assert "Code" not in streamed["stats_text"]
+
+
+def test_stray_text_chunk_keeps_its_numbers(xlsx, stream):
+    rows = [["Units"], [1], [2], [3], [4], ["n/a"], ["#REF!"]]
+    profile = stream(xlsx({"S": rows}), "S")
+    assert profile["stats_text"] == "Units: sum=10.00, mean=2.50"
+    assert profile["quality"]["error_cells"] == ["A7"]
+
+
+def test_memory_ceiling_counts_only_this_parse(xlsx, stream, monkeypatch):
+    rows = [["Month", "Units"]] + [[f"M{i}", i] for i in range(1, 10)]
+    data = xlsx({"S": rows})
+    ballast = b"x" * (64 * 2**20)  # memory held elsewhere in the process
+    monkeypatch.setattr(streaming, "STREAM_MEMORY_LIMIT_BYTES", 32 * 2**20)
+    assert stream(data, "S")["rows"] == 9
+    del ballast
+
+    monkeypatch.setattr(streaming, "STREAM_MEMORY_LIMIT_BYTES", 100)
+    with pytest.raises(streaming.MemoryLimitExceeded):
+        stream(data, "S")
@@ -0,0 +1,36 @@
+import io
+import logging
+
+import pytest
+
+from telemetry import finish_request, install_log_records, start_request
+
+
+@pytest.fixture
+def log():
+    """A fresh logger with its own handler and no filters, formatting request IDs."""
+    install_log_records()
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("[%(request_id)s] %(message)s"))
+    logger = logging.getLogger("tests.telemetry")
+    logger.addHandler(handler)
+    logger.propagate = False
+    yield logger, stream
+    logger.removeHandler(handler)
+
+
+def test_any_logger_formats_request_ids(log):
+    logger, stream = log
+    logger.warning("outside")
+    trace = start_request("abc-123")
+    logger.warning("inside")
+    finish_request(trace, "GET", "index", "/", 200, quiet=True)
+    assert stream.getvalue().splitlines() == ["[-] outside", "[abc-123] inside"]
+
+
+def test_installing_twice_wraps_the_factory_once():
+    install_log_records()
+    factory = logging.getLogRecordFactory()
+    install_log_records()
+    assert logging.getLogRecordFactory() is factory
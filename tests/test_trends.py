@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from trends import PanelBuilder, analyse, build_panel, ratio_lines, trend_lines
+
+
+@pytest.fixture
+def quarters():
+    return pd.DataFrame({
+        "Line": ["Revenue", "Gross profit"],
+        "Q1-23": [100.0, 40.0], "Q2-23": [110.0, 45.0], "Q3-23": [121.0, 50.0],
+        "Q4-23": [133.1, 55.0], "FY2023": [464.1, 190.0],
+    })
+
+
+@pytest.fixture
+def months():
+    return pd.DataFrame({
+        "Month": pd.date_range("2022-01-31", periods=24, freq="ME"),
+        "Revenue": [100.0 * 1.01**i for i in range(24)],
+        "Cost": [60.0] * 24,
+    })
+
+
+def test_line_items_across_quarter_columns(quarters):
+    report = analyse(quarters)
+    assert report["layout"] == "columns"
+    assert report["frequency"] == "Q"
+    assert report["periods"] == ["2023Q1", "2023Q4"]
+    revenue = report["series"]["Revenue"]
+    assert revenue["growth"] == pytest.approx(10.0)
+    assert revenue["latest_period"] == "2023Q4"
+    assert revenue["rolling"] == pytest.approx(116.025)
+
+
+def test_gross_margin(quarters):
+    margin = analyse(quarters)["margins"]["Gross margin"]
+    assert margin["denominator"] == "Revenue"
+    assert margin["overall"] == pytest.approx(190 / 464.1 * 100, abs=1e-4)
+    assert margin["first"] == pytest.approx(40.0)
+    (name, text), = ratio_lines(analyse(quarters))
+    assert name == "Gross profit"
+    assert text.startswith("Gross margin (Gross profit / Revenue): 40.94% overall")
+
+
+def test_monthly_rows_yoy_and_cagr(months):
+    report = analyse(months)
+    assert report["layout"] == "rows"
+    assert report["frequency"] == "M"
+    revenue = report["series"]["Revenue"]
+    assert revenue["yoy"] == pytest.approx((1.01**12 - 1) * 100, abs=1e-4)
+    assert revenue["cagr_years"] == [2022, 2023]
+    lines = dict(trend_lines(report))
+    assert lines["Revenue"].startswith("Revenue grew by an average of 1.0% MoM")
+    assert lines["Cost"].startswith("Cost was flat MoM on average")
+
+
+def test_chunked_panel_matches_in_memory(months):
+    builder = PanelBuilder()
+    for start in range(0, len(months), 7):
+        builder.add(months.iloc[start:start + 7])
+    panel, layout = build_panel(months)
+    assert builder.layout == layout
+    pd.testing.assert_frame_equal(builder.panel(), panel)
+
+
+def test_no_numeric_series():
+    assert analyse(pd.DataFrame({"Name": ["a", "b"]})) is None
@@ -0,0 +1,393 @@
+"""
+trends.py – growth and margin analysis for every series of a sheet at once.
+
+The sheet is first reshaped into a panel: one row per period (a complete
+monthly, quarterly or yearly range, gaps left as NaN) and one column per
+series. Series are the numeric columns when periods run down the rows (a
+date column or "Jan-23" labels), or the labelled rows when periods are the
+column headers ("FY2022", "Q1-23", …). Every metric – period-over-period
+growth, YoY, CAGR over complete years, rolling averages and the standard
+margins – is then a whole-panel pandas operation, not a loop per column.
+"""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from periods import (
+    PER_YEAR,
+    column_periods,
+    freq_of,
+    is_text,
+    parse_period,
+    row_periods,
+)
+
+ROLLING_WINDOW = {"M": 3, "Q": 4, "Y": 3}
+_STEP = {"M": "MoM", "Q": "QoQ", "Y": "YoY"}
+_WINDOW = {"M": "3-month", "Q": "4-quarter", "Y": "3-year"}
+
+# Levels and ratios are averaged (not summed) into periods and get no CAGR
+_LEVEL_RE = re.compile(
+    r"margin|ratio|rate|%|percent|growth|yield|price|balance|headcount", re.I
+)
+
+_REVENUE_RES = [
+    re.compile(r"^\s*(total\s+|net\s+)?(revenues?|sales|turnover)\s*$", re.I),
+    re.compile(r"revenue|sales|turnover", re.I),
+]
+# (label, numerator pattern) – the denominator is always revenue
+_MARGINS = [
+    ("Gross margin", re.compile(r"gross\s+profit", re.I)),
+    ("EBITDA margin", re.compile(r"\bebitda\b", re.I)),
+    ("Operating margin", re.compile(r"operating\s+(profit|income)|\bebit\b", re.I)),
+    ("Net margin", re.compile(r"net\s+(profit|income|earnings)", re.I)),
+]
+# Used only when none of the standard margins is found
+_PROFIT_RE = re.compile(r"profit|income", re.I)
+
+
+def _unique(names) -> list[str]:
+    """Series names, with repeats numbered so every panel column is distinct."""
+    seen: dict[str, int] = {}
+    out = []
+    for name in names:
+        name = str(name).strip() or "(blank)"
+        seen[name] = seen.get(name, 0) + 1
+        out.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return out
+
+
+def _row_frequency(periods: pd.PeriodIndex) -> str:
+    """
+    Frequency of dated rows: monthly dates spaced ~3 or ~12 months apart are
+    quarterly / yearly.
+    """
+    freq = freq_of(periods[:1])
+    ordinals = np.unique(periods.asi8)
+    if len(ordinals) < 2:
+        return freq
+    step = np.median(np.diff(ordinals))
+    if freq == "M" and step >= 12 or freq == "Q" and step >= 4:
+        return "Y"
+    if freq == "M" and step >= 3:
+        return "Q"
+    return freq
+
+
+class PanelBuilder:
+    """
+    Builds a sheet's panel from one frame or from successive row chunks of a
+    large sheet (see streaming.py). The layout is decided on the first chunk:
+    "columns" (periods as headers), "rows" (periods down the sheet) or
+    "flat" (no periods – per-chunk totals, used for margins only).
+    """
+
+    # Wide sheets: at most this many line items become series
+    MAX_SERIES = 2000
+
+    def __init__(self) -> None:
+        self.layout: str | None = None
+        self._period_column: int | None = None
+        self._parts: list = []
+        self._series = 0
+
+    def add(self, df: pd.DataFrame) -> None:
+        dtypes = df.dtypes.tolist()
+        numeric = [
+            j for j, dtype in enumerate(dtypes)
+            if pd.api.types.is_numeric_dtype(dtype)
+            and not pd.api.types.is_bool_dtype(dtype)
+        ]
+        label = next((j for j, dtype in enumerate(dtypes) if is_text(dtype)), None)
+        headers = column_periods(df, numeric)
+        if self.layout is None:
+            if len(headers) >= 2 and label is not None:
+                self.layout = "columns"
+            else:
+                self._period_column, periods = row_periods(df)
+                self.layout = "flat" if periods is None else "rows"
+        if self.layout == "columns":
+            self._add_line_items(df, headers, label)
+        else:
+            series = [j for j in numeric if j != self._period_column]
+            values = df.iloc[:, series].astype("float64")
+            values.columns = _unique(df.columns[series])
+            if self.layout == "flat":
+                self._parts.append(values.sum(min_count=1).to_frame().T)
+            else:
+                self._add_period_totals(df, values)
+
+    def _add_line_items(
+        self, df: pd.DataFrame, headers: dict, label: int | None
+    ) -> None:
+        if label is None or len(headers) < 2 or self._series >= self.MAX_SERIES:
+            return
+        cols = sorted(headers, key=lambda j: headers[j])
+        block = df.iloc[:, cols].astype("float64")
+        names = df.iloc[:, label]
+        keep = (names.notna() & block.notna().any(axis=1)).to_numpy()
+        keep = keep & (np.cumsum(keep) <= self.MAX_SERIES - self._series)
+        self._series += int(keep.sum())
+        self._parts.append(pd.DataFrame(
+            block.to_numpy()[keep].T,
+            index=pd.PeriodIndex([headers[j] for j in cols]),
+            columns=_unique(names[keep]),
+        ))
+
+    def _add_period_totals(self, df: pd.DataFrame, values: pd.DataFrame) -> None:
+        """Per-period sums and non-null counts, at the labels' own frequency."""
+        col = df.iloc[:, self._period_column]
+        if pd.api.types.is_datetime64_any_dtype(col.dtype):
+            periods = col.dt.to_period("M")
+        else:
+            periods = col.map({u: parse_period(u) for u in col.dropna().unique()})
+        keep = periods.map(lambda p: isinstance(p, pd.Period)).to_numpy(dtype=bool)
+        keys = periods[keep].to_numpy()
+        self._parts.append((
+            values[keep].groupby(keys, sort=False).sum(),
+            values[keep].notna().groupby(keys, sort=False).sum(),
+        ))
+
+    def panel(self) -> pd.DataFrame:
+        if not self._parts:
+            return pd.DataFrame()
+        if self.layout == "flat":
+            return pd.concat(self._parts, ignore_index=True)
+        if self.layout == "columns":
+            panel = pd.concat(self._parts, axis=1)
+            panel.columns = _unique(panel.columns)
+            panel = panel.groupby(level=0).sum(min_count=1)  # repeated headers
+        else:
+            panel = self._rows_panel()
+        if panel.empty:
+            return panel
+        index = panel.index
+        full = pd.period_range(index.min(), index.max(), freq=index.freq)
+        return panel.reindex(full)
+
+    def _rows_panel(self) -> pd.DataFrame:
+        """
+        Combine the per-chunk totals, regroup to the rows' frequency and
+        average the levels.
+        """
+        sums = pd.concat([s for s, _ in self._parts])
+        counts = pd.concat([c for _, c in self._parts])
+        sums = sums.groupby(level=0, sort=False).sum()
+        counts = counts.groupby(level=0, sort=False).sum()
+        finest = freq_of(sums.index)
+        keep = [p.freqstr[0] == finest for p in sums.index]
+        sums, counts = sums[keep], counts[keep]
+        if sums.empty:
+            return sums
+        index = pd.PeriodIndex(list(sums.index))
+        freq = _row_frequency(index)
+        keys = index.asfreq(freq, how="end") if freq != finest else index
+        sums, counts = sums.groupby(keys).sum(), counts.groupby(keys).sum()
+        panel = sums.where(counts > 0)
+        levels = [c for c in panel.columns if _LEVEL_RE.search(c)]
+        if levels:
+            panel[levels] = sums[levels] / counts[levels].where(counts[levels] > 0)
+        return panel
+
+
+def build_panel(df: pd.DataFrame) -> tuple[pd.DataFrame, str]:
+    """(panel, layout) for an in-memory sheet – see PanelBuilder."""
+    builder = PanelBuilder()
+    builder.add(df)
+    return builder.panel(), builder.layout
+
+
+def _latest(frame: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """(last non-NaN value, its period) per column."""
+    present = frame.notna()
+    periods = present.iloc[::-1].idxmax().where(present.any())
+    return frame.ffill().iloc[-1], periods
+
+
+def _growth(now: pd.DataFrame, before: pd.DataFrame) -> pd.DataFrame:
+    """
+    Percentage change, only where the base is positive (sign flips are not
+    growth).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (now / before - 1).where(before > 0) * 100
+
+
+def _margins(panel: pd.DataFrame) -> dict:
+    names = [c for c in panel.columns if not _LEVEL_RE.search(c)]
+    matches = (c for pattern in _REVENUE_RES for c in names if pattern.search(c))
+    revenue = next(matches, None)
+    if revenue is None:
+        return {}
+    found = []
+    for label, pattern in _MARGINS:
+        numerator = next((c for c in names if c != revenue and pattern.search(c)), None)
+        if numerator is not None:
+            found.append((label, numerator))
+    if not found:
+        profits = (c for c in names if c != revenue and _PROFIT_RE.search(c))
+        numerator = next(profits, None)
+        found = [("Profit margin", numerator)] if numerator else []
+    if not found:
+        return {}
+
+    numerators = panel[[n for _, n in found]]
+    base = panel[revenue]
+    valid = numerators.notna() & base.notna().to_numpy()[:, None]
+    totals = numerators.where(valid).sum()
+    bases = valid.mul(base.fillna(0), axis=0).sum()
+    overall = (totals / bases.where(bases > 0)) * 100
+    ratios = numerators.div(base.where(base > 0), axis=0) * 100
+    latest, latest_at = _latest(ratios)
+    first, first_at = _latest(ratios.iloc[::-1])
+    return {
+        label: {
+            "numerator": numerator,
+            "denominator": revenue,
+            "overall": _num(overall[numerator]),
+            "latest": _num(latest[numerator]),
+            "latest_period": _period(latest_at[numerator]),
+            "first": _num(first[numerator]),
+            "first_period": _period(first_at[numerator]),
+        }
+        for label, numerator in found
+    }
+
+
+def _num(value) -> float | None:
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, 6)
+
+
+def _period(value) -> str | None:
+    return str(value) if isinstance(value, pd.Period) else None
+
+
+def analyse(df: pd.DataFrame) -> dict | None:
+    """
+    Trend / ratio report for a sheet (JSON-safe; growth and margins in %):
+
+        {"layout": "columns", "frequency": "Q", "periods": ["2022Q1", "2023Q4"],
+         "series": {"Revenue": {"growth": 4.1, "latest": 3.0,
+                                "latest_period": "2023Q4", "yoy": 12.5,
+                                "yoy_period": "2023Q4", "cagr": 11.8,
+                                "cagr_years": [2022, 2023], "rolling": 1250.0}, …},
+         "margins": {"Gross margin": {"numerator": "Gross profit",
+                                      "denominator": "Revenue", "overall": 41.2,
+                                      "latest": 43.0, …}, …}}
+
+    None when the sheet has no numeric series.
+    """
+    return analyse_panel(*build_panel(df))
+
+
+def analyse_panel(panel: pd.DataFrame, layout: str) -> dict | None:
+    """`analyse` for a panel that was built elsewhere (e.g. chunk by chunk)."""
+    if panel.empty or panel.shape[1] == 0:
+        return None
+    report = {
+        "layout": layout, "frequency": None, "periods": None, "series": {},
+        "margins": _margins(panel),
+    }
+    if layout == "flat":
+        return report
+
+    freq = freq_of(panel.index[:1])
+    per_year, window = PER_YEAR[freq], ROLLING_WINDOW[freq]
+    step = _growth(panel, panel.shift(1))
+    yoy = _growth(panel, panel.shift(per_year))
+    rolling = panel.rolling(window, min_periods=window).mean()
+
+    # CAGR between the first and last complete years of flow series
+    flows = [c for c in panel.columns if not _LEVEL_RE.search(c)]
+    annual = panel[flows].groupby(panel.index.year).sum(min_count=1)
+    complete = panel[flows].notna().groupby(panel.index.year).sum() == per_year
+    annual = annual.where(complete)
+    has_year = annual.notna()
+    first_year = has_year.idxmax().where(has_year.any())
+    last_year = has_year.iloc[::-1].idxmax().where(has_year.any())
+    start, end = annual.bfill().iloc[0], annual.ffill().iloc[-1]
+    span = last_year - first_year
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (end / start) ** (1 / span.where(span > 0)) - 1
+        cagr = growth.where((start > 0) & (end > 0)) * 100
+
+    latest, latest_at = _latest(step)
+    latest_yoy, yoy_at = _latest(yoy)
+    latest_rolling, _ = _latest(rolling)
+    average = step.mean()
+    report.update(frequency=freq, periods=[str(panel.index[0]), str(panel.index[-1])])
+    for name in panel.columns:
+        if panel[name].count() < 2:
+            continue
+        entry = {
+            "growth": _num(average[name]),
+            "latest": _num(latest[name]),
+            "latest_period": _period(latest_at[name]),
+            "yoy": _num(latest_yoy[name]) if freq != "Y" else None,
+            "yoy_period": _period(yoy_at[name]) if freq != "Y" else None,
+            "cagr": _num(cagr[name]) if name in cagr.index else None,
+            "cagr_years": None,
+            "rolling": _num(latest_rolling[name]),
+        }
+        if entry["cagr"] is not None:
+            entry["cagr_years"] = [int(first_year[name]), int(last_year[name])]
+        report["series"][name] = entry
+    return report
+
+
+# ──────────────────────────────── Wording ────────────────────────────────── #
+
+
+def trend_lines(report: dict | None) -> list[tuple[str, str]]:
+    """
+    (series, sentence) pairs for the prompt, e.g. "Revenue grew by an average
+    of 4.1% QoQ, …".
+    """
+    if not report or not report["frequency"]:
+        return []
+    freq = report["frequency"]
+    lines = []
+    for name, s in report["series"].items():
+        if s["growth"] is None:
+            continue
+        if abs(s["growth"]) < 0.05:
+            parts = [f"{name} was flat {_STEP[freq]} on average"]
+        else:
+            direction = "grew" if s["growth"] > 0 else "declined"
+            average = f"{abs(s['growth']):.1f}% {_STEP[freq]}"
+            parts = [f"{name} {direction} by an average of {average}"]
+        if s["latest"] is not None:
+            latest = f"{s['latest']:+.1f}% ({s['latest_period']})"
+            parts.append(f"latest {_STEP[freq]} {latest}")
+        if s["yoy"] is not None:
+            parts.append(f"YoY {s['yoy']:+.1f}% ({s['yoy_period']})")
+        if s["cagr"] is not None:
+            first, last = s["cagr_years"]
+            parts.append(f"CAGR {s['cagr']:.1f}% ({first}–{last})")
+        if s["rolling"] is not None:
+            parts.append(f"{_WINDOW[freq]} average {s['rolling']:,.2f}")
+        lines.append((name, ", ".join(parts)))
+    return lines
+
+
+def ratio_lines(report: dict | None) -> list[tuple[str, str]]:
+    """
+    (numerator series, sentence) pairs, e.g. "Gross margin: 41.20% overall,
+    43.00% in 2023Q4 …".
+    """
+    lines = []
+    for label, m in (report or {}).get("margins", {}).items():
+        if m["overall"] is None:
+            continue
+        ratio = f"{m['numerator']} / {m['denominator']}"
+        text = f"{label} ({ratio}): {m['overall']:.2f}% overall"
+        if m["latest_period"] and m["latest"] is not None:
+            text += f", {m['latest']:.2f}% in {m['latest_period']}"
+            if m["first_period"] != m["latest_period"] and m["first"] is not None:
+                change = m["latest"] - m["first"]
+                text += f" ({change:+.1f} pp since {m['first_period']})"
+        lines.append((m["numerator"], text))
+    return lines